@@ -0,0 +1,379 @@
+import asyncio
+import datetime
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncRequestFactory, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .loyalty import REDEMPTION_POINTS
+from .models import Customer, Book, Order, Purchase
+from .seeding import Seeder
+
+# Dataset volumes per scale, passed to Seeder.run()
+SCALES = {
+    'small': {'books': 1000, 'customers': 2000, 'orders': 10000, 'purchases': 500},
+    'medium': {'books': 10000, 'customers': 20000, 'orders': 100000, 'purchases': 5000},
+    'large': {'books': 100000, 'customers': 200000, 'orders': 1000000, 'purchases': 20000},
+}
+
+# Allowed growth over the baseline before a measurement counts as a regression.
+# Query counts are compared by default; latency and memory depend on the
+# machine and database that recorded the baseline, so only on request.
+DEFAULT_THRESHOLDS = {
+    'latency': 0.5,      # fraction of the baseline p50/p95, on top of LATENCY_SLACK_MS
+    'memory': 0.5,       # fraction of the baseline peak, on top of MEMORY_SLACK_KB
+    'queries': 0,        # extra queries
+}
+LATENCY_SLACK_MS = 2.0
+MEMORY_SLACK_KB = 256
+
+# Benchmarks start cold and must not wipe the cache the site is using
+BENCHMARK_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bookstore-benchmark'},
+}
+
+XHR = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+XHR_HEADERS = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+class Fixture:
+    """
+    Ids and values the scenarios draw their requests from, sampled once from
+    the seeded data set.
+    """
+
+    def __init__(self, user, seed=0):
+        self.user = user
+        self.random = random.Random(seed)
+        customers = Customer.objects.filter(user=user)
+        self.phones = list(customers.values_list('phone', flat=True)[:1000])
+        # Checkouts that redeem points run two more queries, so they are measured separately
+        self.redeeming_phones = list(customers.filter(loyalty_points__gte=REDEMPTION_POINTS)
+                                     .values_list('phone', flat=True)[:1000]) or self.phones
+        self.paying_phones = list(customers.filter(loyalty_points__lt=REDEMPTION_POINTS)
+                                  .values_list('phone', flat=True)[:1000]) or self.phones
+        self.customer_ids = list(Customer.objects.filter(user=user).values_list('pk', flat=True)[:1000])
+        books = Book.objects.filter(user=user)
+        self.book_ids = list(books.values_list('pk', flat=True)[:1000])
+        # Stock for many repeated orders
+        self.stocked_ids = list(books.filter(quantity_in_stock__gte=50).values_list('pk', flat=True)[:1000])
+        self.words = sorted({word for title in books.values_list('title', flat=True)[:200]
+                             for word in title.lower().split() if word.isalpha() and len(word) > 3})
+        today = datetime.date.today()
+        self.latest_order = Order.objects.order_by('-order_date') \
+            .values_list('order_date', flat=True).first() or today
+        self.latest_purchase = Purchase.objects.order_by('-purchase_date') \
+            .values_list('purchase_date', flat=True).first() or today
+
+    def choice(self, values):
+        return self.random.choice(values)
+
+    def order_lines(self, count=3):
+        return {
+            key: value
+            for i, book_id in enumerate(self.random.sample(self.stocked_ids, min(count, len(self.stocked_ids))), 1)
+            for key, value in ((f'book-{i}', book_id), (f'amount-{i}', 1))
+        }
+
+
+def scenarios():
+    """
+    Return ``{name: request(client, fixture)}`` covering every route of
+    ``bookstore/urls.py``. Write scenarios are repeated against the same
+    data set, so they only take stock that is known to be there.
+    """
+    def get(name, *args, params=None, **extra):
+        return lambda client, fx: client.get(
+            reverse(f'bookstore:{name}', args=[arg(fx) if callable(arg) else arg for arg in args]),
+            params(fx) if params else None, **extra,
+        )
+
+    return {
+        'home': get('home'),
+        'signup': get('signup'),
+        'search_books': get('search_books', params=lambda fx: {'q': fx.choice(fx.words)[:4], 'token': 1}),
+        'search_books (typo)': get('search_books', params=lambda fx: {'q': fx.choice(fx.words)[:-1] + 'x'}),
+        'book_picker': get('book_picker', params=lambda fx: {'q': fx.choice(fx.words)[:3]}, **XHR),
+        'inventory': get('inventory'),
+        'inventory (xhr)': get('inventory', params=lambda fx: {'sort': '-price'}, **XHR),
+        'book_create': get('book_create'),
+        'catalogue_import': get('catalogue_import'),
+        'book_edit': get('book_edit', lambda fx: fx.choice(fx.book_ids)),
+        'book_delete': get('book_delete', lambda fx: fx.choice(fx.book_ids)),
+        'sales': get('sales'),
+        'sales (xhr)': get('sales', **XHR),
+        'sales (xhr, date)': get('sales', params=lambda fx: {'date': fx.latest_order.isoformat()}, **XHR),
+        'add_order': get('add_order'),
+        'customer': get('customer'),
+        'customer_create': get('customer_create'),
+        'customer_lookup': get('customer_lookup', params=lambda fx: {'phone': fx.choice(fx.phones)}),
+        'create_order': lambda client, fx: client.post(reverse('bookstore:create_order'), {
+            'customer-phone': fx.choice(fx.paying_phones), 'payment-method': 'cash', **fx.order_lines(),
+        }),
+        'create_order (redeem)': lambda client, fx: client.post(reverse('bookstore:create_order'), {
+            'customer-phone': fx.choice(fx.redeeming_phones), 'payment-method': 'cash', **fx.order_lines(),
+        }),
+        'sales_static_page': get('sales_static_page'),
+        'customer_edit': get('customer_edit', lambda fx: fx.choice(fx.customer_ids)),
+        'customer_delete': get('customer_delete', lambda fx: fx.choice(fx.customer_ids)),
+        'supplier': get('supplier'),
+        'supplier (xhr)': get('supplier', **XHR),
+        'supplier (xhr, date)': get('supplier', params=lambda fx: {'date': fx.latest_purchase.isoformat()}, **XHR),
+        'add_purchase': get('add_purchase'),
+        'create_purchase': lambda client, fx: client.post(reverse('bookstore:create_purchase'), {
+            key: value if key.startswith('book') else 10 for key, value in fx.order_lines().items()
+        }),
+        'supplier_static_page': get('supplier_static_page'),
+        'export_history (sales, 7 days)': get('export_history', 'sales', params=lambda fx: {
+            'start': (fx.latest_order - datetime.timedelta(days=6)).isoformat(), 'end': fx.latest_order.isoformat(),
+        }),
+    }
+
+
+def consume(response):
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def measure(client, request, fixture, repeat):
+    """
+    Time ``repeat`` requests after one warm-up request, then trace the
+    memory of one more. Returns the summary for one endpoint.
+    """
+    status = consume(request(client, fixture)).status_code
+    samples, queries = [], 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            consume(request(client, fixture))
+            samples.append((time.perf_counter() - start) * 1000)
+        queries = max(queries, len(context.captured_queries))
+
+    tracemalloc.start()
+    try:
+        consume(request(client, fixture))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(statistics.quantiles(samples, n=20)[18] if len(samples) > 1 else samples[0], 3),
+        'queries': queries,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_scale(user, volumes, repeat=20, seed=0, only=None, progress=None):
+    """
+    Seed ``volumes`` for ``user`` and measure every scenario (or those named
+    in ``only``). Call inside a transaction that is rolled back afterwards.
+    Requests run against an empty throwaway cache.
+    """
+    Seeder(user, datetime.date.today(), seed=seed).run(**volumes)
+    with override_settings(CACHES=BENCHMARK_CACHES):
+        cache.clear()
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        fixture = Fixture(user, seed)
+
+        results = {}
+        for name, request in scenarios().items():
+            if only and name not in only:
+                continue
+            results[name] = measure(client, request, fixture, repeat)
+            if progress:
+                progress(name, results[name])
+    return results
+
+
+def concurrent_scenarios():
+    """
+    Return ``{name: request(fixture)}`` for the short read-only JSON
+    endpoints served by async views; ``request`` gives ``(path, params,
+    headers)``.
+    """
+    return {
+        'search_books': lambda fx: (reverse('bookstore:search_books'), {'q': fx.choice(fx.words)[:4]}, {}),
+        'customer_lookup': lambda fx: (reverse('bookstore:customer_lookup'), {'phone': fx.choice(fx.phones)}, {}),
+        'sales (xhr)': lambda fx: (reverse('bookstore:sales'), {'limit': 20}, XHR_HEADERS),
+        'supplier (xhr)': lambda fx: (reverse('bookstore:supplier'), {'limit': 20}, XHR_HEADERS),
+    }
+
+
+def summarize(mode, samples, statuses, elapsed):
+    return {
+        'mode': mode,
+        'requests': len(samples),
+        'errors': sum(status >= 400 for status in statuses),
+        'seconds': round(elapsed, 3),
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(statistics.quantiles(samples, n=20)[18] if len(samples) > 1 else samples[0], 3),
+    }
+
+
+def run_wsgi(requests, cookies, threads):
+    """
+    Serve ``requests`` through the WSGI handler from a pool of ``threads``,
+    like a threaded sync worker process.
+    """
+    application = WSGIHandler()
+    factory = RequestFactory()
+    factory.cookies = cookies
+    environs = [factory.get(path, params, headers=headers).environ for path, params, headers in requests]
+
+    def call(environ):
+        started, status = time.perf_counter(), []
+        body = application(environ, lambda line, headers, exc_info=None: status.append(int(line[:3])))
+        try:
+            for _ in body:
+                pass
+        finally:
+            body.close()
+        return status[0], (time.perf_counter() - started) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(call, environs))
+    elapsed = time.perf_counter() - start
+    return summarize('wsgi', [ms for _, ms in results], [status for status, _ in results], elapsed)
+
+
+def run_asgi(requests, cookies, concurrency):
+    """
+    Serve ``requests`` through the ASGI handler on one event loop with up
+    to ``concurrency`` of them in flight, like a single uvicorn worker.
+    """
+    application = ASGIHandler()
+    factory = AsyncRequestFactory()
+    factory.cookies = cookies
+    scopes = [factory.get(path, params, headers=headers).scope for path, params, headers in requests]
+
+    async def call(scope, slots):
+        async with slots:
+            started, status, body = time.perf_counter(), [], [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if body:
+                    return body.pop()
+                # Never disconnect; the handler cancels this once it has responded
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            await application(scope, receive, send)
+            return status[0], (time.perf_counter() - started) * 1000
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(call(scope, slots) for scope in scopes))
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    return summarize('asgi', [ms for _, ms in results], [status for status, _ in results], elapsed)
+
+
+def run_concurrency(user, count=400, concurrency=32, threads=4, db_latency_ms=0, seed=0, only=None):
+    """
+    Fire ``count`` requests at the async JSON endpoints (or those named in
+    ``only``) of ``user``'s committed data, first through WSGI with
+    ``threads`` threads and then through ASGI with ``concurrency`` requests
+    in flight, and return both summaries.
+
+    ``db_latency_ms`` adds a sleep to every query to stand in for the
+    round trip to a database server; that wait is what async views overlap.
+    Both servers open their own database connections, so the data must be
+    committed.
+    """
+    client = Client()
+    client.force_login(user)
+    fixture = Fixture(user, seed)
+    chosen = [request for name, request in concurrent_scenarios().items() if not only or name in only]
+    requests = [chosen[i % len(chosen)](fixture) for i in range(count)]
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(db_latency_ms / 1000)
+        return execute(sql, params, many, context)
+
+    def add_delay(sender, connection, **kwargs):
+        # Underneath any wrapper a request installs, which pops its own on the way out
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, delay)
+
+    if db_latency_ms:
+        connection_created.connect(add_delay)
+    try:
+        results = []
+        with override_settings(CACHES=BENCHMARK_CACHES):
+            for run in (lambda: run_wsgi(requests, client.cookies, threads),
+                        lambda: run_asgi(requests, client.cookies, concurrency)):
+                cache.clear()
+                results.append(run())
+        return results
+    finally:
+        connection_created.disconnect(add_delay)
+
+
+def compare(results, baseline, thresholds=None, resources=False):
+    """
+    Return a list of human-readable regressions of ``results`` against
+    ``baseline`` (both ``{scale: {endpoint: summary}}``). Endpoints missing
+    from the baseline are not compared. Only status and query counts are
+    checked unless ``resources`` also asks for latency and peak memory,
+    which are only comparable on the machine that recorded the baseline.
+    """
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    regressions = []
+    for scale, endpoints in results.items():
+        for name, current in endpoints.items():
+            previous = baseline.get(scale, {}).get(name)
+            if not previous:
+                continue
+            limits = {'queries': previous['queries'] + thresholds['queries']}
+            if resources:
+                limits.update({
+                    'p50_ms': previous['p50_ms'] * (1 + thresholds['latency']) + LATENCY_SLACK_MS,
+                    'p95_ms': previous['p95_ms'] * (1 + thresholds['latency']) + LATENCY_SLACK_MS,
+                    'peak_kb': previous['peak_kb'] * (1 + thresholds['memory']) + MEMORY_SLACK_KB,
+                })
+            for metric, limit in limits.items():
+                if current[metric] > limit:
+                    regressions.append(
+                        f'{scale} / {name}: {metric} {current[metric]} exceeds {round(limit, 3)} '
+                        f'(baseline {previous[metric]})'
+                    )
+            if current['status'] != previous['status']:
+                regressions.append(f"{scale} / {name}: status {current['status']} (baseline {previous['status']})")
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,86 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+
+CACHE_TIMEOUT = getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300)
+
+
+def stats():
+    """
+    Return ``{kind: {'hits': n, 'misses': n}}`` for this process, as
+    exported at ``/metrics/``.
+    """
+    counters = {'hits': metrics.CATALOGUE_CACHE_HITS, 'misses': metrics.CATALOGUE_CACHE_MISSES}
+    totals = {}
+    for outcome, counter in counters.items():
+        with counter.lock:
+            series = dict(counter.series)
+        for kind, value in series.items():
+            totals.setdefault(kind, {'hits': 0, 'misses': 0})[outcome] = value
+    return totals
+
+
+def _version_key(model):
+    return f'catalogue:version:{model._meta.model_name}'
+
+
+def invalidate(model):
+    """
+    Make every cached entry built from ``model`` stale. Entries are never
+    deleted one by one: bumping the model's version changes all their keys,
+    which also works across processes sharing a file or database cache.
+    """
+    key = _version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_on_commit(model):
+    transaction.on_commit(lambda: invalidate(model))
+
+
+def get_or_build(kind, models, build, *key_parts):
+    """
+    Return the cached value for ``kind`` and ``key_parts``, calling
+    ``build()`` on a miss. ``models`` are the models the value is read
+    from; writing to any of them invalidates it.
+    """
+    versions = cache.get_many([_version_key(model) for model in models])
+    key = ':'.join([
+        'catalogue', kind,
+        *(str(versions.get(_version_key(model), 0)) for model in models),
+        hashlib.md5(repr(key_parts).encode()).hexdigest(),
+    ])
+    value = cache.get(key)
+    if value is not None:
+        metrics.CATALOGUE_CACHE_HITS.inc(kind)
+        return value
+    metrics.CATALOGUE_CACHE_MISSES.inc(kind)
+    value = build()
+    cache.set(key, value, CACHE_TIMEOUT)
+    return value
+
+
+def names(model):
+    """
+    Return ``{id: name}`` for every Author, Publisher or Category.
+    """
+    return get_or_build(
+        f'{model._meta.model_name}-names', [model],
+        lambda: dict(model.objects.values_list('id', 'name')),
+    )
+
+
+def choices(model):
+    """
+    Return ``(id, name)`` choices for a select of every Author, Publisher
+    or Category, ordered by name.
+    """
+    return sorted(names(model).items(), key=lambda choice: (choice[1], choice[0]))
+
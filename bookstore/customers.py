@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Customer
+from .phones import normalize_phone
+
+LOOKUP_FIELDS = ('id', 'name', 'loyalty_points', 'normalized_phone')
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded mapping whose entries also expire ``ttl``
+    seconds after they were stored.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        with self.lock:
+            for key in [key for key, (_, value) in self.entries.items() if predicate(key, value)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Per process: other workers may serve a changed customer for up to the TTL
+_cache = LRUCache(
+    maxsize=getattr(settings, 'CUSTOMER_LOOKUP_CACHE_SIZE', 4096),
+    ttl=getattr(settings, 'CUSTOMER_LOOKUP_CACHE_TIMEOUT', 30),
+)
+_MISSING = object()
+
+
+def find_customer(user, phone):
+    """
+    Return ``user``'s Customer with ``phone`` (in any common format), or
+    None. Always reads the database; use it where the row is about to be
+    written, e.g. at checkout.
+    """
+    phone = normalize_phone(phone)
+    if not phone:
+        return None
+    return Customer.objects.filter(user=user, normalized_phone=phone).order_by('pk').first()
+
+
+async def lookup_customer(user, phone):
+    """
+    Return ``{'id', 'name', 'loyalty_points', 'normalized_phone'}`` for
+    ``user``'s customer with ``phone``, or None. Answers repeat lookups from
+    an in-memory LRU cache without leaving the event loop; saving or
+    deleting a customer evicts it.
+    """
+    phone = normalize_phone(phone)
+    if not phone:
+        return None
+    key = (user.pk, phone)
+    customer = _cache.get(key, _MISSING)
+    if customer is _MISSING:
+        customer = await Customer.objects.filter(user=user, normalized_phone=phone) \
+            .order_by('pk').values(*LOOKUP_FIELDS).afirst()
+        _cache.set(key, customer)
+    return customer
+
+
+def invalidate(customer):
+    """
+    Evict ``customer`` from the lookup cache, under its current phone and
+    any phone it was cached under before an edit.
+    """
+    _cache.delete((customer.user_id, customer.normalized_phone))
+    _cache.delete_where(lambda key, value: value is not None and value['id'] == customer.pk)
+
+
+def invalidate_all():
+    _cache.clear()
@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import OrderItem, PurchaseItem
+
+FORMATS = ('csv', 'columnar')
+
+# (column header, lookup) per export; one row per order or purchase line
+EXPORTS = {
+    'sales': {
+        'model': OrderItem,
+        'date_field': 'order__order_date',
+        'columns': (
+            ('order_id', 'order_id'),
+            ('order_date', 'order__order_date'),
+            ('customer_id', 'order__customer_id'),
+            ('customer_name', 'order__customer__name'),
+            ('payment_method', 'order__payment_method'),
+            ('order_total', 'order__total_amount'),
+            ('book_id', 'book_id'),
+            ('book_title', 'book__title'),
+            ('amount', 'amount'),
+            ('unit_price', 'unit_price'),
+            ('line_total', 'line_total'),
+        ),
+    },
+    'purchases': {
+        'model': PurchaseItem,
+        'date_field': 'purchase__purchase_date',
+        'columns': (
+            ('purchase_id', 'purchase_id'),
+            ('purchase_date', 'purchase__purchase_date'),
+            ('purchase_total', 'purchase__total_cost'),
+            ('book_id', 'book_id'),
+            ('book_title', 'book__title'),
+            ('publisher_name', 'book__publisher__name'),
+            ('amount', 'amount'),
+            ('unit_price', 'unit_price'),
+        ),
+    },
+}
+
+
+def export_rows(kind, start=None, end=None, chunk_size=2000):
+    """
+    Return ``(headers, rows)`` for the ``sales`` or ``purchases`` export
+    between ``start`` and ``end`` inclusive. ``rows`` is an iterator of plain
+    tuples read ``chunk_size`` at a time, from a server-side cursor on
+    PostgreSQL, so no model instances are built and memory stays flat.
+    """
+    export = EXPORTS[kind]
+    date_field = export['date_field']
+    queryset = export['model'].objects.all()
+    if start:
+        queryset = queryset.filter(**{f'{date_field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{date_field}__lte': end})
+    queryset = queryset.order_by(date_field, 'pk') \
+        .values_list(*(lookup for _, lookup in export['columns']))
+    return [header for header, _ in export['columns']], queryset.iterator(chunk_size=chunk_size)
+
+
+def chunked(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_chunks(headers, rows, chunk_size=2000):
+    """
+    Yield the export as CSV text, one string per ``chunk_size`` rows.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for chunk in chunked(rows, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def columnar_chunks(headers, rows, chunk_size=2000):
+    """
+    Yield the export as JSON Lines record batches: a ``{"columns": [...]}``
+    header, then one ``{"rows": n, "data": [[...], ...]}`` line per
+    ``chunk_size`` rows holding one array per column, in header order.
+    """
+    yield json.dumps({'columns': headers}) + '\n'
+    for chunk in chunked(rows, chunk_size):
+        yield json.dumps({'rows': len(chunk), 'data': [list(column) for column in zip(*chunk)]},
+                         cls=DjangoJSONEncoder) + '\n'
+
+
+def render_export(kind, fmt, start=None, end=None, chunk_size=2000):
+    headers, rows = export_rows(kind, start, end, chunk_size)
+    if fmt == 'columnar':
+        return columnar_chunks(headers, rows, chunk_size)
+    return csv_chunks(headers, rows, chunk_size)
@@ -1,5 +1,8 @@
 from django import forms
-from .models import Book, Author, Publisher, Category, Order, OrderItem, \
+from . import catalogue
+from .importer import FORMATS
+from .phones import normalize_phone
+from .models import Customer, Book, Author, Publisher, Category, Order, OrderItem, \
     Purchase
 
 
@@ -45,6 +48,12 @@ class BookForm(forms.ModelForm):
             'publication_year', 'publication_month'
         ]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Render the selects from the catalogue cache instead of querying each reference table
+        for name, model in (('author', Author), ('publisher', Publisher), ('category', Category)):
+            self.fields[name].choices = [('', self.fields[name].empty_label), *catalogue.choices(model)]
+
 class OrderForm(forms.ModelForm):
     class Meta:
         model = Order
@@ -58,4 +67,48 @@ class OrderItemForm(forms.ModelForm):
 class PurchaseForm(forms.ModelForm):
     class Meta:
         model = Purchase
-        fields = ['total_cost']
\ No newline at end of file
+        fields = ['total_cost']
+
+
+class CustomerForm(forms.ModelForm):
+    # The balance the clerk was shown, so an edit changes it by the difference
+    # rather than overwriting points added or spent in the meantime
+    shown_points = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    class Meta:
+        model = Customer
+        fields = ['name', 'phone', 'loyalty_points']
+
+    def __init__(self, *args, user, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instance.user = user
+        self.fields['shown_points'].initial = self.instance.loyalty_points
+
+    def points_change(self):
+        """
+        Return the change the clerk made to the loyalty balance.
+        """
+        shown = self.cleaned_data.get('shown_points')
+        if shown is None:
+            shown = self.initial['loyalty_points']
+        return self.cleaned_data['loyalty_points'] - shown
+
+    def clean_phone(self):
+        phone = self.cleaned_data['phone']
+        normalized = normalize_phone(phone)
+        if not normalized:
+            raise forms.ValidationError('Enter a valid phone number.')
+        # The same number typed differently is still the same customer
+        others = Customer.objects.filter(user=self.instance.user, normalized_phone=normalized) \
+            .exclude(pk=self.instance.pk)
+        if others.exists():
+            raise forms.ValidationError('Another customer already has this phone number.')
+        return phone
+
+
+class CatalogueImportForm(forms.Form):
+    file = forms.FileField(label='Catalogue File (CSV or JSON Lines)')
+    format = forms.ChoiceField(
+        choices=[('', 'Detect from file name'), *((fmt, fmt.upper()) for fmt in FORMATS)],
+        required=False,
+    )
@@ -0,0 +1,206 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from . import catalogue, search
+from .models import Author, Publisher, Category, Book
+
+FORMATS = ('csv', 'jsonl')
+
+# Book columns an import row may carry, besides the author, publisher and category names
+BOOK_FIELDS = ('title', 'description', 'publication_year', 'publication_month', 'price')
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def iter_records(stream, fmt):
+    """
+    Yield one dict per record of a CSV (with a header row) or JSON Lines
+    text stream, reading it line by line. A JSON line that does not parse
+    yields an ``ImportRowError``, which ``clean_record`` raises so it is
+    reported like any other bad row.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield ImportRowError(f'invalid JSON: {e.msg}')
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def clean_record(record):
+    """
+    Validate an import record and convert it to Book field values plus the
+    author, publisher and category names. ``quantity_in_stock`` is only
+    included when the record has a value for it.
+    """
+    if isinstance(record, ImportRowError):
+        raise record
+    if not isinstance(record, dict):
+        raise ImportRowError('expected a JSON object')
+
+    def text(name, required=True):
+        value = str(record.get(name) or '').strip()
+        if required and not value:
+            raise ImportRowError(f'{name} is required')
+        return value
+
+    try:
+        row = {
+            'title': text('title')[:255],
+            'description': text('description', required=False),
+            'author': text('author')[:255],
+            'publisher': text('publisher')[:255],
+            'category': text('category')[:255],
+            'publication_year': int(record.get('publication_year') or 0),
+            'publication_month': int(record.get('publication_month') or 0),
+            'price': Decimal(str(record.get('price'))).quantize(Decimal('0.01')),
+        }
+        if record.get('quantity_in_stock') not in (None, ''):
+            row['quantity_in_stock'] = max(0, int(record['quantity_in_stock']))
+        return row
+    except (TypeError, ValueError, InvalidOperation) as e:
+        raise ImportRowError(str(e) or 'invalid value') from e
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'errors': self.errors,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class CatalogueImporter:
+    """
+    Bulk-load books for ``user`` from parsed import records.
+
+    Author, publisher and category names are resolved against in-memory
+    ``{name: id}`` dictionaries loaded once; names missing from them are
+    inserted with one ``bulk_create`` per batch. Names are not unique, so
+    a name always resolves to its oldest row, the one every other import
+    and the book form pick too. Books are matched on
+    ``(title, author)`` within the user's catalogue, then inserted with
+    ``bulk_create`` or updated with ``bulk_update``, ``batch_size`` records
+    at a time, each batch in its own transaction. A feed's stock level only
+    seeds new books: existing books keep their live stock, which changes
+    through sales and purchases (see ``stock``), so a sale made while an
+    import runs is never overwritten.
+    """
+    max_errors = 100
+
+    def __init__(self, user, batch_size=1000, progress=None):
+        self.user = user
+        self.batch_size = batch_size
+        self.progress = progress
+        self.ids = {
+            model: dict(model.objects.order_by('-pk').values_list('name', 'pk'))
+            for model in (Author, Publisher, Category)
+        }
+
+    def run(self, records):
+        report = ImportReport()
+        batch = []
+        for line, record in enumerate(records, 1):
+            report.rows += 1
+            try:
+                batch.append(clean_record(record))
+            except ImportRowError as e:
+                if len(report.errors) < self.max_errors:
+                    report.errors.append({'row': line, 'error': str(e)})
+            if len(batch) >= self.batch_size:
+                self.load_batch(batch, report)
+                batch = []
+        self.load_batch(batch, report)
+
+        # Bulk writes bypass the model signals that normally keep these current
+        search.invalidate(self.user.pk)
+        for model in (Author, Publisher, Category, Book):
+            catalogue.invalidate(model)
+        return report
+
+    def resolve_names(self, model, names):
+        ids = self.ids[model]
+        missing = {name for name in names if name not in ids}
+        if missing:
+            extra = {'contact_email': '', 'phone': '', 'address': ''} if model is Publisher else {}
+            model.objects.bulk_create([model(name=name, **extra) for name in missing])
+            # Re-read rather than trust the new ids: a concurrent import may have added the same name first
+            ids.update(model.objects.filter(name__in=missing).order_by('-pk').values_list('name', 'pk'))
+
+    def load_batch(self, batch, report):
+        if not batch:
+            return
+        with transaction.atomic():
+            self.resolve_names(Author, {row['author'] for row in batch})
+            self.resolve_names(Publisher, {row['publisher'] for row in batch})
+            self.resolve_names(Category, {row['category'] for row in batch})
+
+            books = {}
+            for row in batch:
+                author_id = self.ids[Author][row['author']]
+                book = Book(
+                    user=self.user,
+                    author_id=author_id,
+                    publisher_id=self.ids[Publisher][row['publisher']],
+                    category_id=self.ids[Category][row['category']],
+                    search_text=' '.join([
+                        row['title'], row['author'], row['publisher'], row['category'], row['description'],
+                    ]).lower(),
+                    quantity_in_stock=row.get('quantity_in_stock', 0),
+                    **{field: row[field] for field in BOOK_FIELDS},
+                )
+                # A later row for the same book wins
+                books[(row['title'], author_id)] = book
+
+            existing = Book.objects.filter(user=self.user, title__in={title for title, _ in books}) \
+                .values_list('title', 'author_id', 'pk')
+            to_update = []
+            for title, author_id, pk in existing:
+                book = books.pop((title, author_id), None)
+                if book is not None:
+                    book.pk = pk
+                    to_update.append(book)
+
+            Book.objects.bulk_create(books.values())
+            Book.objects.bulk_update(
+                to_update, ['publisher', 'category', 'search_text', *BOOK_FIELDS], batch_size=self.batch_size,
+            )
+
+        report.created += len(books)
+        report.updated += len(to_update)
+        if self.progress:
+            self.progress(report)
@@ -0,0 +1,171 @@
+import http.client
+import multiprocessing
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.test import Client
+
+from .benchmarks import Fixture, concurrent_scenarios
+
+
+def session_cookie(user):
+    """
+    Log ``user`` in and return the ``Cookie`` header of the new session,
+    which is stored in the database every server process reads.
+    """
+    client = Client()
+    client.force_login(user)
+    return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+
+def request_mix(user, count=1000, seed=0):
+    """
+    Return ``count`` ``(path, headers)`` requests cycling through the JSON
+    endpoints, drawn from ``user``'s data.
+    """
+    fixture = Fixture(user, seed)
+    scenarios = list(concurrent_scenarios().values())
+    requests = []
+    for i in range(count):
+        path, params, headers = scenarios[i % len(scenarios)](fixture)
+        requests.append((f'{path}?{urlencode(params)}' if params else path, headers))
+    return requests
+
+
+def hammer(base_url, requests, cookie, threads, duration):
+    """
+    Replay ``requests`` against ``base_url`` from ``threads`` keep-alive
+    connections for ``duration`` seconds. Returns ``(latencies_ms,
+    errors)``.
+    """
+    url = urlsplit(base_url)
+    deadline = time.monotonic() + duration
+    latencies, errors = [], []
+
+    def worker(offset):
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        done, failed = [], 0
+        i = offset
+        while time.monotonic() < deadline:
+            path, headers = requests[i % len(requests)]
+            i += threads
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={'Cookie': cookie, **headers})
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                continue
+            if response.status >= 400:
+                failed += 1
+            else:
+                done.append((time.perf_counter() - started) * 1000)
+        connection.close()
+        latencies.extend(done)
+        errors.append(failed)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latencies, sum(errors)
+
+
+def _hammer(args):
+    return hammer(*args)
+
+
+def load(base_url, requests, cookie, concurrency=64, duration=20, processes=1):
+    """
+    Drive ``base_url`` with ``concurrency`` connections spread over
+    ``processes`` client processes, so the client is not what limits the
+    rate. Returns ``{'rps', 'requests', 'errors', 'p50_ms', 'p95_ms'}``.
+    """
+    threads = max(1, concurrency // processes)
+    started = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        results = pool.map(_hammer, [(base_url, requests, cookie, threads, duration)] * processes)
+    elapsed = time.perf_counter() - started
+    latencies = [ms for samples, _ in results for ms in samples]
+    return {
+        'rps': round(len(latencies) / elapsed, 1),
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+        'p95_ms': round(statistics.quantiles(latencies, n=20)[18], 2) if len(latencies) > 1 else None,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """
+    Run ``command`` (formatted with ``workers`` and ``port``) as a
+    subprocess for the duration of a ``with`` block, once it answers HTTP.
+    """
+
+    def __init__(self, command, workers, startup_timeout=60):
+        self.port = free_port()
+        self.command = command.format(workers=workers, port=self.port)
+        self.startup_timeout = startup_timeout
+        self.url = f'http://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(self.command, shell=True, stdout=subprocess.DEVNULL, stderr=self.log,
+                                        start_new_session=True)
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Server exited with {self.process.returncode}:\n{self.output()}')
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+                connection.request('GET', '/')
+                connection.getresponse().read()
+                connection.close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f'Server did not answer within {self.startup_timeout}s:\n{self.output()}')
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+    def output(self, lines=20):
+        self.log.seek(0)
+        return b'\n'.join(self.log.read().splitlines()[-lines:]).decode(errors='replace')
+
+
+def scaling_shortfalls(results, min_efficiency):
+    """
+    Return the worker counts whose throughput fell short of
+    ``min_efficiency`` times linear scaling from the smallest count in
+    ``results`` (``{workers: summary}``).
+    """
+    base = min(results)
+    expected = {workers: results[base]['rps'] * workers / base * min_efficiency for workers in results}
+    return [
+        f"{workers} workers: {results[workers]['rps']} req/s, expected at least {round(expected[workers], 1)}"
+        for workers in sorted(results)
+        if results[workers]['rps'] < expected[workers]
+    ]
@@ -0,0 +1,181 @@
+import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import customers
+from .models import Customer, LoyaltyEntry, Order
+
+REDEMPTION_POINTS = 100
+REDEMPTION_DISCOUNT = Decimal('0.10')
+# One point per this much spent, plus 10% of those points per year of membership
+SPEND_PER_POINT = 50
+TENURE_BONUS = Decimal('0.10')
+
+
+def years_joined(customer, today):
+    """
+    Return the number of full years since the customer joined.
+    """
+    years = today.year - customer.join_date.year
+    # They haven't had their anniversary yet this year
+    if (today.month, today.day) < (customer.join_date.month, customer.join_date.day):
+        years -= 1
+    return years
+
+
+def next_anniversary(join_date, today):
+    """
+    Return the first anniversary of ``join_date`` after ``today``; members
+    who joined on 29 February have theirs on 1 March in other years.
+    """
+    for year in (today.year, today.year + 1):
+        try:
+            anniversary = join_date.replace(year=year)
+        except ValueError:
+            anniversary = datetime.date(year, 3, 1)
+        if anniversary > today:
+            return anniversary
+
+
+def tenure(customer, today):
+    """
+    Return ``(years, changes)`` for ``customer`` on ``today``. ``changes``
+    holds the ``tenure_years``/``tenure_until`` values to store when the
+    cached tier has expired (an anniversary has passed), else it is empty.
+    """
+    if customer.tenure_until is not None and today < customer.tenure_until:
+        return customer.tenure_years, {}
+    years = years_joined(customer, today)
+    return years, {'tenure_years': years, 'tenure_until': next_anniversary(customer.join_date, today)}
+
+
+def points_earned(total, years):
+    points = total // SPEND_PER_POINT
+    return int(points) + round(points * (TENURE_BONUS * years))
+
+
+def settle_points(customer, total):
+    """
+    Redeem loyalty points against an order of ``total`` and return
+    ``(amount_due, entries)``, ``entries`` being ``[(kind, points)]`` for
+    ``record_entries`` once the order exists. Must run inside the order's
+    transaction. Points earned by the order are added later by
+    ``accrue_points``, off the checkout path.
+
+    Customers holding ``REDEMPTION_POINTS`` get ``REDEMPTION_DISCOUNT`` off
+    and spend the points. The balance drops through one UPDATE that
+    subtracts in SQL, never writing back a value read earlier, and only
+    while the row still holds enough points, so two tills checking out the
+    same customer cannot spend the points twice.
+    """
+    if customer.loyalty_points < REDEMPTION_POINTS:
+        return total, []
+    redeemed = Customer.objects.filter(pk=customer.pk, loyalty_points__gte=REDEMPTION_POINTS).update(
+        loyalty_points=F('loyalty_points') - REDEMPTION_POINTS,
+    )
+    if not redeemed:
+        # Another till spent the points first; charge the full price
+        return total, []
+    _changed(customer, -REDEMPTION_POINTS)
+    return total - total * REDEMPTION_DISCOUNT, [(LoyaltyEntry.REDEMPTION, -REDEMPTION_POINTS)]
+
+
+def accrue_points(order_id):
+    """
+    Add the points earned by an order to its customer's balance and ledger.
+    Queued by checkout as a background task; an order that already has an
+    accrual entry is skipped, so running it twice is harmless.
+    """
+    order = Order.objects.select_related('customer').get(pk=order_id)
+    if order.loyaltyentry_set.filter(kind=LoyaltyEntry.ACCRUAL).exists():
+        return
+    customer = order.customer
+    years, changes = tenure(customer, order.order_date)
+    earned = points_earned(order.total_amount, years)
+    if not earned and not changes:
+        return
+    Customer.objects.filter(pk=customer.pk).update(loyalty_points=F('loyalty_points') + earned, **changes)
+    record_entries(customer, order, [(LoyaltyEntry.ACCRUAL, earned)])
+    _changed(customer, earned, changes)
+
+
+def _changed(customer, points, changes=None):
+    # Mirror the update on the instance; the stored balance may include concurrent changes
+    customer.loyalty_points += points
+    for field, value in (changes or {}).items():
+        setattr(customer, field, value)
+    # update() skips the post_save signal that normally evicts cached lookups
+    transaction.on_commit(lambda: customers.invalidate(customer))
+
+
+def record_entries(customer, order, entries):
+    LoyaltyEntry.objects.bulk_create([
+        LoyaltyEntry(customer=customer, order=order, kind=kind, points=points)
+        for kind, points in entries
+        if points
+    ])
+
+
+def record_adjustment(customer, points, kind=LoyaltyEntry.ADJUSTMENT):
+    """
+    Record a manual change of ``points`` to a balance that has already been
+    saved, e.g. from the customer form.
+    """
+    if points:
+        LoyaltyEntry.objects.create(customer=customer, kind=kind, points=points)
+
+
+def adjust_points(customer, points):
+    """
+    Apply a manual change of ``points`` to the stored balance with one
+    UPDATE that adds in SQL, so changes made since the clerk loaded the
+    balance (e.g. an accrual task) are kept, and record it in the ledger.
+    Returns False, changing nothing, if it would take the balance below 0.
+    """
+    if not points:
+        return True
+    adjusted = Customer.objects.filter(pk=customer.pk, loyalty_points__gte=-points).update(
+        loyalty_points=F('loyalty_points') + points,
+    )
+    if not adjusted:
+        return False
+    record_adjustment(customer, points)
+    _changed(customer, points)
+    return True
+
+
+def ledger_balances(queryset):
+    """
+    Annotate ``queryset`` of customers with ``ledger_balance``, the sum of
+    their loyalty entries.
+    """
+    total = LoyaltyEntry.objects.filter(customer=OuterRef('pk')).order_by() \
+        .values('customer').annotate(total=Sum('points')).values('total')
+    return queryset.annotate(ledger_balance=Coalesce(Subquery(total), Value(0)))
+
+
+def recompute(queryset=None, fix=False, batch_size=1000):
+    """
+    Compare each customer's stored balance with their ledger and return the
+    ``[(customer_id, stored, ledger)]`` that differ. With ``fix`` the
+    balances are reset to the ledger totals, and every tenure tier is
+    cleared so the next checkout recomputes it.
+    """
+    queryset = Customer.objects.all() if queryset is None else queryset
+    mismatches = ledger_balances(queryset).exclude(loyalty_points=F('ledger_balance')) \
+        .order_by('pk').values_list('pk', 'loyalty_points', 'ledger_balance')
+    mismatches = list(mismatches.iterator(chunk_size=batch_size))
+    if fix:
+        with transaction.atomic():
+            for offset in range(0, len(mismatches), batch_size):
+                batch = mismatches[offset:offset + batch_size]
+                Customer.objects.bulk_update(
+                    [Customer(pk=pk, loyalty_points=max(ledger, 0)) for pk, _, ledger in batch],
+                    ['loyalty_points'],
+                )
+            queryset.update(tenure_until=None)
+        customers.invalidate_all()
+    return mismatches
@@ -0,0 +1,49 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from bookstore.benchmarks import SCALES, concurrent_scenarios, run_concurrency
+from bookstore.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = ('Seed a data set into a throwaway test database and compare the throughput of the async JSON '
+            'endpoints served by one process over WSGI (a pool of threads) and over ASGI (one event loop).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', choices=concurrent_scenarios(),
+                            help='Only request these endpoints; repeatable.')
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight under ASGI.')
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads under WSGI.')
+        parser.add_argument('--db-latency-ms', type=float, default=0,
+                            help='Sleep added to every query, standing in for the network round trip.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Both servers open connections of their own, so the data is committed to a test database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        setup_test_environment()
+        try:
+            user = User.objects.create(username='benchmark')
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Scale {options['scale']}: {SCALES[options['scale']]}"))
+            Seeder(user, datetime.date.today(), seed=options['seed']).run(**SCALES[options['scale']])
+            results = run_concurrency(
+                user, count=options['requests'], concurrency=options['concurrency'], threads=options['threads'],
+                db_latency_ms=options['db_latency_ms'], seed=options['seed'], only=options['endpoints'],
+            )
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"{'mode':<8}{'requests':>10}{'errors':>8}{'seconds':>10}{'req/s':>10}"
+                          f"{'p50':>12}{'p95':>12}")
+        for summary in results:
+            self.stdout.write(
+                f"{summary['mode']:<8}{summary['requests']:>10}{summary['errors']:>8}{summary['seconds']:>10.2f}"
+                f"{summary['rps']:>10.1f}{summary['p50_ms']:>9.2f} ms{summary['p95_ms']:>9.2f} ms"
+            )
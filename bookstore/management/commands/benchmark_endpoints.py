@@ -0,0 +1,81 @@
+import time
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from bookstore.benchmarks import SCALES, DEFAULT_THRESHOLDS, compare, load_baseline, run_scale, save_baseline
+
+BASELINE = Path(__file__).resolve().parents[2] / 'benchmark_baseline.json'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Seed data sets at several scales inside a transaction, drive every bookstore route through the '
+            'test client, record p50/p95 latency, query count and peak memory per endpoint, compare them with '
+            'the committed baseline and roll everything back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', action='append', choices=SCALES, dest='scales',
+                            help='Scale to run; repeatable. Defaults to small and medium.')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help='Only run these endpoints.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Write the results to the baseline file instead of comparing.')
+        parser.add_argument('--check-resources', action='store_true',
+                            help='Also fail on latency and peak memory growth. Only meaningful on the machine '
+                                 'and database that recorded the baseline.')
+        parser.add_argument('--latency-tolerance', type=float, default=DEFAULT_THRESHOLDS['latency'])
+        parser.add_argument('--memory-tolerance', type=float, default=DEFAULT_THRESHOLDS['memory'])
+        parser.add_argument('--query-tolerance', type=int, default=DEFAULT_THRESHOLDS['queries'])
+
+    def handle(self, *args, **options):
+        scales = options['scales'] or ['small', 'medium']
+        results = {}
+        setup_test_environment()
+        try:
+            for scale in scales:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'Scale {scale}: {SCALES[scale]}'))
+                started = time.monotonic()
+                try:
+                    with transaction.atomic():
+                        user = User.objects.create(username=f'benchmark-{time.time_ns()}')
+                        results[scale] = run_scale(user, SCALES[scale], repeat=options['repeat'],
+                                                   seed=options['seed'], only=options['endpoints'],
+                                                   progress=self.report)
+                        raise Rollback
+                except Rollback:
+                    pass
+                self.stdout.write(f'Scale {scale} finished in {time.monotonic() - started:.1f}s.')
+        finally:
+            teardown_test_environment()
+
+        if options['update_baseline']:
+            baseline = load_baseline(options['baseline'])
+            for scale, endpoints in results.items():
+                baseline.setdefault(scale, {}).update(endpoints)
+            save_baseline(options['baseline'], baseline)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}."))
+            return
+
+        regressions = compare(results, load_baseline(options['baseline']), {
+            'latency': options['latency_tolerance'],
+            'memory': options['memory_tolerance'],
+            'queries': options['query_tolerance'],
+        }, resources=options['check_resources'])
+        if regressions:
+            raise CommandError('Performance regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def report(self, name, summary):
+        self.stdout.write(
+            f"{name:<34}{summary['status']:>5}{summary['p50_ms']:>10.2f} ms{summary['p95_ms']:>10.2f} ms"
+            f"{summary['queries']:>6} q{summary['peak_kb']:>10.1f} KB"
+        )
@@ -0,0 +1,149 @@
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from bookstore import search
+from bookstore.models import Customer, Author, Publisher, Category, Book, Order, Purchase
+
+# Created by migrations 0006 (title, for the book picker) and 0007 (search_text, for search_books)
+TRIGRAM_INDEXES = ['bookstore_book_title_trgm', 'bookstore_book_search_text_trgm']
+DAYS = 730
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Seed large tables inside a transaction, time the hot lookups of each endpoint with and '
+            'without the lookup indexes, then roll everything back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100000)
+        parser.add_argument('--customers', type=int, default=50000)
+        parser.add_argument('--orders', type=int, default=200000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.repeat = options['repeat']
+        # SQLite can only alter tables in a transaction with foreign key checks off
+        try:
+            with connection.constraint_checks_disabled(), transaction.atomic():
+                self.seed(options)
+                self.analyze()
+                indexed = self.time_lookups()
+                self.drop_indexes()
+                self.analyze()
+                unindexed = self.time_lookups()
+                raise Rollback
+        except Rollback:
+            pass
+        search.invalidate(self.user.pk)
+
+        self.stdout.write(f"{'endpoint':<32}{'no index (ms)':>16}{'indexed (ms)':>16}{'speed-up':>12}")
+        for name, after in indexed.items():
+            before = unindexed[name]
+            self.stdout.write(f'{name:<32}{before:>16.3f}{after:>16.3f}{before / after:>11.1f}x')
+
+    def seed(self, options):
+        self.user = User.objects.create(username=f'benchmark-{time.time_ns()}')
+        authors = Author.objects.bulk_create(Author(name=f'Author {i}') for i in range(1000))
+        publishers = Publisher.objects.bulk_create(
+            Publisher(name=f'Publisher {i}', contact_email='', phone='', address='') for i in range(200)
+        )
+        categories = Category.objects.bulk_create(Category(name=f'Category {i}') for i in range(50))
+        books = [
+            Book(user=self.user, title=f'Title {i} {self.random.randrange(10 ** 6)}', description='',
+                 author=self.random.choice(authors), publisher=self.random.choice(publishers),
+                 category=self.random.choice(categories), publication_year=2000, publication_month=1,
+                 price=Decimal('10.00'), quantity_in_stock=10)
+            for i in range(options['books'])
+        ]
+        # bulk_create skips save(), which normally fills in search_text
+        for book in books:
+            book.search_text = book.get_search_text()
+        Book.objects.bulk_create(books, batch_size=5000)
+        customers = Customer.objects.bulk_create((
+            Customer(user=self.user, name=f'Customer {i}', phone=f'+66{i:09d}', normalized_phone=f'+66{i:09d}')
+            for i in range(options['customers'])
+        ), batch_size=5000)
+        orders = Order.objects.bulk_create((
+            Order(customer=self.random.choice(customers), total_amount=0, payment_method='cash')
+            for _ in range(options['orders'])
+        ), batch_size=5000)
+        purchases = Purchase.objects.bulk_create(
+            (Purchase(total_cost=0) for _ in range(options['orders'] // 10)), batch_size=5000,
+        )
+
+        # auto_now_add stamps every row with today; spread them over two years instead
+        today = datetime.date.today()
+        for model, field, rows in ((Order, 'order_date', orders), (Purchase, 'purchase_date', purchases)):
+            per_day = max(1, len(rows) // DAYS)
+            for day, offset in enumerate(range(0, len(rows), per_day)):
+                chunk = rows[offset:offset + per_day]
+                model.objects.filter(pk__range=(chunk[0].pk, chunk[-1].pk)) \
+                    .update(**{field: today - datetime.timedelta(days=day % DAYS)})
+        self.customers = options['customers']
+
+    def lookups(self):
+        phone = f'+66{self.random.randrange(self.customers):09d}'
+        day = datetime.date.today() - datetime.timedelta(days=self.random.randrange(DAYS))
+        word = str(self.random.randrange(10 ** 6))
+        return {
+            'lookup_customer': lambda: Customer.objects.filter(user=self.user, normalized_phone=phone)
+                .values('id', 'name', 'loyalty_points').first(),
+            'create_order (customer)': lambda: Customer.objects.filter(user=self.user, normalized_phone=phone).first(),
+            'sales (date filter)': lambda: list(Order.objects.filter(order_date=day)),
+            'supplier (date filter)': lambda: list(Purchase.objects.filter(purchase_date=day)),
+            'search_books': lambda: async_to_sync(search.search_books)(self.user, word),
+            'book_picker (title)': lambda: list(Book.objects.filter(user=self.user, title__icontains=word)
+                                                .order_by('title', 'pk')[:21]),
+            'inventory (by title)': lambda: list(Book.objects.filter(user=self.user).order_by('title')[:50]),
+            'book_create (author)': lambda: Author.objects.filter(name=f'Author {self.random.randrange(1000)}').first(),
+            'book_create (publisher)': lambda: Publisher.objects.filter(name='Publisher 7').first(),
+            'book_create (category)': lambda: Category.objects.filter(name='Category 7').first(),
+        }
+
+    def time_lookups(self):
+        timings = {}
+        for _ in range(self.repeat):
+            for name, lookup in self.lookups().items():
+                start = time.perf_counter()
+                lookup()
+                timings.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+        return {name: statistics.median(samples) for name, samples in timings.items()}
+
+    def drop_indexes(self):
+        """
+        Drop every index from the lookup index plan, inside the surrounding
+        transaction so the rollback restores them.
+        """
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for model in (Customer, Author, Publisher, Category, Book, Order, Purchase):
+                for index in model._meta.indexes:
+                    schema_editor.remove_index(model, index)
+                for constraint in model._meta.constraints:
+                    schema_editor.remove_constraint(model, constraint)
+                for field in model._meta.local_fields:
+                    if field.db_index and not field.is_relation and not field.primary_key:
+                        unindexed = field.clone()
+                        unindexed.db_index = False
+                        unindexed.set_attributes_from_name(field.name)
+                        unindexed.model = model
+                        schema_editor.alter_field(model, field, unindexed)
+            if connection.vendor == 'postgresql':
+                for name in TRIGRAM_INDEXES:
+                    schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
@@ -0,0 +1,52 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from bookstore.exports import EXPORTS, FORMATS, columnar_chunks, csv_chunks, export_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream sales or purchase lines for a date range to a CSV or columnar JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=EXPORTS)
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--start', help='First date to include (YYYY-MM-DD).')
+        parser.add_argument('--end', help='Last date to include (YYYY-MM-DD).')
+        parser.add_argument('--output', help='File to write; defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('start', 'end'):
+            value = options[name]
+            try:
+                dates[name] = parse_date(value) if value else None
+            except ValueError:
+                dates[name] = None
+            if value and dates[name] is None:
+                raise CommandError(f'Invalid --{name} date: {value}')
+
+        headers, rows = export_rows(options['kind'], chunk_size=options['chunk_size'], **dates)
+        counted = self.count(rows)
+        render = columnar_chunks if options['format'] == 'columnar' else csv_chunks
+
+        started = time.monotonic()
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for chunk in render(headers, counted, options['chunk_size']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        elapsed = time.monotonic() - started
+        self.stderr.write(f'Exported {self.rows} {options["kind"]} rows in {elapsed:.1f}s '
+                          f'({self.rows / elapsed if elapsed else 0:.0f} rows/s).')
+
+    def count(self, rows):
+        self.rows = 0
+        for row in rows:
+            self.rows += 1
+            yield row
@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from bookstore.importer import FORMATS, CatalogueImporter, guess_format, iter_records
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or JSON Lines catalogue feed into the inventory of a user.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import.')
+        parser.add_argument('--user', required=True, help='Username that will own the imported books.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Unknown user: {options['user']}")
+
+        fmt = options['format'] or guess_format(options['path'])
+        importer = CatalogueImporter(user, batch_size=options['batch_size'], progress=self.report_progress)
+        with open(options['path'], newline='', encoding='utf-8') as stream:
+            report = importer.run(iter_records(stream, fmt))
+
+        for error in report.errors:
+            self.stderr.write(f"Row {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {report.rows} rows ({report.created} created, {report.updated} updated, '
+            f'{len(report.errors)} rejected) in {report.elapsed:.1f}s, {report.rows_per_second:.0f} rows/s.'
+        ))
+
+    def report_progress(self, report):
+        self.stdout.write(f'{report.rows} rows, {report.rows_per_second:.0f} rows/s')
@@ -0,0 +1,74 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from bookstore import loadtest
+
+SERVER_COMMAND = 'gunicorn -c config/gunicorn.conf.py --workers {workers} --bind 127.0.0.1:{port}'
+
+
+class Command(BaseCommand):
+    help = ("Load-test the JSON endpoints over HTTP as USER. With --workers, start the production server once per "
+            "worker count, report requests per second for each and fail unless throughput grows with the "
+            "workers; otherwise drive the server already running at --url. Seed data first with "
+            "seed_bookstore.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Username whose data and session the requests use.')
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--workers', type=int, nargs='+',
+                            help='Worker counts to start the server with, e.g. --workers 1 2 4.')
+        parser.add_argument('--server-command', default=SERVER_COMMAND,
+                            help='Server command line; {workers} and {port} are filled in.')
+        parser.add_argument('--concurrency', type=int, default=64, help='Open connections.')
+        parser.add_argument('--duration', type=float, default=20, help='Seconds per run.')
+        parser.add_argument('--warmup', type=float, default=3, help='Seconds of unmeasured load per server.')
+        parser.add_argument('--client-processes', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+        parser.add_argument('--min-efficiency', type=float, default=0.6,
+                            help='Required fraction of linear scaling from the smallest worker count.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']}")
+        requests = loadtest.request_mix(user, seed=options['seed'])
+        cookie = loadtest.session_cookie(user)
+
+        def run(url):
+            if options['warmup']:
+                loadtest.load(url, requests, cookie, options['concurrency'], options['warmup'],
+                              options['client_processes'])
+            summary = loadtest.load(url, requests, cookie, options['concurrency'], options['duration'],
+                                    options['client_processes'])
+            self.stdout.write(
+                f"{summary['rps']:>10.1f} req/s{summary['requests']:>10} ok{summary['errors']:>8} errors"
+                f"{summary['p50_ms'] or 0:>10.2f} ms p50{summary['p95_ms'] or 0:>10.2f} ms p95"
+            )
+            return summary
+
+        if not options['workers']:
+            self.stdout.write(f"{options['url']}:")
+            run(options['url'])
+            return
+
+        if max(options['workers']) + options['client_processes'] > (os.cpu_count() or 1):
+            self.stderr.write(self.style.WARNING(
+                f'Only {os.cpu_count()} CPUs for {max(options["workers"])} workers and '
+                f'{options["client_processes"]} client processes; throughput cannot scale past the cores.'
+            ))
+        results = {}
+        for workers in options['workers']:
+            self.stdout.write(f'{workers} worker(s):')
+            try:
+                with loadtest.Server(options['server_command'], workers) as server:
+                    results[workers] = run(server.url)
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+        shortfalls = loadtest.scaling_shortfalls(results, options['min_efficiency'])
+        if shortfalls:
+            raise CommandError('Throughput does not scale with workers:\n  ' + '\n  '.join(shortfalls))
+        self.stdout.write(self.style.SUCCESS('Throughput scales with workers.'))
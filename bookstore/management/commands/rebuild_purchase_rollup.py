@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from bookstore.rollups import rebuild_purchase_rollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly purchase rollup used by the supplier statistic page from purchase history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild months from the one containing this date (YYYY-MM-DD).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if not since:
+                raise CommandError(f"Invalid date: {options['since']}")
+
+        written = rebuild_purchase_rollup(since=since, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} monthly purchase rows.'))
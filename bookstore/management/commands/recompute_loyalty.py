@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from bookstore import loyalty
+from bookstore.models import Customer
+
+
+class Command(BaseCommand):
+    help = ("Audit customers' loyalty balances against the loyalty ledger; with --fix, reset them to the "
+            "ledger totals and clear the cached tenure tiers.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only audit the customers of this username.')
+        parser.add_argument('--fix', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queryset = Customer.objects.all()
+        if options['user']:
+            queryset = queryset.filter(user__username=options['user'])
+
+        mismatches = loyalty.recompute(queryset, fix=options['fix'], batch_size=options['batch_size'])
+        for pk, stored, ledger in mismatches[:50]:
+            self.stdout.write(f'Customer {pk}: balance {stored}, ledger {ledger}')
+        if len(mismatches) > 50:
+            self.stdout.write(f'... and {len(mismatches) - 50} more')
+
+        verb = 'Fixed' if options['fix'] else 'Found'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(mismatches)} mismatched balance(s).'))
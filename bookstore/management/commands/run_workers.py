@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from bookstore import tasks
+from bookstore.models import Task
+
+
+class Command(BaseCommand):
+    help = ("Run background tasks queued by checkout (loyalty accrual, sales rollup, low-stock checks) in a "
+            "pool of worker processes until interrupted. With --once, run every due task in this process "
+            "and exit.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--batch-size', type=int, default=20, help='Tasks claimed at a time.')
+        parser.add_argument('--lease', type=int, default=300,
+                            help='Seconds after which a running task is assumed lost and run again.')
+        parser.add_argument('--once', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            tasks.drain(options['batch_size'], options['lease'])
+            failed = Task.objects.filter(status=Task.FAILED).count()
+            pending = Task.objects.filter(status=Task.PENDING).count()
+            self.stdout.write(self.style.SUCCESS(
+                f'Queue drained; {pending} task(s) waiting to retry, {failed} failed.'
+            ))
+            return
+
+        self.stdout.write(f"Starting {options['processes']} worker(s); Ctrl-C to stop.")
+        tasks.serve(options['processes'], poll_interval=options['poll_interval'], limit=options['batch_size'],
+                    lease=options['lease'])
+        self.stdout.write('Workers stopped.')
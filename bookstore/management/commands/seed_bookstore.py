@@ -0,0 +1,71 @@
+import datetime
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from bookstore.rollups import rebuild_purchase_rollup, rebuild_sales_rollup
+from bookstore.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a deterministic, production-shaped data set: Zipf-distributed '
+            'bestsellers, repeat customers and seasonal order dates.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='seed', help='Username owning the data; created if missing.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--end', help='Last order date (YYYY-MM-DD); defaults to today.')
+        parser.add_argument('--days', type=int, default=730, help='Length of the order history.')
+        parser.add_argument('--authors', type=int, default=500)
+        parser.add_argument('--publishers', type=int, default=50)
+        parser.add_argument('--categories', type=int, default=16)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--customers', type=int, default=20000)
+        parser.add_argument('--orders', type=int, default=100000,
+                            help='About 1.9 order items are generated per order.')
+        parser.add_argument('--max-items', type=int, default=5, choices=range(1, 6),
+                            help='Largest basket size.')
+        parser.add_argument('--purchases', type=int, default=5000)
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of book sales.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--rollups', action='store_true',
+                            help='Rebuild the sales and purchase rollups afterwards.')
+
+    def handle(self, *args, **options):
+        end = timezone.localdate()
+        if options['end']:
+            end = parse_date(options['end'])
+            if not end:
+                raise CommandError(f"Invalid date: {options['end']}")
+        if min(options['authors'], options['publishers'], options['categories'], options['books'],
+               options['customers']) < 1:
+            raise CommandError('Authors, publishers, categories, books and customers must be at least 1.')
+
+        user, _ = get_user_model().objects.get_or_create(username=options['user'])
+        self.started = self.last_report = time.monotonic()
+        seeder = Seeder(user, end, seed=options['seed'], days=options['days'], batch_size=options['batch_size'],
+                        skew=options['skew'], progress=self.report_progress)
+        counts = seeder.run(
+            authors=options['authors'], publishers=options['publishers'], categories=options['categories'],
+            books=options['books'], customers=options['customers'], orders=options['orders'],
+            max_items=options['max_items'], purchases=options['purchases'],
+        )
+
+        if options['rollups']:
+            since = end - datetime.timedelta(days=options['days'])
+            rebuild_sales_rollup(since=since)
+            rebuild_purchase_rollup(since=since)
+
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Seeded {summary} in {time.monotonic() - self.started:.1f}s.'))
+
+    def report_progress(self, stage, counts):
+        now = time.monotonic()
+        if stage == 'orders' and now - self.last_report < 5:
+            return
+        self.last_report = now
+        self.stdout.write(f"[{now - self.started:7.1f}s] {stage}: {counts['orders']} orders, "
+                          f"{counts['order_items']} order items, {counts['purchases']} purchases")
@@ -0,0 +1,37 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from bookstore import reorder
+from bookstore.models import PurchaseDraftItem
+
+
+class Command(BaseCommand):
+    help = ("Update each book's sales velocity and reorder point with the days sold since the last run; "
+            "with --suggest, replace the purchase drafts with one per publisher for the books at or below "
+            "their reorder point. Meant to run daily, e.g. from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--through', type=datetime.date.fromisoformat,
+                            help='Last day to count (YYYY-MM-DD); defaults to the last complete day.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every book from the sales rollup instead of only new days.')
+        parser.add_argument('--suggest', action='store_true')
+        parser.add_argument('--user', help='Only suggest purchases for this username.')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']}")
+
+        updated = reorder.update_reorder_points(options['through'], rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'Updated the reorder points of {updated} book(s).'))
+
+        if options['suggest']:
+            drafts = reorder.suggest_purchases(user)
+            lines = PurchaseDraftItem.objects.filter(draft__in=drafts).count()
+            self.stdout.write(self.style.SUCCESS(f'Suggested {len(drafts)} purchase(s) with {lines} line(s).'))
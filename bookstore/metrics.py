@@ -0,0 +1,100 @@
+import threading
+
+# Upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """
+    Cumulative Prometheus-style histogram with one series per label value.
+    Observing is a bucket search and a few integer increments under a lock.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, label='view'):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            series = {key: {**value, 'buckets': list(value['buckets'])} for key, value in self.series.items()}
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{escape(label_value)}"'
+            total = 0
+            for bound, count in zip(self.buckets, values['buckets']):
+                total += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {total}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values["count"]}')
+            lines.append(f'{self.name}_sum{{{label}}} {values["sum"]}')
+            lines.append(f'{self.name}_count{{{label}}} {values["count"]}')
+        return lines
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label='view'):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, label_value, amount=1):
+        with self.lock:
+            self.series[label_value] = self.series.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            series = dict(self.series)
+        for label_value, value in sorted(series.items()):
+            lines.append(f'{self.name}{{{self.label}="{escape(label_value)}"}} {value}')
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Metrics of this process since it started; scrape each worker, or aggregate in Prometheus
+REQUEST_DURATION = Histogram('bookstore_request_duration_seconds', 'Wall time per request by view.',
+                             DURATION_BUCKETS)
+DB_DURATION = Histogram('bookstore_request_db_duration_seconds', 'Time spent in SQL per request by view.',
+                        DURATION_BUCKETS)
+QUERY_COUNT = Histogram('bookstore_request_queries', 'SQL queries per request by view.', QUERY_BUCKETS)
+DUPLICATE_QUERIES = Counter('bookstore_duplicate_queries_total',
+                            'Queries repeating a fingerprint already run in the same request, by view.')
+SLOW_QUERIES = Counter('bookstore_slow_queries_total', 'Queries over SLOW_QUERY_THRESHOLD_MS, by view.')
+CATALOGUE_CACHE_HITS = Counter('bookstore_catalogue_cache_hits_total',
+                               'Catalogue lookups answered from the cache, by kind of data.', label='kind')
+CATALOGUE_CACHE_MISSES = Counter('bookstore_catalogue_cache_misses_total',
+                                 'Catalogue lookups built from the database, by kind of data.', label='kind')
+
+REGISTRY = (REQUEST_DURATION, DB_DURATION, QUERY_COUNT, DUPLICATE_QUERIES, SLOW_QUERIES,
+            CATALOGUE_CACHE_HITS, CATALOGUE_CACHE_MISSES)
+
+
+def render():
+    """
+    Return every metric in the Prometheus text exposition format.
+    """
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
@@ -0,0 +1,147 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger('bookstore.sql')
+
+NUMBER_RE = re.compile(r'\b\d+(\.\d+)?\b')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+IN_LIST_RE = re.compile(r'\bIN \((?:%s|\?)(?:, ?(?:%s|\?))*\)', re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """
+    Reduce ``sql`` to its shape: literals become ``?`` and ``IN`` lists of
+    any length look the same, so an N+1 loop maps to one fingerprint.
+    """
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """
+    ``connection.execute_wrapper`` callable that times every query of one
+    request and counts their fingerprints.
+    """
+
+    def __init__(self, slow_threshold, request=None):
+        self.slow_threshold = slow_threshold
+        self.request = request
+        self.count = 0
+        self.duration = 0.0
+        self.slow = 0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            self.fingerprints[sql] += 1
+            if elapsed >= self.slow_threshold:
+                self.slow += 1
+                logger.warning('Slow query in %s (%.1f ms): %s', self.view, elapsed * 1000, sql[:2000])
+
+    @property
+    def view(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else 'unresolved'
+
+    @property
+    def duplicates(self):
+        """
+        ``{fingerprint: executions}`` for shapes run more than once.
+        """
+        # Fingerprinting is deferred to here, once per distinct statement
+        shapes = Counter()
+        for sql, count in self.fingerprints.items():
+            shapes[fingerprint(sql)] += count
+        return {shape: count for shape, count in shapes.items() if count > 1}
+
+
+class InstrumentationMiddleware:
+    """
+    Record wall time, SQL time, query count and repeated queries of every
+    request per view into ``bookstore.metrics``, and log single queries
+    slower than ``SLOW_QUERY_THRESHOLD_MS``. Turned off with
+    ``INSTRUMENTATION_ENABLED = False``.
+
+    Queries run while a streaming response is consumed happen after the
+    view returns and are not counted.
+
+    Under ASGI each request runs its queries on a thread of its own, so
+    the recorder is installed on that thread's connections.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTATION_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200) / 1000
+        self.duplicate_threshold = getattr(settings, 'DUPLICATE_QUERY_THRESHOLD', 10)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder(self.slow_threshold, request)
+        start = time.perf_counter()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        self.observe(recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder(self.slow_threshold, request)
+        start = time.perf_counter()
+        stack = await sync_to_async(self.recording)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.observe(recorder, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def recording(recorder):
+        """
+        Install ``recorder`` on every connection of the current thread;
+        closing the returned stack removes it again.
+        """
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def observe(self, recorder, elapsed):
+        view = recorder.view
+        metrics.REQUEST_DURATION.observe(view, elapsed)
+        metrics.DB_DURATION.observe(view, recorder.duration)
+        metrics.QUERY_COUNT.observe(view, recorder.count)
+        if recorder.slow:
+            metrics.SLOW_QUERIES.inc(view, recorder.slow)
+        if recorder.count > 1:
+            duplicates = recorder.duplicates
+            repeated = sum(duplicates.values()) - len(duplicates)
+            if repeated:
+                metrics.DUPLICATE_QUERIES.inc(view, repeated)
+            if repeated >= self.duplicate_threshold:
+                shape, count = max(duplicates.items(), key=lambda item: item[1])
+                logger.warning('%s ran %d repeated queries; most repeated (%dx): %s',
+                               view, repeated, count, shape[:2000])
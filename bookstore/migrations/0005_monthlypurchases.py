@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0004_dailysales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyPurchases',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('spend', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookstore.book')),
+                ('publisher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookstore.publisher')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month', 'publisher'], name='bookstore_m_month_1256fa_idx')],
+                'constraints': [models.UniqueConstraint(fields=('month', 'book'), name='unique_monthly_purchases_per_book')],
+            },
+        ),
+    ]
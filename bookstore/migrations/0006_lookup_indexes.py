@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+# title__icontains compiles to UPPER("title"::text) LIKE UPPER('%q%') on
+# PostgreSQL; a trigram GIN index on the same expression lets it skip the
+# sequential scan. Other databases have no equivalent and keep the plain
+# (user, title) index.
+TRIGRAM_INDEX = 'bookstore_book_title_trgm'
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON bookstore_book '
+        f'USING gin ((UPPER(title::text)) gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX}')
+
+
+def merge_duplicate_customers(apps, schema_editor):
+    # Customers entered twice with the same phone in one store become one, the
+    # oldest, holding the orders and points of all of them, so the unique
+    # constraint below can be added to a database that already has duplicates
+    Customer = apps.get_model('bookstore', 'Customer')
+    Order = apps.get_model('bookstore', 'Order')
+    duplicates = Customer.objects.values('user_id', 'phone').annotate(copies=Count('pk'), keep=Min('pk')) \
+        .filter(copies__gt=1).order_by()
+    for group in duplicates.iterator():
+        others = Customer.objects.filter(user_id=group['user_id'], phone=group['phone']).exclude(pk=group['keep'])
+        points = sum(others.values_list('loyalty_points', flat=True))
+        Order.objects.filter(customer__in=others).update(customer_id=group['keep'])
+        Customer.objects.filter(pk=group['keep']).update(loyalty_points=F('loyalty_points') + points)
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0005_monthlypurchases'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='author',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_date',
+            field=models.DateField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='publisher',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='purchase',
+            name='purchase_date',
+            field=models.DateField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['user', 'title'], name='bookstore_b_user_id_f88535_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_customers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(fields=('user', 'phone'), name='unique_customer_phone_per_user'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:44
+
+from django.db import migrations, models
+
+TRIGRAM_INDEX = 'bookstore_book_search_text_trgm'
+
+
+def populate_search_text(apps, schema_editor):
+    Book = apps.get_model('bookstore', 'Book')
+    books = Book.objects.select_related('author', 'publisher', 'category').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(books.filter(pk__gt=last_pk)[:2000])
+        if not batch:
+            break
+        for book in batch:
+            book.search_text = ' '.join([
+                book.title, book.author.name, book.publisher.name, book.category.name, book.description,
+            ]).lower()
+        Book.objects.bulk_update(batch, ['search_text'])
+        last_pk = batch[-1].pk
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON bookstore_book USING gin (search_text gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {TRIGRAM_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0006_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
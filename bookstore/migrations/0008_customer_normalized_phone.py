@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+from bookstore.phones import normalize_phone
+
+
+def populate_normalized_phone(apps, schema_editor):
+    Customer = apps.get_model('bookstore', 'Customer')
+    customers = Customer.objects.only('phone').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(customers.filter(pk__gt=last_pk)[:2000])
+        if not batch:
+            break
+        for customer in batch:
+            customer.normalized_phone = normalize_phone(customer.phone) or ''
+        Customer.objects.bulk_update(batch, ['normalized_phone'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0007_book_search_text'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='normalized_phone',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+        migrations.RunPython(populate_normalized_phone, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['user', 'normalized_phone'], name='bookstore_c_user_id_e0f396_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def open_ledgers(apps, schema_editor):
+    # Existing balances have no history; record each as an opening entry
+    Customer = apps.get_model('bookstore', 'Customer')
+    LoyaltyEntry = apps.get_model('bookstore', 'LoyaltyEntry')
+    customers = Customer.objects.filter(loyalty_points__gt=0).order_by('pk').values_list('pk', 'loyalty_points')
+    last_pk = 0
+    while True:
+        batch = list(customers.filter(pk__gt=last_pk)[:2000])
+        if not batch:
+            break
+        LoyaltyEntry.objects.bulk_create(
+            LoyaltyEntry(customer_id=pk, kind='opening', points=points) for pk, points in batch
+        )
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore', '0008_customer_normalized_phone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='tenure_until',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='tenure_years',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='LoyaltyEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('opening', 'Opening Balance'), ('accrual', 'Accrual'), ('redemption', 'Redemption'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('points', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookstore.customer')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bookstore.order')),
+            ],
+        ),
+        migrations.RunPython(open_ledgers, migrations.RunPython.noop),
+    ]
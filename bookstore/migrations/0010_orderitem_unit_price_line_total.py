@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+from django.db import migrations, models, transaction
+from django.db.models import F, OuterRef, Subquery
+
+
+def capture_prices(apps, schema_editor):
+    # Historical sale prices were never recorded; the book's current price is the best available
+    Book = apps.get_model('bookstore', 'Book')
+    OrderItem = apps.get_model('bookstore', 'OrderItem')
+    price = Subquery(Book.objects.filter(pk=OuterRef('book_id')).values('price')[:1])
+    items = OrderItem.objects.order_by('pk').values_list('pk', flat=True)
+    last_pk = 0
+    while True:
+        batch = list(items.filter(pk__gt=last_pk)[:5000])
+        if not batch:
+            break
+        # One UPDATE per batch, each committed on its own so the table is never locked for the whole backfill
+        with transaction.atomic(using=schema_editor.connection.alias):
+            OrderItem.objects.filter(pk__gt=last_pk, pk__lte=batch[-1]).update(
+                unit_price=price, line_total=F('amount') * price,
+            )
+        last_pk = batch[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('bookstore', '0009_loyalty_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.RunPython(capture_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+    ]
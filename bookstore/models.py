@@ -1,5 +1,8 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+from .phones import normalize_phone
 
 # User model is inherited from the Django default user model
 class Customer(models.Model):
@@ -9,18 +12,38 @@ class Customer(models.Model):
     phone = models.CharField(max_length=15)
     join_date = models.DateField(auto_now_add=True)
     loyalty_points = models.PositiveIntegerField(default=0)
+    # E.164 form of phone used for checkout lookups, kept in sync by save(); blank if phone is not a number
+    normalized_phone = models.CharField(max_length=16, blank=True, default='', editable=False)
+    # Full years of membership, cached until the next anniversary (see loyalty.tenure)
+    tenure_years = models.PositiveSmallIntegerField(default=0, editable=False)
+    tenure_until = models.DateField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # A phone number identifies one customer per store; also serves store-scoped lookups
+            models.UniqueConstraint(fields=['user', 'phone'], name='unique_customer_phone_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'normalized_phone']),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.normalized_phone = normalize_phone(self.phone) or ''
+        if kwargs.get('update_fields') is not None and 'phone' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'normalized_phone'}
+        super().save(*args, **kwargs)
+
 class Author(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, db_index=True)
 
     def __str__(self):
         return self.name
 
 class Publisher(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, db_index=True)
     contact_email = models.EmailField()
     phone = models.CharField(max_length=20)
     address = models.TextField()
@@ -29,7 +52,7 @@ class Publisher(models.Model):
         return self.name
 
 class Category(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, db_index=True)
 
     def __str__(self):
         return self.name
@@ -46,13 +69,34 @@ class Book(models.Model):
     publication_month = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity_in_stock = models.PositiveIntegerField()
+    # Lower-cased title, author, publisher, category and description, kept in sync by save()
+    search_text = models.TextField(blank=True, default='', editable=False)
+    # Copies sold over the trailing velocity window and the stock level to reorder at (see reorder.py)
+    recent_sales = models.PositiveIntegerField(default=0, editable=False)
+    reorder_point = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'title']),
+        ]
 
     def __str__(self):
         return self.title
 
+    def get_search_text(self):
+        return ' '.join([
+            self.title, self.author.name, self.publisher.name, self.category.name, self.description,
+        ]).lower()
+
+    def save(self, *args, **kwargs):
+        self.search_text = self.get_search_text()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'search_text'}
+        super().save(*args, **kwargs)
+
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
-    order_date = models.DateField(auto_now_add=True)
+    order_date = models.DateField(auto_now_add=True, db_index=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
 
     payment_method_choices = (
@@ -71,15 +115,45 @@ class Order(models.Model):
         return f"Order #{self.id} by {self.customer.user.first_name} {self.customer.user.last_name}"
 
 class OrderItem(models.Model):
+    """
+    One line of an order. ``unit_price`` is the book's price when it was
+    sold and ``line_total`` is ``amount * unit_price``, so revenue is summed
+    from the items alone and is not changed by later price edits.
+    """
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     amount = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
 
     def __str__(self):
         return f"OrderItem for {self.book.title} (Order #{self.order.id})"
 
+class LoyaltyEntry(models.Model):
+    """
+    Append-only history of loyalty point changes. ``Customer.loyalty_points``
+    is the running balance of these entries and can be rebuilt from them
+    with the ``recompute_loyalty`` command.
+    """
+    OPENING, ACCRUAL, REDEMPTION, ADJUSTMENT = 'opening', 'accrual', 'redemption', 'adjustment'
+    kind_choices = (
+        (OPENING, 'Opening Balance'),
+        (ACCRUAL, 'Accrual'),
+        (REDEMPTION, 'Redemption'),
+        (ADJUSTMENT, 'Adjustment'),
+    )
+
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=kind_choices)
+    points = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.points:+d} points for {self.customer} ({self.kind})"
+
 class Purchase(models.Model):
-    purchase_date = models.DateField(auto_now_add=True)
+    purchase_date = models.DateField(auto_now_add=True, db_index=True)
     total_cost = models.DecimalField(max_digits=10, decimal_places=2)
 
     def __str__(self):
@@ -93,3 +167,120 @@ class PurchaseItem(models.Model):
 
     def __str__(self):
         return f"PurchaseItem for {self.book.title} (Purchase #{self.purchase.id})"
+
+class PurchaseDraft(models.Model):
+    """
+    A suggested purchase from one publisher for the books at or below their
+    reorder point, written by ``reorder.suggest_purchases``. It changes
+    nothing until it is received as a Purchase.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True)
+    publisher = models.ForeignKey(Publisher, on_delete=models.CASCADE)
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Purchase draft #{self.id} for {self.publisher}"
+
+class PurchaseDraftItem(models.Model):
+    draft = models.ForeignKey(PurchaseDraft, on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    amount = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"PurchaseDraftItem for {self.book.title} (Purchase draft #{self.draft.id})"
+
+class DailySales(models.Model):
+    """
+    Sales pre-summed per day and book, kept up to date as orders are placed.
+    Category and publisher are copied from the book so the statistics page
+    can group on them without touching OrderItem.
+    """
+    date = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    publisher = models.ForeignKey(Publisher, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'book'], name='unique_daily_sales_per_book'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'category']),
+            models.Index(fields=['date', 'publisher']),
+        ]
+
+    def __str__(self):
+        return f"Sales of {self.book.title} on {self.date}"
+
+class MonthlyPurchases(models.Model):
+    """
+    Supplier purchases pre-summed per calendar month and book, kept up to
+    date as purchases are received. ``month`` is the first day of the month.
+    """
+    month = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    publisher = models.ForeignKey(Publisher, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    spend = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'book'], name='unique_monthly_purchases_per_book'),
+        ]
+        indexes = [
+            models.Index(fields=['month', 'publisher']),
+        ]
+
+    def __str__(self):
+        return f"Purchases of {self.book.title} in {self.month:%B %Y}"
+
+class ReorderState(models.Model):
+    """
+    Single row recording the last day whose sales are counted in
+    ``Book.recent_sales``, so each reorder run only reads newer days.
+    """
+    through = models.DateField()
+
+    def __str__(self):
+        return f"Sales velocity through {self.through}"
+
+class Task(models.Model):
+    """
+    A unit of background work run by the ``run_workers`` command: ``name``
+    is the dotted path of a function called with ``kwargs``. Rows are
+    written in the same transaction as the change that needs them, so work
+    is queued exactly when that change commits. A ``key`` makes queueing
+    idempotent: a second task with the same key is dropped.
+    """
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    status_choices = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict)
+    key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=status_choices, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # A running task whose lease has expired is assumed lost and is picked up again
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
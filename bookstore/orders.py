@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from . import tasks
+from .loyalty import accrue_points, record_entries, settle_points
+from .models import Order, OrderItem
+from .rollups import record_sales
+from .stock import check_low_stock, lock_books, take_stock
+
+
+def parse_order_lines(data):
+    """
+    Collect the ``book-<n>`` / ``amount-<n>`` pairs of a submitted order
+    form into a ``{book_id: amount}`` dict. Duplicate books are merged and
+    blank or non-positive lines are ignored.
+    """
+    lines = {}
+    for key in data.keys():
+        if not key.startswith('book-'):
+            continue
+        index = key.split('-', 1)[1]
+        try:
+            book_id = int(data.get(f'book-{index}'))
+            amount = int(data.get(f'amount-{index}'))
+        except (TypeError, ValueError):
+            continue  # Skip incomplete or invalid items
+        if amount > 0:
+            lines[book_id] = lines.get(book_id, 0) + amount
+    return lines
+
+
+def place_order(customer, payment_method, lines):
+    """
+    Create an Order with its OrderItems for ``lines`` (``{book_id: amount}``)
+    and take the sold copies out of stock.
+
+    All books are fetched (and locked) in one query, the items are inserted
+    with a single ``bulk_create`` and stock drops through one conditional
+    UPDATE, so the number of queries does not grow with the size of the
+    basket. Redeemed loyalty points are taken at the till, since they change
+    the amount due (see ``loyalty.settle_points``). Everything runs in one
+    transaction; if any book is short of stock nothing is saved and
+    ``InsufficientStock`` is raised with the short lines. Unknown book ids
+    are ignored.
+
+    Follow-up work that does not affect the sale (points earned, the sales
+    rollup and the low-stock check) is queued as background tasks in the
+    same transaction, one INSERT, and done by the ``run_workers`` command.
+    """
+    with transaction.atomic():
+        books = lock_books(list(lines))
+        lines = {book_id: amount for book_id, amount in lines.items() if book_id in books}
+        take_stock(books, lines)
+
+        total_amount = sum((books[book_id].price * amount for book_id, amount in lines.items()), Decimal('0'))
+
+        # Redeem 100 points for 10% off with one conditional UPDATE
+        total_amount, entries = settle_points(customer, total_amount)
+
+        order = Order.objects.create(
+            customer=customer,
+            payment_method=payment_method,
+            total_amount=total_amount,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, book_id=book_id, amount=amount, unit_price=books[book_id].price,
+                      line_total=books[book_id].price * amount)
+            for book_id, amount in lines.items()
+        ])
+        record_entries(customer, order, entries)
+        tasks.defer(
+            tasks.call(accrue_points, key=f'loyalty:{order.pk}', order_id=order.pk),
+            tasks.call(record_sales, key=f'sales-rollup:{order.pk}', order_id=order.pk),
+            tasks.call(check_low_stock, key=f'low-stock:{order.pk}', book_ids=list(lines)),
+        )
+
+    return order
@@ -0,0 +1,121 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a ``cursor`` token cannot be decoded.
+    """
+
+
+def encode_cursor(value, pk):
+    """
+    Turn the sort value and primary key of the last row on a page into an
+    opaque, URL-safe ``next`` token.
+    """
+    raw = json.dumps([str(value), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Reverse ``encode_cursor``, returning ``(value, pk)`` with the value still
+    as a string. Anything but a ``[str, int]`` pair is rejected.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        position = json.loads(raw)
+    except ValueError as e:
+        raise InvalidCursor('Invalid cursor') from e
+    if not (isinstance(position, list) and len(position) == 2 and isinstance(position[0], str)
+            and isinstance(position[1], int) and not isinstance(position[1], bool)):
+        raise InvalidCursor('Invalid cursor')
+    return tuple(position)
+
+
+def resolve_field(model, path):
+    """
+    Return the model field at the end of a ``__``-separated lookup path.
+    """
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def resolve_value(obj, path):
+    for name in path.split('__'):
+        obj = getattr(obj, name)
+    return obj
+
+
+class KeysetPaginationMixin:
+    """
+    Cursor pagination for list views over ``(keyset_field, id)``, newest
+    first by default. Unlike OFFSET pagination every page costs the same
+    however deep into the list it is, and rows added while paging never
+    shift the next page.
+    """
+    keyset_field = None
+    keyset_descending = True
+    page_size = 100
+    max_page_size = 500
+
+    def get_keyset(self):
+        """
+        Return ``(field, descending)`` to order and page by. ``field`` may
+        follow relations, e.g. ``author__name``.
+        """
+        return self.keyset_field, self.keyset_descending
+
+    def get_page_size(self):
+        try:
+            size = int(self.request.GET.get('limit', self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def keyset_queryset(self, queryset):
+        """
+        Order ``queryset`` along the keyset and skip to the requested cursor.
+        """
+        field, descending = self.get_keyset()
+        if descending:
+            queryset, lookup = queryset.order_by(f'-{field}', '-pk'), 'lt'
+        else:
+            queryset, lookup = queryset.order_by(field, 'pk'), 'gt'
+        token = self.request.GET.get('cursor')
+        if token:
+            value, pk = decode_cursor(token)
+            try:
+                value = resolve_field(queryset.model, field).to_python(value)
+            except (ValidationError, TypeError, ValueError) as e:
+                raise InvalidCursor('Invalid cursor') from e
+            queryset = queryset.filter(Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk}))
+        return queryset
+
+    def paginate_keyset(self, queryset):
+        """
+        Return ``(rows, next_cursor)`` for the requested page. ``next_cursor``
+        is ``None`` on the last page.
+        """
+        size = self.get_page_size()
+        return self.cut_page(list(self.keyset_queryset(queryset)[:size + 1]), size)
+
+    async def apaginate_keyset(self, queryset):
+        """
+        Async ``paginate_keyset``, for views served under ASGI.
+        """
+        size = self.get_page_size()
+        return self.cut_page([row async for row in self.keyset_queryset(queryset)[:size + 1]], size)
+
+    def cut_page(self, rows, size):
+        next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            last = rows[-1]
+            next_cursor = encode_cursor(resolve_value(last, self.get_keyset()[0]), last.pk)
+        return rows, next_cursor
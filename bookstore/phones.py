@@ -0,0 +1,32 @@
+import re
+
+from django.conf import settings
+
+SEPARATORS_RE = re.compile(r'[\s\-().]')
+
+
+def normalize_phone(phone, country_code=None):
+    """
+    Return ``phone`` in E.164 form (``+<country code><number>``), or None if
+    it cannot be a phone number.
+
+    Spaces, dashes, dots and brackets are ignored. Numbers starting with
+    ``+`` or the international ``00`` prefix keep their country code;
+    national numbers drop their leading trunk ``0`` and get
+    ``country_code`` (``PHONE_COUNTRY_CODE``, Thailand by default).
+    """
+    if not phone:
+        return None
+    if country_code is None:
+        country_code = getattr(settings, 'PHONE_COUNTRY_CODE', '66')
+    phone = SEPARATORS_RE.sub('', str(phone))
+    if phone.startswith('+'):
+        digits = phone[1:]
+    elif phone.startswith('00'):
+        digits = phone[2:]
+    else:
+        digits = country_code + phone[1:] if phone.startswith('0') else country_code + phone
+    # E.164 allows at most 15 digits and country codes never start with 0
+    if not digits.isdigit() or not 8 <= len(digits) <= 15 or digits.startswith('0'):
+        return None
+    return '+' + digits
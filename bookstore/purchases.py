@@ -0,0 +1,114 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Book, Purchase, PurchaseItem
+from .rollups import record_purchases
+from .stock import add_stock
+
+
+class InvalidPurchase(Exception):
+    """
+    Raised when a delivery note has invalid lines. ``errors`` lists every
+    one of them (``{'line', 'book_id', 'error'}``) so the whole note can be
+    corrected at once; nothing is saved.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f'{len(errors)} invalid purchase line(s)')
+
+
+def parse_purchase_lines(data):
+    """
+    Collect the ``book-<n>`` / ``amount-<n>`` pairs of a submitted purchase
+    form as ``[(line, book_id, amount)]``, values still as submitted. Lines
+    left entirely blank are skipped.
+    """
+    lines = []
+    for key in data.keys():
+        if not key.startswith('book-'):
+            continue
+        index = key.split('-', 1)[1]
+        book_id, amount = data.get(f'book-{index}'), data.get(f'amount-{index}')
+        if book_id or amount:
+            lines.append((index, book_id, amount))
+    return lines
+
+
+def validate_lines(lines):
+    """
+    Check every line of a delivery note and return ``({book_id: amount},
+    books)``, merging lines for the same book. All books are loaded in one
+    query. Raises ``InvalidPurchase`` listing every bad line.
+    """
+    errors, valid = [], []
+    for line, book_id, amount in lines:
+        try:
+            book_id, amount = int(book_id), int(amount)
+        except (TypeError, ValueError):
+            errors.append({'line': line, 'book_id': book_id, 'error': 'Book and amount must be whole numbers.'})
+            continue
+        if amount <= 0:
+            errors.append({'line': line, 'book_id': book_id, 'error': 'Amount must be positive.'})
+            continue
+        valid.append((line, book_id, amount))
+
+    books = Book.objects.only('id', 'title', 'price', 'publisher_id') \
+        .in_bulk({book_id for _, book_id, _ in valid})
+    errors.extend(
+        {'line': line, 'book_id': book_id, 'error': 'Unknown book.'}
+        for line, book_id, _ in valid
+        if book_id not in books
+    )
+    if not lines:
+        errors.append({'line': None, 'book_id': None, 'error': 'The purchase has no lines.'})
+    if errors:
+        position = {line: i for i, (line, _, _) in enumerate(lines)}
+        raise InvalidPurchase(sorted(errors, key=lambda error: position.get(error['line'], -1)))
+
+    amounts = {}
+    for _, book_id, amount in valid:
+        amounts[book_id] = amounts.get(book_id, 0) + amount
+    return amounts, books
+
+
+def receive_purchase(lines):
+    """
+    Record a delivery of ``lines`` (``[(line, book_id, amount)]``, as from
+    ``parse_purchase_lines``) as one Purchase and add it to stock.
+
+    The whole note is validated before anything is written (see
+    ``validate_lines``). The purchase and its items are then inserted with
+    one INSERT each, stock rises through a single CASE UPDATE and the
+    monthly rollup is updated, all in one transaction, so the number of
+    queries does not grow with the length of the note.
+    """
+    amounts, books = validate_lines(lines)
+
+    with transaction.atomic():
+        purchase = Purchase.objects.create(
+            total_cost=sum((books[book_id].price * amount for book_id, amount in amounts.items()), Decimal('0')),
+        )
+        items = PurchaseItem.objects.bulk_create([
+            PurchaseItem(purchase=purchase, book=books[book_id], amount=amount, unit_price=books[book_id].price)
+            for book_id, amount in amounts.items()
+        ])
+        add_stock(amounts)
+
+        # Keep the supplier statistics rollup in step with the purchase
+        record_purchases(purchase.purchase_date, items)
+    return purchase
+
+
+def receive_draft(draft):
+    """
+    Receive a purchase draft from ``reorder.suggest_purchases`` as a
+    Purchase, as ``receive_purchase`` would, and delete the draft.
+    """
+    lines = [(str(i), item.book_id, item.amount)
+             for i, item in enumerate(draft.purchasedraftitem_set.order_by('pk'), 1)]
+    with transaction.atomic():
+        purchase = receive_purchase(lines)
+        draft.delete()
+    return purchase
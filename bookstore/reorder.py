@@ -0,0 +1,131 @@
+from datetime import timedelta
+from decimal import Decimal
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import tasks
+from .models import Book, DailySales, PurchaseDraft, PurchaseDraftItem, ReorderState, Task
+from .rollups import record_sales
+
+# Velocity is the average daily sales over the last WINDOW_DAYS complete days
+WINDOW_DAYS = getattr(settings, 'REORDER_WINDOW_DAYS', 28)
+# Reorder when stock would not last until a delivery arrives, with some safety stock;
+# suggested purchases top stock up to cover CYCLE_DAYS more
+LEAD_TIME_DAYS = getattr(settings, 'REORDER_LEAD_TIME_DAYS', 14)
+SAFETY_DAYS = getattr(settings, 'REORDER_SAFETY_DAYS', 7)
+CYCLE_DAYS = getattr(settings, 'REORDER_CYCLE_DAYS', 14)
+
+
+def units_sold(start, end):
+    """
+    Expression for the copies of the outer book sold from ``start`` to
+    ``end`` inclusive, read from the DailySales buckets.
+    """
+    totals = DailySales.objects.filter(book=OuterRef('pk'), date__range=(start, end)).order_by() \
+        .values('book').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(totals), Value(0), output_field=IntegerField())
+
+
+def days_of_stock(days):
+    """
+    Expression for the copies needed to cover ``days`` at each book's
+    current velocity, rounded up (integer division in SQL).
+    """
+    return (F('recent_sales') * days + (WINDOW_DAYS - 1)) / WINDOW_DAYS
+
+
+def last_complete_day():
+    """
+    Return the last day whose DailySales buckets are final: yesterday, or
+    earlier while checkouts from before then are still waiting for the
+    background task that adds them to the rollup.
+    """
+    day = timezone.localdate() - timedelta(days=1)
+    pending = Task.objects.filter(name=tasks.task_name(record_sales), status__in=[Task.PENDING, Task.RUNNING]) \
+        .aggregate(oldest=Min('created_at'))['oldest']
+    if pending is not None:
+        day = min(day, timezone.localdate(pending) - timedelta(days=1))
+    return day
+
+
+def update_reorder_points(through=None, rebuild=False):
+    """
+    Bring ``Book.recent_sales`` and ``Book.reorder_point`` up to date with
+    the sales of every complete day up to ``through`` (by default
+    ``last_complete_day``) and return the number of books updated.
+
+    Runs incrementally: the trailing window slides forward from the day
+    recorded in ReorderState, adding the days that entered it and
+    subtracting those that left, so only books sold on those days are
+    touched. Each step is one set-based UPDATE over all affected books
+    rather than a query per book. With ``rebuild``, on the first run or
+    after a gap longer than the window, every book is recomputed from the
+    buckets instead, e.g. after ``rebuild_sales_rollup``.
+    """
+    through = through or last_complete_day()
+    window_start = through - timedelta(days=WINDOW_DAYS - 1)
+
+    with transaction.atomic():
+        state = ReorderState.objects.select_for_update().filter(pk=1).first()
+        # Days since the last run; a whole window or more means nothing carries over
+        gap = None if state is None else (through - state.through).days
+        if rebuild or gap is None or not 0 <= gap < WINDOW_DAYS:
+            books = Book.objects.all()
+            books.update(recent_sales=units_sold(window_start, through))
+        elif gap == 0:
+            return 0
+        else:
+            entered = (state.through + timedelta(days=1), through)
+            left = (entered[0] - timedelta(days=WINDOW_DAYS), through - timedelta(days=WINDOW_DAYS))
+            sold = DailySales.objects.filter(Q(date__range=entered) | Q(date__range=left)).values('book_id')
+            books = Book.objects.filter(pk__in=sold)
+            books.update(recent_sales=Greatest(
+                F('recent_sales') + units_sold(*entered) - units_sold(*left), Value(0),
+            ))
+        updated = books.update(reorder_point=days_of_stock(LEAD_TIME_DAYS + SAFETY_DAYS))
+        if state is None:
+            ReorderState.objects.create(pk=1, through=through)
+        else:
+            state.through = through
+            state.save(update_fields=['through'])
+    return updated
+
+
+def suggest_purchases(user=None):
+    """
+    Replace the open purchase drafts (of ``user``, or of everyone) with one
+    per store and publisher listing the books at or below their reorder
+    point. Each book is ordered up to cover the lead time, safety stock and
+    ``CYCLE_DAYS`` of sales. Returns the new drafts.
+    """
+    low = Book.objects.filter(reorder_point__gt=0, quantity_in_stock__lte=F('reorder_point'))
+    drafts = PurchaseDraft.objects.all()
+    if user is not None:
+        low, drafts = low.filter(user=user), drafts.filter(user=user)
+    low = low.annotate(order_up_to=days_of_stock(LEAD_TIME_DAYS + SAFETY_DAYS + CYCLE_DAYS)) \
+        .order_by('user_id', 'publisher_id', 'pk') \
+        .values_list('user_id', 'publisher_id', 'pk', 'price', 'quantity_in_stock', 'order_up_to')
+
+    groups = [
+        (key, [(book_id, price, max(order_up_to - stock, 1)) for *_, book_id, price, stock, order_up_to in rows])
+        for key, rows in groupby(low.iterator(chunk_size=2000), key=lambda row: row[:2])
+    ]
+    with transaction.atomic():
+        drafts.delete()
+        new = PurchaseDraft.objects.bulk_create(
+            PurchaseDraft(user_id=user_id, publisher_id=publisher_id,
+                          total_cost=sum((price * amount for _, price, amount in lines), Decimal('0')))
+            for (user_id, publisher_id), lines in groups
+        )
+        PurchaseDraftItem.objects.bulk_create(
+            (PurchaseDraftItem(draft=draft, book_id=book_id, amount=amount, unit_price=price)
+             for draft, (_, lines) in zip(new, groups)
+             for book_id, price, amount in lines),
+            batch_size=2000,
+        )
+    return new
@@ -0,0 +1,258 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Sum, When
+from django.utils import timezone
+
+from . import tasks
+from .models import Book, DailySales, Order, OrderItem, MonthlyPurchases, PurchaseItem, Task
+
+
+def record_sales(order_id):
+    """
+    Add the items of a new order to the DailySales rollup for its date.
+    Queued by checkout as a background task; revenue comes from the
+    captured ``line_total`` so it is unaffected by price edits meanwhile.
+
+    Runs as three statements whatever the basket size: a read of the items
+    grouped by book, an insert that creates any missing rows for the day,
+    then one UPDATE that increments them. Incrementing in SQL keeps
+    concurrent orders from overwriting each other.
+    """
+    lines = {
+        row['book_id']: row for row in OrderItem.objects.filter(order_id=order_id).values(
+            'order__order_date', 'book_id', 'book__category_id', 'book__publisher_id',
+        ).annotate(quantity=Sum('amount'), revenue=Sum('line_total')).order_by()
+    }
+    if not lines:
+        return
+    date = next(iter(lines.values()))['order__order_date']
+    DailySales.objects.bulk_create([
+        DailySales(date=date, book_id=book_id, category_id=row['book__category_id'],
+                   publisher_id=row['book__publisher_id'])
+        for book_id, row in lines.items()
+    ], ignore_conflicts=True)
+    DailySales.objects.filter(date=date, book_id__in=list(lines)).update(
+        quantity=Case(
+            *(When(book_id=book_id, then=F('quantity') + row['quantity']) for book_id, row in lines.items()),
+            default=F('quantity'),
+            output_field=IntegerField(),
+        ),
+        revenue=Case(
+            *(When(book_id=book_id, then=F('revenue') + row['revenue']) for book_id, row in lines.items()),
+            default=F('revenue'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def skip_queued_sales(since=None):
+    """
+    Mark the queued ``record_sales`` tasks of orders dated on or after
+    ``since`` (or of every order) as done, because a rebuild already counts
+    their items.
+    """
+    queued = {
+        task_id: order_id for task_id, order_id in Task.objects.select_for_update().filter(
+            name=tasks.task_name(record_sales), status__in=[Task.PENDING, Task.RUNNING],
+        ).values_list('pk', 'kwargs__order_id')
+    }
+    if since:
+        rebuilt = set(Order.objects.filter(pk__in=queued.values(), order_date__gte=since).values_list('pk', flat=True))
+        queued = {task_id: order_id for task_id, order_id in queued.items() if order_id in rebuilt}
+    return Task.objects.filter(pk__in=list(queued)).update(
+        status=Task.DONE, finished_at=timezone.now(), locked_until=None, last_error='',
+    )
+
+
+def rebuild_sales_rollup(since=None, batch_size=1000):
+    """
+    Recompute DailySales from OrderItem history, optionally only for days on
+    or after ``since``. Returns the number of rollup rows written.
+
+    Revenue is summed from each item's captured ``line_total``, so later
+    price edits do not change history and Book is only read once per batch
+    for the category and publisher of the rows being written.
+
+    Orders still waiting for their ``record_sales`` task are included, so
+    those tasks are marked done in the same transaction; a worker running
+    one at the time loses its lease and rolls back.
+    """
+    items = OrderItem.objects.all()
+    existing = DailySales.objects.all()
+    if since:
+        items = items.filter(order__order_date__gte=since)
+        existing = existing.filter(date__gte=since)
+
+    totals = items.values('order__order_date', 'book_id').annotate(
+        total_quantity=Sum('amount'),
+        total_revenue=Sum('line_total'),
+    ).order_by()
+
+    def write(rows):
+        books = Book.objects.filter(pk__in={row['book_id'] for row in rows})
+        books = {pk: (category_id, publisher_id)
+                 for pk, category_id, publisher_id in books.values_list('pk', 'category_id', 'publisher_id')}
+        return len(DailySales.objects.bulk_create(
+            DailySales(
+                date=row['order__order_date'],
+                book_id=row['book_id'],
+                category_id=books[row['book_id']][0],
+                publisher_id=books[row['book_id']][1],
+                quantity=row['total_quantity'],
+                revenue=row['total_revenue'],
+            )
+            for row in rows
+        ))
+
+    written = 0
+    with transaction.atomic():
+        skip_queued_sales(since)
+        existing.delete()
+        batch = []
+        for row in totals.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                written += write(batch)
+                batch = []
+        if batch:
+            written += write(batch)
+    return written
+
+
+def month_start(date):
+    return date.replace(day=1)
+
+
+def next_month(date):
+    return (date.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def record_purchases(date, items):
+    """
+    Add the PurchaseItems of a purchase received on ``date`` to the
+    MonthlyPurchases rollup, in two statements like ``record_sales``.
+    """
+    totals = {}
+    for item in items:
+        quantity, spend, publisher_id = totals.get(item.book_id, (0, 0, item.book.publisher_id))
+        totals[item.book_id] = (quantity + item.amount, spend + item.amount * item.unit_price, publisher_id)
+    if not totals:
+        return
+
+    month = month_start(date)
+    MonthlyPurchases.objects.bulk_create([
+        MonthlyPurchases(month=month, book_id=book_id, publisher_id=publisher_id)
+        for book_id, (_, _, publisher_id) in totals.items()
+    ], ignore_conflicts=True)
+    MonthlyPurchases.objects.filter(month=month, book_id__in=list(totals)).update(
+        quantity=Case(
+            *(When(book_id=book_id, then=F('quantity') + quantity) for book_id, (quantity, _, _) in totals.items()),
+            default=F('quantity'),
+            output_field=IntegerField(),
+        ),
+        spend=Case(
+            *(When(book_id=book_id, then=F('spend') + spend) for book_id, (_, spend, _) in totals.items()),
+            default=F('spend'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    )
+
+
+def rebuild_purchase_rollup(since=None, batch_size=1000):
+    """
+    Recompute MonthlyPurchases from PurchaseItem history, optionally only for
+    months from the one containing ``since`` onwards. Returns the number of
+    rollup rows written.
+    """
+    items = PurchaseItem.objects.all()
+    existing = MonthlyPurchases.objects.all()
+    if since:
+        since = month_start(since)
+        items = items.filter(purchase__purchase_date__gte=since)
+        existing = existing.filter(month__gte=since)
+
+    # Group per day in SQL (portable, and still far fewer rows than items),
+    # then fold days into months while streaming.
+    totals = items.values(
+        'purchase__purchase_date', 'book_id', 'book__publisher_id',
+    ).annotate(
+        total_quantity=Sum('amount'),
+        total_spend=Sum(F('amount') * F('unit_price')),
+    ).order_by('purchase__purchase_date')
+
+    written = 0
+    with transaction.atomic():
+        existing.delete()
+        month, rows = None, {}
+        for row in totals.iterator(chunk_size=batch_size):
+            row_month = month_start(row['purchase__purchase_date'])
+            if row_month != month:
+                written += len(MonthlyPurchases.objects.bulk_create(rows.values(), batch_size=batch_size))
+                month, rows = row_month, {}
+            summary = rows.setdefault(row['book_id'], MonthlyPurchases(
+                month=month, book_id=row['book_id'], publisher_id=row['book__publisher_id'],
+            ))
+            summary.quantity += row['total_quantity']
+            summary.spend += row['total_spend']
+        written += len(MonthlyPurchases.objects.bulk_create(rows.values(), batch_size=batch_size))
+    return written
+
+
+def purchase_spend(group, start=None, end=None):
+    """
+    Total purchase spend between ``start`` and ``end`` (inclusive, either may
+    be ``None`` for open-ended) grouped by ``'publisher'`` or ``'book'``.
+    Returns ``[{'name': ..., 'total_spent': ...}]``, biggest spend first.
+
+    Whole months inside the range are read from MonthlyPurchases. Only the
+    partial months at either edge fall back to PurchaseItem, and those scans
+    are bounded to at most two months with a plain date range, so the cost
+    does not grow with the length of the range.
+    """
+    rollup_field, item_field = {
+        'publisher': ('publisher__name', 'book__publisher__name'),
+        'book': ('book__title', 'book__title'),
+    }[group]
+
+    today = timezone.localtime(timezone.now()).date()
+    # Nothing is purchased in the future, so a range ending today covers its month in full
+    end = min(end, today) if end else today
+    if start and start > end:
+        return []
+
+    partial_ranges = []
+    full_from = start
+    if start and start.day != 1:
+        head_end = min(next_month(start) - timedelta(days=1), end)
+        partial_ranges.append((start, head_end))
+        full_from = head_end + timedelta(days=1)
+
+    full_to = None
+    if full_from is None or full_from <= end:
+        if end == today or end == next_month(end) - timedelta(days=1):
+            full_to = next_month(end)
+        else:
+            full_to = month_start(end)
+            partial_ranges.append((full_to, end))
+
+    totals = {}
+    if full_to is not None:
+        rollup = MonthlyPurchases.objects.filter(month__lt=full_to)
+        if full_from:
+            rollup = rollup.filter(month__gte=full_from)
+        for row in rollup.values(rollup_field).annotate(total=Sum('spend')).order_by():
+            totals[row[rollup_field]] = totals.get(row[rollup_field], 0) + row['total']
+    if partial_ranges:
+        edges = PurchaseItem.objects.filter(reduce(or_, (
+            Q(purchase__purchase_date__range=date_range) for date_range in partial_ranges
+        )))
+        for row in edges.values(item_field).annotate(total=Sum(F('amount') * F('unit_price'))).order_by():
+            totals[row[item_field]] = totals.get(row[item_field], 0) + row['total']
+
+    return sorted(
+        ({'name': name, 'total_spent': total} for name, total in totals.items()),
+        key=lambda row: row['total_spent'], reverse=True,
+    )
@@ -0,0 +1,207 @@
+import hashlib
+import re
+import threading
+from bisect import bisect_left
+from functools import reduce
+from operator import and_
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+from .models import Book
+
+RESULT_FIELDS = ('id', 'title', 'author__name', 'publisher__name', 'category__name', 'price', 'quantity_in_stock')
+
+# Search results are cached per user for a few seconds; any book change bumps a version instead of deleting keys
+RESULT_CACHE_TIMEOUT = getattr(settings, 'BOOK_SEARCH_CACHE_TIMEOUT', 10)
+VERSION_KEY = 'book-search:version'
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def normalize_query(query):
+    return ' '.join(tokenize(query))
+
+
+async def cached_search_books(user, query, limit=10):
+    """
+    ``search_books`` behind a short-lived per-user cache keyed on the
+    normalised query, so repeated and retyped queries cost no database work.
+    """
+    query = normalize_query(query)
+    versions = await cache.aget_many([VERSION_KEY, f'{VERSION_KEY}:{user.pk}'])
+    key = 'book-search:{}:{}.{}:{}:{}'.format(
+        user.pk, versions.get(VERSION_KEY, 0), versions.get(f'{VERSION_KEY}:{user.pk}', 0), limit,
+        hashlib.md5(query.encode()).hexdigest(),
+    )
+    books = await cache.aget(key)
+    if books is None:
+        books = await search_books(user, query, limit)
+        await cache.aset(key, books, RESULT_CACHE_TIMEOUT)
+    return books
+
+
+async def search_books(user, query, limit=10):
+    """
+    Return up to ``limit`` of ``user``'s books matching ``query`` as dicts
+    of ``RESULT_FIELDS``, best match first.
+
+    Matches are looked up in ``Book.search_text`` (title, author, publisher,
+    category and description). Every query word may be a prefix of a word
+    in the book, and small typos are tolerated. PostgreSQL answers from the
+    trigram GIN index on ``search_text``; other databases fall back to an
+    in-memory inverted index, which is built and scanned in a worker thread
+    to keep the CPU work off the event loop.
+    """
+    books = Book.objects.filter(user=user)
+    tokens = tokenize(query)
+    if not tokens:
+        return [row async for row in books.values(*RESULT_FIELDS)[:limit]]
+
+    if connection.vendor == 'postgresql':
+        query = ' '.join(tokens)
+        matches = books.filter(
+            reduce(and_, (Q(search_text__contains=token) for token in tokens))
+            | Q(TrigramWordSimilar(F('search_text'), Value(query)))
+        ).annotate(
+            rank=TrigramWordSimilarity(Value(query), F('search_text')) + Case(
+                When(title__istartswith=query, then=Value(1.0)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        ).order_by('-rank', 'title')
+        return [row async for row in matches.values(*RESULT_FIELDS)[:limit]]
+
+    ids = await sync_to_async(lambda: get_index(user).search(tokens, limit))()
+    rows = {row['id']: row async for row in books.filter(pk__in=ids).values(*RESULT_FIELDS)}
+    return [rows[pk] for pk in ids if pk in rows]
+
+
+def edit_distance_at_most(a, b, limit):
+    """
+    Return True if the Levenshtein distance between ``a`` and ``b`` is at
+    most ``limit``, giving up as soon as every path exceeds it.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+
+class InvertedIndex:
+    """
+    Pure-Python word index over ``Book.search_text`` used where trigram
+    search is unavailable (SQLite test and development databases).
+    """
+    EXACT, PREFIX, FUZZY, TITLE_BONUS = 3.0, 2.0, 1.0, 1.0
+
+    def __init__(self, rows):
+        self.postings = {}
+        self.titles = {}
+        for pk, title, search_text in rows:
+            self.titles[pk] = set(tokenize(title))
+            for token in set(tokenize(search_text)):
+                self.postings.setdefault(token, set()).add(pk)
+        self.vocabulary = sorted(self.postings)
+
+    def expand(self, token):
+        """
+        Map ``token`` to ``{word: score}`` for the indexed words it matches:
+        itself, words it is a prefix of and, failing those, near misses.
+        """
+        matches = {}
+        start = bisect_left(self.vocabulary, token)
+        for word in self.vocabulary[start:]:
+            if not word.startswith(token):
+                break
+            matches[word] = self.EXACT if word == token else self.PREFIX
+        if not matches and len(token) >= 3:
+            allowed = 1 if len(token) < 7 else 2
+            for word in self.vocabulary:
+                # A typo in the whole word or in the part typed so far
+                if edit_distance_at_most(token, word[:len(token)], allowed) \
+                        or edit_distance_at_most(token, word, allowed):
+                    matches[word] = self.FUZZY
+        return matches
+
+    def search(self, tokens, limit):
+        scores = None
+        for token in tokens:
+            token_scores = {}
+            for word, score in self.expand(token).items():
+                for pk in self.postings[word]:
+                    bonus = self.TITLE_BONUS if word in self.titles[pk] else 0
+                    token_scores[pk] = max(token_scores.get(pk, 0), score + bonus)
+            if scores is None:
+                scores = token_scores
+            else:
+                # Every query word has to match
+                scores = {pk: scores[pk] + score for pk, score in token_scores.items() if pk in scores}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda pk: (-scores[pk], pk))[:limit]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(user):
+    with _indexes_lock:
+        index = _indexes.get(user.pk)
+    if index is None:
+        rows = Book.objects.filter(user=user).values_list('id', 'title', 'search_text')
+        index = InvertedIndex(rows.iterator())
+        with _indexes_lock:
+            _indexes[user.pk] = index
+    return index
+
+
+def invalidate(user_id=None):
+    """
+    Drop the cached inverted index and search results of one user, or of
+    everyone.
+    """
+    with _indexes_lock:
+        if user_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(user_id, None)
+
+    key = VERSION_KEY if user_id is None else f'{VERSION_KEY}:{user_id}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def refresh_search_text(books, batch_size=1000):
+    """
+    Recompute ``search_text`` for a queryset of books, e.g. after an author
+    has been renamed.
+    """
+    books = books.select_related('author', 'publisher', 'category').order_by('pk')
+    batch = []
+    for book in books.iterator(chunk_size=batch_size):
+        book.search_text = book.get_search_text()
+        batch.append(book)
+        if len(batch) >= batch_size:
+            Book.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    Book.objects.bulk_update(batch, ['search_text'])
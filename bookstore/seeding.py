@@ -0,0 +1,314 @@
+import math
+import random
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from itertools import groupby, islice
+
+from django.db import connection, transaction
+
+from . import catalogue, search
+from .phones import normalize_phone
+from .models import Customer, Author, Publisher, Category, Book, Order, OrderItem, Purchase, PurchaseItem, \
+    LoyaltyEntry
+
+FIRST_NAMES = ('Ada', 'Ben', 'Chloe', 'Daniel', 'Emma', 'Farid', 'Grace', 'Hiro', 'Isla', 'Jonas', 'Kanya',
+               'Liam', 'Mali', 'Noah', 'Olivia', 'Pim', 'Quinn', 'Ravi', 'Somchai', 'Tara', 'Uma', 'Victor',
+               'Wanida', 'Xavier', 'Yuki', 'Zoe')
+LAST_NAMES = ('Anderson', 'Boonmee', 'Chen', 'Dubois', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jensen',
+              'Kowalski', 'Lopez', 'Martin', 'Nakamura', 'Okafor', 'Petrov', 'Quispe', 'Rossi', 'Srisuk',
+              'Tanaka', 'Ueda', 'Varga', 'Wongsa', 'Young', 'Zhang')
+ADJECTIVES = ('Silent', 'Golden', 'Hidden', 'Last', 'Broken', 'Crimson', 'Distant', 'Endless', 'Forgotten',
+              'Burning', 'Quiet', 'Wild', 'Secret', 'Little', 'Northern', 'Glass', 'Midnight', 'Hollow')
+NOUNS = ('River', 'Garden', 'Empire', 'Kingdom', 'Letters', 'Shadow', 'Harbor', 'Mountain', 'Orchard',
+         'Library', 'Storm', 'Compass', 'Island', 'Machine', 'Theory', 'Journey', 'Lantern', 'Winter')
+CATEGORIES = ('Fiction', 'Mystery', 'Science Fiction', 'Fantasy', 'Romance', 'History', 'Biography', 'Science',
+              'Business', 'Self-Help', 'Travel', 'Cooking', 'Children', 'Poetry', 'Comics', 'Art')
+
+# Relative order volume per calendar month: summer and back-to-school bumps, holiday peak
+MONTH_WEIGHTS = (0.8, 0.75, 0.85, 0.9, 0.95, 1.0, 1.05, 1.15, 1.1, 1.0, 1.2, 1.8)
+WEEKEND_WEIGHT = 1.3
+# Basket sizes 1..5 and the quantity of each line
+ITEM_COUNT_WEIGHTS = (50, 25, 12, 8, 5)
+AMOUNT_WEIGHTS = {1: 85, 2: 12, 3: 3}
+PAYMENT_WEIGHTS = {'credit_card': 40, 'cash': 25, 'debit_card': 15, 'paypal': 12, 'bank_transfer': 8}
+
+
+def zipf_cum_weights(n, exponent):
+    """
+    Cumulative weights giving rank ``i`` (0-based) a share proportional to
+    ``1 / (i + 1) ** exponent``, for ``random.choices``.
+    """
+    total, cum_weights = 0.0, []
+    for rank in range(1, n + 1):
+        total += 1 / rank ** exponent
+        cum_weights.append(total)
+    return cum_weights
+
+
+def backdate(model, field, objs, dates):
+    """
+    Set ``field`` of freshly bulk-created ``objs`` to ``dates`` (in the same,
+    ascending order), overriding ``auto_now_add`` with one UPDATE per run of
+    equal dates over the matching primary key range.
+    """
+    position = 0
+    for date, run in groupby(dates):
+        count = sum(1 for _ in run)
+        model.objects.filter(pk__range=(objs[position].pk, objs[position + count - 1].pk)) \
+            .update(**{field: date})
+        position += count
+
+
+def insert_rows(model, fields, rows, batch_size):
+    """
+    Insert plain value tuples into ``model``'s table with ``executemany``.
+    Used for the line-item tables, where building and compiling millions of
+    model instances would dominate ``bulk_create``.
+    """
+    quote = connection.ops.quote_name
+    columns = [model._meta.get_field(name).column for name in fields]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table), ', '.join(map(quote, columns)), ', '.join(['%s'] * len(columns)),
+    )
+    count = 0
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), batch_size):
+            chunk = rows[offset:offset + batch_size]
+            cursor.executemany(sql, chunk)
+            count += len(chunk)
+    return count
+
+
+class Seeder:
+    """
+    Generate a deterministic, production-shaped data set for ``user``.
+
+    The same ``seed`` and ``end`` date always produce the same rows. Book
+    sales follow a Zipf distribution (a few bestsellers, a long tail),
+    customers repeat-buy with a milder skew, and order dates follow monthly
+    seasonality, a weekend bump and slow growth over the ``days`` before
+    ``end``. Rows are inserted with ``bulk_create`` (order and purchase
+    lines with ``executemany``), ``batch_size`` orders or purchases per
+    transaction.
+    """
+
+    def __init__(self, user, end, seed=0, days=730, batch_size=5000, skew=1.1, progress=None):
+        self.user = user
+        self.end = end
+        self.random = random.Random(seed)
+        self.days = days
+        self.batch_size = batch_size
+        self.skew = skew
+        self.progress = progress
+        self.counts = Counter()
+
+    def report(self, label):
+        if self.progress:
+            self.progress(label, self.counts)
+
+    def run(self, authors=500, publishers=50, categories=16, books=10000, customers=20000, orders=100000,
+            max_items=5, purchases=5000):
+        self.seed_catalogue(authors, publishers, categories, books)
+        self.seed_customers(customers)
+        self.seed_orders(orders, max_items)
+        self.seed_purchases(purchases)
+
+        # Bulk inserts bypass the model signals that normally keep these current
+        search.invalidate(self.user.pk)
+        for model in (Author, Publisher, Category, Book):
+            catalogue.invalidate(model)
+        return self.counts
+
+    def person_name(self, i):
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        last = LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]
+        cycle = i // (len(FIRST_NAMES) * len(LAST_NAMES))
+        return f'{first} {last}' + (f' {cycle + 1}' if cycle else '')
+
+    def seed_catalogue(self, authors, publishers, categories, books):
+        rnd = self.random
+        authors = Author.objects.bulk_create(
+            (Author(name=self.person_name(i)) for i in range(authors)), batch_size=self.batch_size,
+        )
+        publishers = Publisher.objects.bulk_create((
+            Publisher(name=f'{rnd.choice(NOUNS)} House {i + 1}', contact_email=f'orders{i + 1}@example.com',
+                      phone=f'02{i:07d}', address=f'{i + 1} Publisher Road')
+            for i in range(publishers)
+        ), batch_size=self.batch_size)
+        categories = Category.objects.bulk_create(
+            (Category(name=CATEGORIES[i % len(CATEGORIES)] + (f' {i // len(CATEGORIES) + 1}'
+                                                             if i >= len(CATEGORIES) else ''))
+             for i in range(categories)),
+            batch_size=self.batch_size,
+        )
+        self.counts.update(authors=len(authors), publishers=len(publishers), categories=len(categories))
+
+        # Popular authors and publishers have more titles
+        author_weights = zipf_cum_weights(len(authors), 0.8)
+        publisher_weights = zipf_cum_weights(len(publishers), 0.8)
+        rows = []
+        for i in range(books):
+            author = rnd.choices(authors, cum_weights=author_weights)[0]
+            publisher = rnd.choices(publishers, cum_weights=publisher_weights)[0]
+            category = rnd.choice(categories)
+            title = f'The {rnd.choice(ADJECTIVES)} {rnd.choice(NOUNS)}'
+            if rnd.random() < 0.5:
+                title += f' of the {rnd.choice(NOUNS)}'
+            title += f' {i + 1}'
+            description = f'A {category.name.lower()} title by {author.name}.'
+            rows.append(Book(
+                user=self.user, title=title, description=description, author=author, publisher=publisher,
+                category=category, publication_year=rnd.randint(1950, self.end.year),
+                publication_month=rnd.randint(1, 12), price=Decimal(rnd.randrange(199, 4999)).scaleb(-2),
+                quantity_in_stock=rnd.randint(0, 100),
+                search_text=' '.join([title, author.name, publisher.name, category.name, description]).lower(),
+            ))
+        books = Book.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.counts['books'] = len(books)
+
+        # Sales rank is independent of catalogue order
+        self.books = [(book.pk, book.price, book.publisher_id) for book in books]
+        rnd.shuffle(self.books)
+        self.book_weights = zipf_cum_weights(len(self.books), self.skew)
+        self.report('catalogue')
+
+    def seed_customers(self, customers):
+        rnd = self.random
+        join_dates = sorted(self.end - timedelta(days=rnd.randrange(self.days)) for _ in range(customers))
+        # Seeding the same user again adds customers rather than clashing on phone numbers
+        start = Customer.objects.filter(user=self.user).count()
+        for offset in range(0, customers, self.batch_size):
+            dates = join_dates[offset:offset + self.batch_size]
+            with transaction.atomic():
+                rows = Customer.objects.bulk_create(
+                    Customer(user=self.user, name=self.person_name(rnd.randrange(10 ** 4)), phone=phone,
+                             normalized_phone=normalize_phone(phone), loyalty_points=rnd.randrange(300))
+                    for phone in (f'08{start + offset + i:08d}' for i in range(len(dates)))
+                )
+                backdate(Customer, 'join_date', rows, dates)
+                LoyaltyEntry.objects.bulk_create(
+                    LoyaltyEntry(customer=customer, kind=LoyaltyEntry.OPENING, points=customer.loyalty_points)
+                    for customer in rows
+                    if customer.loyalty_points
+                )
+            self.counts['customers'] += len(rows)
+        self.customer_ids = list(
+            Customer.objects.filter(user=self.user).order_by('pk').values_list('pk', flat=True)
+        )
+        rnd.shuffle(self.customer_ids)
+        self.customer_weights = zipf_cum_weights(len(self.customer_ids), 0.6)
+        self.report('customers')
+
+    def day_weights(self):
+        """
+        Return the dates of the seeded period, oldest first, with cumulative
+        order-volume weights.
+        """
+        dates, cum_weights, total = [], [], 0.0
+        for offset in range(self.days - 1, -1, -1):
+            date = self.end - timedelta(days=offset)
+            growth = 1 + 0.5 * (self.days - offset) / self.days
+            weekend = WEEKEND_WEIGHT if date.weekday() >= 5 else 1.0
+            # Smooth the month steps with a weekly wobble so days are not identical
+            wobble = 1 + 0.1 * math.sin(2 * math.pi * date.toordinal() / 7)
+            total += MONTH_WEIGHTS[date.month - 1] * weekend * growth * wobble
+            dates.append(date)
+            cum_weights.append(total)
+        return dates, cum_weights
+
+    def dated(self, count):
+        """
+        Yield ``count`` seasonally distributed dates in ascending order.
+        """
+        dates, cum_weights = self.day_weights()
+        per_day = Counter(self.random.choices(range(len(dates)), cum_weights=cum_weights, k=count))
+        for index, date in enumerate(dates):
+            for _ in range(per_day[index]):
+                yield date
+
+    def seed_orders(self, orders, max_items):
+        rnd = self.random
+        item_weights = ITEM_COUNT_WEIGHTS[:max_items]
+        sizes = range(1, len(item_weights) + 1)
+        payment_methods, payment_weights = list(PAYMENT_WEIGHTS), list(PAYMENT_WEIGHTS.values())
+        amounts, amount_weights = list(AMOUNT_WEIGHTS), list(AMOUNT_WEIGHTS.values())
+
+        dates = self.dated(orders)
+        while True:
+            batch_dates = list(islice(dates, self.batch_size))
+            if not batch_dates:
+                break
+            # Draw each attribute for the whole batch at once; per-call overhead dominates otherwise
+            n = len(batch_dates)
+            basket_sizes = rnd.choices(sizes, item_weights, k=n)
+            picks = iter(rnd.choices(self.books, cum_weights=self.book_weights, k=sum(basket_sizes)))
+            quantities = iter(rnd.choices(amounts, amount_weights, k=sum(basket_sizes)))
+            customers = rnd.choices(self.customer_ids, cum_weights=self.customer_weights, k=n)
+            methods = rnd.choices(payment_methods, payment_weights, k=n)
+
+            batch = []
+            for date, size, customer_pk, method in zip(batch_dates, basket_sizes, customers, methods):
+                lines = {}
+                for (book_pk, price, _), amount in zip(islice(picks, size), quantities):
+                    lines[book_pk] = (lines.get(book_pk, (0, price))[0] + amount, price)
+                batch.append((date, customer_pk, method, lines))
+            self.write_orders(batch)
+        self.report('orders')
+
+    def write_orders(self, batch):
+        if not batch:
+            return
+        with transaction.atomic():
+            orders = Order.objects.bulk_create(
+                Order(customer_id=customer_pk, payment_method=method,
+                      total_amount=sum(price * amount for amount, price in lines.values()))
+                for _, customer_pk, method, lines in batch
+            )
+            backdate(Order, 'order_date', orders, [date for date, *_ in batch])
+            items = insert_rows(OrderItem, ['order', 'book', 'amount', 'unit_price', 'line_total'], [
+                (order.pk, book_pk, amount, price, price * amount)
+                for order, (*_, lines) in zip(orders, batch)
+                for book_pk, (amount, price) in lines.items()
+            ], self.batch_size)
+        self.counts['orders'] += len(orders)
+        self.counts['order_items'] += items
+        self.report('orders')
+
+    def seed_purchases(self, purchases):
+        rnd = self.random
+        by_publisher = {}
+        for book in self.books:
+            by_publisher.setdefault(book[2], []).append(book)
+        publishers = sorted(by_publisher)
+
+        batch = []
+        for date in self.dated(purchases):
+            titles = by_publisher[rnd.choice(publishers)]
+            lines = [
+                (book_pk, rnd.randrange(5, 55, 5), (price * Decimal('0.6')).quantize(Decimal('0.01')))
+                for book_pk, price, _ in rnd.sample(titles, min(len(titles), rnd.randint(1, 10)))
+            ]
+            batch.append((date, lines))
+            if len(batch) >= self.batch_size:
+                self.write_purchases(batch)
+                batch = []
+        self.write_purchases(batch)
+        self.report('purchases')
+
+    def write_purchases(self, batch):
+        if not batch:
+            return
+        with transaction.atomic():
+            purchases = Purchase.objects.bulk_create(
+                Purchase(total_cost=sum(amount * unit_price for _, amount, unit_price in lines))
+                for _, lines in batch
+            )
+            backdate(Purchase, 'purchase_date', purchases, [date for date, _ in batch])
+            items = insert_rows(PurchaseItem, ['purchase', 'book', 'amount', 'unit_price'], [
+                (purchase.pk, book_pk, amount, unit_price)
+                for purchase, (_, lines) in zip(purchases, batch)
+                for book_pk, amount, unit_price in lines
+            ], self.batch_size)
+        self.counts['purchases'] += len(purchases)
+        self.counts['purchase_items'] += items
@@ -0,0 +1,44 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Customer, Author, Publisher, Category, Book
+from . import catalogue, customers
+from .search import invalidate, refresh_search_text
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_save, sender=Category)
+def book_reference_changed(sender, instance, created, **kwargs):
+    if created:
+        return  # No books point at it yet
+    field = sender._meta.model_name
+    refresh_search_text(Book.objects.filter(**{field: instance}))
+    invalidate()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_delete, sender=Publisher)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalogue_changed(sender, **kwargs):
+    catalogue.invalidate(sender)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def customer_changed(sender, instance, **kwargs):
+    customers.invalidate(instance)
+    # Again once committed, in case a concurrent lookup re-cached the old row meanwhile
+    transaction.on_commit(lambda: customers.invalidate(instance))
@@ -0,0 +1,77 @@
+// Typeahead for the book selects of the order and purchase forms.
+// Each ".book-picker" holds a search box and a <select class="book-id"> whose
+// options are fetched a page at a time from the book picker endpoint; a
+// "More books" option at the end of the list loads the next page.
+const BOOK_PICKER_DELAY_MS = 250;
+
+function initBookPicker(picker, onChange) {
+    const input = picker.querySelector('.book-search');
+    const select = picker.querySelector('.book-id');
+    let timer = null;
+    let controller = null;
+    let query = '';
+    let next = null;
+
+    async function loadBooks(cursor) {
+        // Only the answer to the latest request matters
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        try {
+            const params = new URLSearchParams({ q: query });
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            const response = await fetch(`${picker.dataset.url}?${params}`, { signal: controller.signal });
+            const data = await response.json();
+            if (cursor) {
+                select.querySelector('.more-books').remove();
+            } else {
+                select.innerHTML = '';
+            }
+            let first = null;
+            data.books.forEach(([id, title, price, stock]) => {
+                const option = document.createElement('option');
+                option.value = id;
+                option.dataset.price = price;
+                option.textContent = `${title} (${stock} in stock)`;
+                select.appendChild(option);
+                first = first || option;
+            });
+            next = data.next;
+            if (next) {
+                const more = document.createElement('option');
+                more.value = '';
+                more.className = 'more-books';
+                more.textContent = 'More books…';
+                select.appendChild(more);
+            }
+            if (cursor && first) {
+                // Picking "More books" moves on to the first book of the new page
+                select.value = first.value;
+            }
+            onChange();
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                console.log('Error loading books:', error);
+            }
+        }
+    }
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(() => {
+            query = input.value.trim();
+            loadBooks(null);
+        }, BOOK_PICKER_DELAY_MS);
+    });
+    select.addEventListener('change', () => {
+        if (select.selectedOptions[0]?.classList.contains('more-books')) {
+            loadBooks(next);
+        } else {
+            onChange();
+        }
+    });
+    loadBooks(null);
+}
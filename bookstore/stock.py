@@ -0,0 +1,105 @@
+import logging
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Q, When
+
+from . import catalogue
+from .models import Book
+
+logger = logging.getLogger('bookstore.stock')
+
+LOW_STOCK_THRESHOLD = getattr(settings, 'LOW_STOCK_THRESHOLD', 5)
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when an order asks for more copies of a book than are in stock.
+    ``shortages`` lists every short line so the till can report them together.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        titles = ', '.join(shortage['title'] for shortage in shortages)
+        super().__init__(f'Not enough stock for: {titles}')
+
+
+def lock_books(book_ids):
+    """
+    Fetch the given books with a row lock and return them as a
+    ``{book_id: book}`` dict. Must be called inside a transaction.
+
+    Rows are always locked in primary-key order, so two checkouts touching
+    the same books cannot deadlock waiting on each other.
+    """
+    books = Book.objects.select_for_update().filter(pk__in=book_ids).order_by('pk')
+    return {book.pk: book for book in books}
+
+
+def _adjust_stock(condition, lines, sign):
+    # Cached book lists show stock levels
+    catalogue.invalidate_on_commit(Book)
+    return Book.objects.filter(condition).update(quantity_in_stock=Case(
+        *(When(pk=book_id, then=F('quantity_in_stock') + sign * amount) for book_id, amount in lines.items()),
+        default=F('quantity_in_stock'),
+        output_field=IntegerField(),
+    ))
+
+
+def take_stock(books, lines):
+    """
+    Remove ``lines`` (``{book_id: amount}``) from stock for books locked with
+    ``lock_books``. Raises ``InsufficientStock`` listing every short line
+    before anything is written.
+
+    The decrement is a single conditional UPDATE that only matches rows
+    still holding enough copies, so stock can never go negative even if a
+    caller forgets to lock.
+    """
+    shortages = [
+        {
+            'book_id': book_id,
+            'title': books[book_id].title,
+            'requested': amount,
+            'available': books[book_id].quantity_in_stock,
+        }
+        for book_id, amount in lines.items()
+        if books[book_id].quantity_in_stock < amount
+    ]
+    if shortages:
+        raise InsufficientStock(shortages)
+    if not lines:
+        return
+
+    condition = reduce(or_, (Q(pk=book_id, quantity_in_stock__gte=amount) for book_id, amount in lines.items()))
+    if _adjust_stock(condition, lines, -1) != len(lines):
+        # Only reachable when the rows were not locked by the caller
+        raise InsufficientStock([
+            {'book_id': book_id, 'title': books[book_id].title, 'requested': amount, 'available': None}
+            for book_id, amount in lines.items()
+        ])
+
+
+def add_stock(lines):
+    """
+    Add ``lines`` (``{book_id: amount}``) to stock with one UPDATE.
+    """
+    if lines:
+        _adjust_stock(Q(pk__in=list(lines)), lines, 1)
+
+
+def check_low_stock(book_ids):
+    """
+    Log a warning for each of ``book_ids`` whose stock has fallen to its
+    reorder point, or to ``LOW_STOCK_THRESHOLD`` for books without recent
+    sales to base one on. Queued by checkout as a background task for the
+    books just sold.
+    """
+    low = Book.objects.filter(
+        Q(reorder_point__gt=0, quantity_in_stock__lte=F('reorder_point'))
+        | Q(reorder_point=0, quantity_in_stock__lte=LOW_STOCK_THRESHOLD),
+        pk__in=book_ids,
+    ).order_by('pk').values_list('pk', 'title', 'quantity_in_stock')
+    for pk, title, quantity in low:
+        logger.warning('Low stock: %s (book %s) has %d left', title, pk, quantity)
@@ -0,0 +1,222 @@
+import logging
+import multiprocessing
+import signal
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger('bookstore.tasks')
+
+MAX_ATTEMPTS = getattr(settings, 'TASK_MAX_ATTEMPTS', 5)
+# Seconds before the first retry, doubling with each failed attempt up to RETRY_MAX_DELAY
+RETRY_DELAY = getattr(settings, 'TASK_RETRY_DELAY', 5)
+RETRY_MAX_DELAY = 3600
+# Finished tasks, and with them their idempotency keys, are deleted after this many days
+RETENTION_DAYS = getattr(settings, 'TASK_RETENTION_DAYS', 7)
+
+
+class LeaseLost(Exception):
+    """
+    Raised inside a task's transaction when another worker has taken the
+    task over, so this run's changes are rolled back.
+    """
+
+
+def task_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def call(func, key=None, delay=0, max_attempts=MAX_ATTEMPTS, **kwargs):
+    """
+    Return an unsaved Task that calls module-level ``func(**kwargs)``;
+    ``kwargs`` must be JSON serialisable. Queue it with ``defer``.
+    """
+    return Task(
+        name=task_name(func), kwargs=kwargs, key=key, max_attempts=max_attempts,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def defer(*tasks):
+    """
+    Queue ``tasks`` (from ``call``) with one INSERT. Call inside the
+    transaction whose changes the tasks work on: they become visible to the
+    workers when it commits and vanish if it rolls back. Tasks whose key is
+    already queued are skipped.
+    """
+    Task.objects.bulk_create(tasks, ignore_conflicts=True)
+
+
+def claim(limit=20, lease=300):
+    """
+    Mark up to ``limit`` due tasks as running for this worker and return
+    them. Each task is taken with a conditional UPDATE that only matches
+    while it is still unclaimed, so concurrent workers never share one.
+    Running tasks whose ``lease`` (seconds) has run out are taken over.
+    """
+    now = timezone.now()
+    due = Task.objects.filter(
+        Q(status=Task.PENDING, run_after__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now)
+    ).order_by('run_after', 'pk')[:limit]
+    claimed = []
+    for task in due:
+        taken = Task.objects.filter(pk=task.pk, status=task.status, attempts=task.attempts).update(
+            status=Task.RUNNING, attempts=F('attempts') + 1, locked_until=now + timedelta(seconds=lease),
+        )
+        if taken:
+            task.status, task.attempts = Task.RUNNING, task.attempts + 1
+            claimed.append(task)
+    return claimed
+
+
+def _finish(task, **fields):
+    # Only while this worker still holds the task
+    return Task.objects.filter(pk=task.pk, status=Task.RUNNING, attempts=task.attempts).update(
+        locked_until=None, **fields,
+    )
+
+
+def run(task):
+    """
+    Run a claimed task and return True if it succeeded. The task is marked
+    done in the same transaction as the function's changes, so they are
+    committed exactly once even if a worker dies or the task is retried.
+    A failure is retried with exponential backoff until ``max_attempts``,
+    then left as failed with its traceback in ``last_error``.
+    """
+    try:
+        with transaction.atomic():
+            import_string(task.name)(**task.kwargs)
+            if not _finish(task, status=Task.DONE, finished_at=timezone.now(), last_error=''):
+                raise LeaseLost
+    except LeaseLost:
+        logger.warning('Task %s (%s) was taken over by another worker', task.pk, task.name)
+        return False
+    except Exception:
+        error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            logger.error('Task %s (%s) failed for good after %d attempts:\n%s',
+                         task.pk, task.name, task.attempts, error)
+            _finish(task, status=Task.FAILED, finished_at=timezone.now(), last_error=error)
+        else:
+            delay = min(RETRY_DELAY * 2 ** (task.attempts - 1), RETRY_MAX_DELAY)
+            logger.warning('Task %s (%s) failed, retrying in %ds:\n%s', task.pk, task.name, delay, error)
+            _finish(task, status=Task.PENDING, run_after=timezone.now() + timedelta(seconds=delay),
+                    last_error=error)
+        return False
+    return True
+
+
+def run_pending(limit=20, lease=300):
+    """
+    Claim and run one batch of due tasks. Returns the number claimed.
+    """
+    tasks = claim(limit, lease)
+    for task in tasks:
+        run(task)
+    return len(tasks)
+
+
+def drain(limit=20, lease=300):
+    """
+    Run due tasks until none are left, e.g. from tests or a cron job.
+    """
+    while run_pending(limit, lease):
+        pass
+
+
+def purge(days=RETENTION_DAYS):
+    """
+    Delete tasks that finished successfully more than ``days`` ago. Failed
+    tasks are kept for inspection.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    return Task.objects.filter(status=Task.DONE, finished_at__lt=cutoff).delete()[0]
+
+
+def work(stop, poll_interval=1.0, limit=20, lease=300):
+    """
+    Worker loop: run due tasks until ``stop`` (anything with ``is_set`` and
+    ``wait``, like an Event) is set, sleeping ``poll_interval`` seconds
+    whenever the queue is empty.
+    """
+    last_purge = None
+    while not stop.is_set():
+        try:
+            if not run_pending(limit, lease):
+                if last_purge is None or timezone.now() - last_purge > timedelta(hours=1):
+                    purge()
+                    last_purge = timezone.now()
+                stop.wait(poll_interval)
+        except Exception:
+            # E.g. the database restarting; drop the connection and try again
+            logger.exception('Worker loop failed')
+            connections.close_all()
+            stop.wait(poll_interval)
+    connections.close_all()
+
+
+class _Stop:
+    """
+    Shutdown flag shared with forked workers, set when the supervisor closes
+    its end of a pipe. Unlike an Event it has no lock that a worker killed
+    mid-wait could leave held.
+    """
+
+    def __init__(self):
+        self.reader, self.writer = multiprocessing.Pipe(duplex=False)
+
+    def is_set(self):
+        return self.reader.poll()
+
+    def wait(self, timeout):
+        return self.reader.poll(timeout)
+
+    def set(self):
+        self.writer.close()
+
+
+def _worker(stop, options):
+    # Only the supervisor may set the flag; it also handles Ctrl-C and SIGTERM for the whole pool
+    stop.writer.close()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    work(stop, **options)
+
+
+def serve(processes=2, **options):
+    """
+    Run ``processes`` forked ``work`` loops, restarting any that die, until
+    SIGINT or SIGTERM. Workers finish the task in hand before exiting.
+    """
+    context = multiprocessing.get_context('fork')
+    stop = _Stop()
+    signalled = []
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: signalled.append(signum))
+    # Connections must not be shared with the forked children
+    connections.close_all()
+
+    def start():
+        process = context.Process(target=_worker, args=(stop, options), daemon=True)
+        process.start()
+        return process
+
+    pool = [start() for _ in range(processes)]
+    while not signalled:
+        for i, process in enumerate(pool):
+            if not process.is_alive():
+                logger.warning('Worker %s exited with %s; restarting', process.pid, process.exitcode)
+                pool[i] = start()
+        time.sleep(0.5)
+    stop.set()
+    for process in pool:
+        process.join()
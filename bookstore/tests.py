@@ -1,3 +1,1137 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection
+from django.db.models import F, Sum
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Customer, Author, Publisher, Category, Book, Order, OrderItem, \
+    Purchase, PurchaseItem, DailySales, MonthlyPurchases, LoyaltyEntry, Task, PurchaseDraft
+from . import benchmarks, catalogue, loadtest, loyalty, metrics, reorder, tasks
+from .benchmarks import compare, run_concurrency, run_scale
+from .forms import BookForm
+from .middleware import QueryRecorder
+from .phones import normalize_phone
+from .orders import place_order
+from .purchases import receive_draft
+from .views import named
+from .rollups import rebuild_sales_rollup, rebuild_purchase_rollup, purchase_spend
+from .stock import InsufficientStock, check_low_stock
+
+
+def make_catalogue(user, count, quantity_in_stock=10, price='20.00'):
+    author = Author.objects.create(name='Author')
+    publisher = Publisher.objects.create(name='Publisher', contact_email='pub@example.com',
+                                         phone='000', address='Street')
+    category = Category.objects.create(name='Category')
+    return [
+        Book.objects.create(
+            user=user, title=f'Book {i}', description='', author=author,
+            publisher=publisher, category=category, publication_year=2024,
+            publication_month=1, price=Decimal(price), quantity_in_stock=quantity_in_stock,
+        )
+        for i in range(count)
+    ]
+
+
+class OrderPlacementTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678')
+        self.books = make_catalogue(self.user, 20)
+
+    def test_place_order_creates_items_and_updates_stock(self):
+        order = place_order(self.customer, 'cash', {self.books[0].id: 2, self.books[1].id: 3})
+
+        self.assertEqual(order.total_amount, Decimal('100.00'))
+        self.assertEqual(order.orderitem_set.count(), 2)
+        self.books[0].refresh_from_db()
+        self.books[1].refresh_from_db()
+        self.assertEqual(self.books[0].quantity_in_stock, 8)
+        self.assertEqual(self.books[1].quantity_in_stock, 7)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loyalty_points, 0)
+
+        # Points are earned by the background task
+        tasks.drain()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loyalty_points, 2)
+
+    def test_items_capture_the_price_sold_at(self):
+        order = place_order(self.customer, 'cash', {self.books[0].id: 2})
+        Book.objects.filter(pk=self.books[0].pk).update(price=Decimal('99.00'))
+
+        item = order.orderitem_set.get()
+        self.assertEqual((item.unit_price, item.line_total), (Decimal('20.00'), Decimal('40.00')))
+
+    def test_query_count_does_not_grow_with_basket_size(self):
+        with self.assertNumQueries(7):
+            place_order(self.customer, 'cash', {self.books[0].id: 3})
+        with self.assertNumQueries(7):
+            place_order(self.customer, 'cash', {book.id: 1 for book in self.books})
+
+    def test_insufficient_stock_rolls_back_whole_order(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(self.customer, 'cash', {self.books[0].id: 1, self.books[1].id: 11})
+
+        self.assertEqual(raised.exception.shortages, [
+            {'book_id': self.books[1].id, 'title': 'Book 1', 'requested': 11, 'available': 10},
+        ])
+
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].quantity_in_stock, 10)
+
+    def test_create_order_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('bookstore:create_order'), {
+            'customer-phone': '081-234-5678',
+            'payment-method': 'cash',
+            'book-1': self.books[0].id,
+            'amount-1': '4',
+        })
+
+        self.assertRedirects(response, reverse('bookstore:sales'), fetch_redirect_response=False)
+        self.assertEqual(Order.objects.get().total_amount, Decimal('80.00'))
+
+
+class StockContentionTests(TransactionTestCase):
+    """
+    Fires parallel checkouts at a single hot book and checks that no sale is
+    lost and stock never goes negative. PostgreSQL queues the checkouts on
+    the book's row lock; SQLite has no row locks and fails a transaction
+    that finds the database locked, so there a checkout is retried the way
+    a till would, until it goes through or runs out of stock.
+    """
+    orders = 200
+    workers = 16
+
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678')
+        self.book = make_catalogue(self.user, 1, quantity_in_stock=150)[0]
+
+    def _checkout(self, _):
+        try:
+            while True:
+                try:
+                    place_order(Customer.objects.get(pk=self.customer.pk), 'cash', {self.book.id: 1})
+                    return True
+                except InsufficientStock:
+                    return False
+                except OperationalError as e:
+                    if connection.vendor != 'sqlite' or 'locked' not in str(e):
+                        raise
+                    time.sleep(0.01)
+        finally:
+            connection.close()
+
+    def test_parallel_orders_never_oversell(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(self._checkout, range(self.orders)))
+
+        # Exactly the stock was sold, once each, and every other checkout was turned away
+        self.assertEqual((results.count(True), results.count(False)), (150, 50))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity_in_stock, 0)
+        self.assertEqual(Order.objects.count(), 150)
+        self.assertEqual(sum(OrderItem.objects.values_list('amount', flat=True)), 150)
+        self.assertEqual(Task.objects.count(), 3 * 150)
+
+
+class ListQueryCountTests(TestCase):
+    """
+    The sales and supplier lists must cost the same number of queries
+    however many rows they show.
+    """
+    xhr = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.client.force_login(self.user)
+        self.books = make_catalogue(self.user, 3, quantity_in_stock=1000)
+
+    def add_rows(self, count):
+        start = Customer.objects.count()
+        for i in range(start, start + count):
+            customer = Customer.objects.create(user=self.user, name=f'Customer {i}', phone=f'08{i:08d}')
+            place_order(customer, 'cash', {book.id: 1 for book in self.books})
+            purchase = Purchase.objects.create(total_cost=0)
+            PurchaseItem.objects.bulk_create([
+                PurchaseItem(purchase=purchase, book=book, amount=1, unit_price=book.price)
+                for book in self.books
+            ])
+
+    def count_queries(self, url, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url, **headers):
+        self.add_rows(1)
+        few = self.count_queries(url, **headers)
+        self.add_rows(10)
+        many = self.count_queries(url, **headers)
+        self.assertEqual(few, many)
+
+    def test_sales_page(self):
+        self.assertConstantQueries(reverse('bookstore:sales'))
+
+    def test_sales_json(self):
+        self.assertConstantQueries(reverse('bookstore:sales'), **self.xhr)
+
+    def test_supplier_page(self):
+        self.assertConstantQueries(reverse('bookstore:supplier'))
+
+    def test_supplier_json(self):
+        self.assertConstantQueries(reverse('bookstore:supplier'), **self.xhr)
+
+
+class HistoryPaginationTests(TestCase):
+    xhr = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.client.force_login(self.user)
+        self.customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678')
+        self.book = make_catalogue(self.user, 1, quantity_in_stock=100)[0]
+        self.orders = [place_order(self.customer, 'cash', {self.book.id: 1}) for _ in range(5)]
+
+    def test_cursor_walks_every_order_once(self):
+        seen, cursor = [], ''
+        while True:
+            data = self.client.get(reverse('bookstore:sales'), {'limit': 2, 'cursor': cursor}, **self.xhr).json()
+            seen += [order['id'] for order in data['orders']]
+            cursor = data['next']
+            if not cursor:
+                break
+
+        self.assertEqual(seen, sorted((order.id for order in self.orders), reverse=True))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('bookstore:sales'), {'cursor': 'not-a-cursor'}, **self.xhr)
+        self.assertEqual(response.status_code, 400)
+
+    def test_well_formed_cursor_of_the_wrong_shape(self):
+        # Valid base64 JSON, but not a [str, int] position: [1, 2], ["x"], {"a": 1}, ["x", 1.5], ["soon", 1]
+        for cursor in ['WzEsMl0', 'WyJ4Il0', 'eyJhIjogMX0', 'WyJ4IiwgMS41XQ', 'WyJzb29uIiwgMV0']:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('bookstore:sales'), {'cursor': cursor}, **self.xhr)
+                self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_stream(self):
+        response = self.client.get(reverse('bookstore:sales'), {'format': 'ndjson'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['order_items'], [{'book_title': 'Book 0', 'amount': 1}])
+
+    def test_history_requires_login(self):
+        self.client.logout()
+        for name in ('bookstore:sales', 'bookstore:supplier'):
+            for params in ({}, {'format': 'ndjson'}):
+                with self.subTest(name, **params):
+                    response = self.client.get(reverse(name), params)
+                    self.assertEqual(response.status_code, 302)
+                    self.assertTrue(response['Location'].startswith(reverse('login')))
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678')
+        self.books = make_catalogue(self.user, 2)
+
+    def rollup(self):
+        return list(DailySales.objects.order_by('book_id').values_list('book_id', 'quantity', 'revenue'))
+
+    def test_orders_update_rollup(self):
+        place_order(self.customer, 'cash', {self.books[0].id: 2})
+        place_order(self.customer, 'cash', {self.books[0].id: 1, self.books[1].id: 1})
+        tasks.drain()
+
+        self.assertEqual(self.rollup(), [
+            (self.books[0].id, 3, Decimal('60.00')),
+            (self.books[1].id, 1, Decimal('20.00')),
+        ])
+
+    def test_rebuild_matches_incremental_rollup(self):
+        place_order(self.customer, 'cash', {self.books[0].id: 2, self.books[1].id: 4})
+        tasks.drain()
+        incremental = self.rollup()
+
+        self.assertEqual(rebuild_sales_rollup(), 2)
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_rebuild_counts_queued_orders_once(self):
+        place_order(self.customer, 'cash', {self.books[0].id: 2})
+        tasks.drain()
+        place_order(self.customer, 'cash', {self.books[0].id: 1, self.books[1].id: 3})  # Rollup task still queued
+
+        rebuild_sales_rollup()
+        tasks.drain()
+        self.assertEqual(self.rollup(), [
+            (self.books[0].id, 3, Decimal('60.00')),
+            (self.books[1].id, 3, Decimal('60.00')),
+        ])
+
+    def test_partial_rebuild_leaves_older_queued_orders(self):
+        place_order(self.customer, 'cash', {self.books[0].id: 2})
+
+        rebuild_sales_rollup(since=timezone.localdate() + datetime.timedelta(days=1))
+        tasks.drain()
+        self.assertEqual(self.rollup(), [(self.books[0].id, 2, Decimal('40.00'))])
+
+    def test_rebuild_keeps_revenue_at_the_price_sold(self):
+        place_order(self.customer, 'cash', {self.books[0].id: 2})
+        Book.objects.filter(pk=self.books[0].pk).update(price=Decimal('99.00'))
+
+        rebuild_sales_rollup()
+        self.assertEqual(self.rollup(), [(self.books[0].id, 2, Decimal('40.00'))])
+
+    def test_statistic_page(self):
+        place_order(self.customer, 'cash', {self.books[0].id: 2})
+        tasks.drain()
+        self.client.get(reverse('bookstore:sales_static_page'))  # Warm the catalogue cache
+
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('bookstore:sales_static_page'))
+        self.assertEqual(response.context['monthly_sales']['monthly_revenue'], Decimal('40.00'))
+        self.assertEqual(list(response.context['revenue_by_category']),
+                         [{'category__name': 'Category', 'total_revenue': Decimal('40.00')}])
+
+    def test_statistic_page_rejects_impossible_dates(self):
+        response = self.client.get(reverse('bookstore:sales_static_page'), {'start': '2024-02-30'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PurchaseRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.books = make_catalogue(self.user, 2)
+        self.today = datetime.date.today()
+        for days_ago in (0, 3, 20, 40, 75, 200):
+            purchase = Purchase.objects.create(total_cost=0)
+            Purchase.objects.filter(pk=purchase.pk).update(purchase_date=self.today - datetime.timedelta(days=days_ago))
+            PurchaseItem.objects.create(purchase=purchase, book=self.books[days_ago % 2], amount=days_ago + 1,
+                                        unit_price=Decimal('2.50'))
+        rebuild_purchase_rollup()
+
+    def raw_spend(self, start, end):
+        items = PurchaseItem.objects.filter(purchase__purchase_date__lte=end)
+        if start:
+            items = items.filter(purchase__purchase_date__gte=start)
+        return {
+            row['book__title']: row['total']
+            for row in items.values('book__title').annotate(total=Sum(F('amount') * F('unit_price')))
+        }
+
+    def test_ranges_match_raw_items(self):
+        day = datetime.timedelta(days=1)
+        ranges = [
+            (None, self.today),
+            (self.today - 10 * day, self.today),
+            (self.today - 100 * day, self.today - 30 * day),
+            (self.today - 41 * day, self.today - 39 * day),
+            (self.today.replace(day=1), self.today),
+        ]
+        for start, end in ranges:
+            with self.subTest(start=start, end=end):
+                spend = {row['name']: row['total_spent'] for row in purchase_spend('book', start, end)}
+                self.assertEqual(spend, self.raw_spend(start, end))
+
+    def test_statistic_page_rejects_impossible_dates(self):
+        response = self.client.get(reverse('bookstore:supplier_static_page'), {'end': '2024-13-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_purchase_updates_rollup(self):
+        self.client.post(reverse('bookstore:create_purchase'), {'book-1': self.books[0].id, 'amount-1': '3'})
+
+        row = MonthlyPurchases.objects.get(month=self.today.replace(day=1), book=self.books[0])
+        self.assertEqual(row.quantity, 1 + 3)
+        self.assertEqual(row.spend, Decimal('2.50') + Decimal('60.00'))
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].quantity_in_stock, 13)
+
+
+class BookSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.client.force_login(self.user)
+        books = make_catalogue(self.user, 3)
+        for book, title in zip(books, ['Dune', 'Children of Dune', 'Foundation']):
+            book.title = title
+            book.save()
+        self.author = Author.objects.create(name='Frank Herbert')
+        Book.objects.filter(title__contains='Dune').update(author=self.author)
+        self.author.save()  # Renaming or re-saving an author refreshes its books
+
+    def search(self, query):
+        response = self.client.get(reverse('bookstore:search_books'), {'q': query})
+        return [book['title'] for book in response.json()['results']]
+
+    def test_prefix_match_ranks_title_hits_first(self):
+        self.assertEqual(self.search('dun'), ['Dune', 'Children of Dune'])
+
+    def test_typo_tolerance(self):
+        self.assertEqual(self.search('fundation'), ['Foundation'])
+
+    def test_searches_related_names(self):
+        self.assertEqual(sorted(self.search('herbert children')), ['Children of Dune'])
+
+    def test_index_follows_new_books(self):
+        self.assertEqual(self.search('hyperion'), [])
+        book = Book.objects.get(title='Foundation')
+        book.title = 'Hyperion'
+        book.save()
+        self.assertEqual(self.search('hyperion'), ['Hyperion'])
+
+    def test_only_own_books(self):
+        other = User.objects.create_user('other', password='pass')
+        make_catalogue(other, 1)
+        self.assertEqual(self.search('book'), [])
+
+    def test_results_are_cached_per_normalised_query(self):
+        self.search('Dune')
+        with self.assertNumQueries(2):  # Session and user only
+            response = self.client.get(reverse('bookstore:search_books'), {'q': '  DUNE ', 'token': '7'})
+
+        data = response.json()
+        self.assertEqual(data['token'], '7')
+        self.assertEqual(data['query'], 'dune')
+        self.assertEqual(len(data['results']), 2)
+        self.assertNotIn('search_text', data['results'][0])
+
+    def test_cache_is_invalidated_by_book_changes(self):
+        self.assertEqual(self.search('hyperion'), [])
+        Book.objects.filter(title='Foundation').update(title='Hyperion', search_text='hyperion')
+        self.assertEqual(self.search('hyperion'), [])  # Cached; update() sends no signals
+        Book.objects.get(title='Hyperion').save()
+        self.assertEqual(self.search('hyperion'), ['Hyperion'])
+
+
+class InventoryListingTests(TestCase):
+    xhr = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.client.force_login(self.user)
+        self.books = make_catalogue(self.user, 7)
+        for i, book in enumerate(self.books):
+            book.price = Decimal(10 + i % 3)
+            book.save()
+
+    def test_first_page_query_count_is_independent_of_catalogue_size(self):
+        url = reverse('bookstore:inventory')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url, {'limit': 3})
+        make_catalogue(self.user, 20)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url, {'limit': 3})
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(response.context['books']), 3)
+
+    def test_sorted_pages_cover_every_book_once(self):
+        seen, cursor = [], ''
+        while True:
+            params = {'sort': '-price', 'limit': 2, 'cursor': cursor}
+            data = self.client.get(reverse('bookstore:inventory'), params, **self.xhr).json()
+            seen += [(Decimal(book['price']), book['id']) for book in data['books']]
+            cursor = data['next']
+            if not cursor:
+                break
+
+        self.assertEqual(seen, sorted(((book.price, book.id) for book in self.books), reverse=True))
+
+    def test_unknown_sort_falls_back_to_title(self):
+        response = self.client.get(reverse('bookstore:inventory'), {'sort': 'description'})
+        self.assertEqual(response.context['sort'], 'title')
+
+
+class BookPickerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.client.force_login(self.user)
+        self.books = make_catalogue(self.user, 5)
+
+    def test_pages_of_matching_books(self):
+        url = reverse('bookstore:book_picker')
+        first = self.client.get(url, {'q': 'book', 'limit': 3}).json()
+        second = self.client.get(url, {'q': 'book', 'limit': 3, 'cursor': first['next']}).json()
+
+        self.assertEqual(first['books'][0], [self.books[0].id, 'Book 0', '20.00', 10])
+        self.assertEqual([book[1] for book in first['books'] + second['books']],
+                         ['Book 0', 'Book 1', 'Book 2', 'Book 3', 'Book 4'])
+        self.assertIsNone(second['next'])
+
+    def test_only_the_users_books_are_listed(self):
+        other = User.objects.create_user('other', password='pass')
+        Book.objects.filter(pk=self.books[0].pk).update(user=other)
+
+        titles = [book[1] for book in self.client.get(reverse('bookstore:book_picker')).json()['books']]
+        self.assertEqual(titles, ['Book 1', 'Book 2', 'Book 3', 'Book 4'])
+        # Pages are cached per user
+        self.client.force_login(other)
+        titles = [book[1] for book in self.client.get(reverse('bookstore:book_picker')).json()['books']]
+        self.assertEqual(titles, ['Book 0'])
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('bookstore:book_picker')).status_code, 302)
+
+    def test_forms_do_not_load_the_catalogue(self):
+        for name in ('bookstore:add_order', 'bookstore:add_purchase'):
+            with self.subTest(name), self.assertNumQueries(2):  # Session and user only
+                self.client.get(reverse(name))
+
+
+class CatalogueCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.client.force_login(self.user)
+        self.books = make_catalogue(self.user, 2)
+
+    def test_book_form_choices_are_cached_until_a_write(self):
+        BookForm()
+        with self.assertNumQueries(0):
+            form = BookForm()
+        self.assertIn((self.books[0].author_id, 'Author'), form.fields['author'].choices)
+
+        Author.objects.create(name='Another Author')
+        self.assertIn('Another Author', [label for _, label in BookForm().fields['author'].choices])
+
+    def test_picker_pages_are_invalidated_by_stock_changes(self):
+        url = reverse('bookstore:book_picker')
+        hits = catalogue.stats().get('book-picker', {}).get('hits', 0)
+        self.client.get(url)
+        with self.assertNumQueries(2):  # Session and user only
+            self.client.get(url)
+        self.assertEqual(catalogue.stats()['book-picker']['hits'], hits + 1)
+        self.assertIn(f'bookstore_catalogue_cache_hits_total{{kind="book-picker"}} {hits + 1}', metrics.render())
+
+        customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678')
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(customer, 'cash', {self.books[0].id: 4})
+        self.assertEqual(self.client.get(url).json()['books'][0][3], 6)
+
+
+class CatalogueImportTests(TestCase):
+    CSV = (
+        'title,author,publisher,category,price,quantity_in_stock,publication_year,publication_month,description\n'
+        'Dune,Frank Herbert,Ace,Science Fiction,12.50,4,1965,8,Desert planet\n'
+        'Emma,Jane Austen,Penguin,Classics,9.99,2,1815,12,\n'
+        'Broken,Nobody,Ace,Classics,not a price,1,2000,1,\n'
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.client.force_login(self.user)
+        Author.objects.create(name='Jane Austen')
+
+    def upload(self, name, content):
+        return self.client.post(reverse('bookstore:catalogue_import'), {
+            'file': SimpleUploadedFile(name, content.encode()),
+            'format': '',
+        })
+
+    def test_csv_import_creates_books_and_reports_bad_rows(self):
+        response = self.upload('books.csv', self.CSV)
+        report = response.context['report']
+        self.assertEqual((report['rows'], report['created'], report['updated']), (3, 2, 0))
+        self.assertEqual([error['row'] for error in report['errors']], [3])
+
+        emma = Book.objects.get(title='Emma')
+        self.assertEqual(Author.objects.filter(name='Jane Austen').count(), 1)
+        self.assertEqual(emma.price, Decimal('9.99'))
+        self.assertEqual(emma.search_text, emma.get_search_text())
+        self.assertFalse(Author.objects.filter(name='Nobody').exists())
+
+        results = self.client.get(reverse('bookstore:search_books'), {'q': 'herbert'}).json()['results']
+        self.assertEqual([book['title'] for book in results], ['Dune'])
+
+    def test_jsonl_import_updates_books_with_the_same_title_and_author(self):
+        self.upload('books.csv', self.CSV)
+        line = {'title': 'Dune', 'author': 'Frank Herbert', 'publisher': 'Chilton', 'category': 'Science Fiction',
+                'price': '15.00', 'quantity_in_stock': 7, 'publication_year': 1965, 'publication_month': 8}
+        report = self.upload('books.jsonl', json.dumps(line) + '\n').context['report']
+
+        self.assertEqual((report['created'], report['updated']), (0, 1))
+        dune = Book.objects.get(title='Dune')
+        # Stock of existing books is left to sales and purchases
+        self.assertEqual((dune.price, dune.quantity_in_stock, dune.publisher.name), (Decimal('15.00'), 4, 'Chilton'))
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_malformed_jsonl_lines_are_reported_as_bad_rows(self):
+        line = {'title': 'Dune', 'author': 'Frank Herbert', 'publisher': 'Ace', 'category': 'Science Fiction',
+                'price': '12.50'}
+        content = '\n'.join([json.dumps(line), '{"title": ', '[1, 2]', json.dumps({**line, 'title': 'Emma'})])
+        report = self.upload('books.jsonl', content).context['report']
+
+        self.assertEqual((report['rows'], report['created']), (4, 2))
+        self.assertEqual(report['errors'], [
+            {'row': 2, 'error': 'invalid JSON: Expecting value'},
+            {'row': 3, 'error': 'expected a JSON object'},
+        ])
+
+    def test_duplicate_names_resolve_to_the_oldest(self):
+        oldest = Author.objects.get(name='Jane Austen')
+        Author.objects.create(name='Jane Austen')  # E.g. added by a concurrent import
+        self.upload('books.csv', self.CSV)
+
+        self.assertEqual(Book.objects.get(title='Emma').author, oldest)
+        self.assertEqual(named(Author, 'Jane Austen'), oldest)
+
+    def test_import_without_stock_column_keeps_stock(self):
+        self.upload('books.csv', self.CSV)
+        Book.objects.filter(title='Dune').update(quantity_in_stock=50)
+        self.upload('prices.csv', 'title,author,publisher,category,price\n'
+                                  'Dune,Frank Herbert,Ace,Science Fiction,13.00\n'
+                                  'Solaris,Stanislaw Lem,Ace,Science Fiction,11.00\n')
+
+        self.assertEqual(Book.objects.get(title='Dune').quantity_in_stock, 50)
+        self.assertEqual(Book.objects.get(title='Solaris').quantity_in_stock, 0)
+
+
+class HistoryExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.client.force_login(self.user)
+        self.books = make_catalogue(self.user, 2)
+        customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678')
+        self.old = place_order(customer, 'cash', {self.books[0].id: 1})
+        Order.objects.filter(pk=self.old.pk).update(order_date=datetime.date(2020, 1, 1))
+        self.new = place_order(customer, 'paypal', {self.books[0].id: 2, self.books[1].id: 3})
+
+    def export(self, kind, **params):
+        response = self.client.get(reverse('bookstore:export_history', args=[kind]), params)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_streams_one_row_per_line_in_the_date_range(self):
+        rows = list(csv.reader(io.StringIO(self.export('sales', start='2021-01-01'))))
+        self.assertEqual(rows[0][:2], ['order_id', 'order_date'])
+        self.assertEqual([(int(row[0]), row[7], int(row[8])) for row in rows[1:]],
+                         [(self.new.pk, 'Book 0', 2), (self.new.pk, 'Book 1', 3)])
+
+    def test_columnar_export_groups_values_by_column(self):
+        purchase = Purchase.objects.create(total_cost=Decimal('30.00'))
+        PurchaseItem.objects.create(purchase=purchase, book=self.books[1], amount=3, unit_price=Decimal('10.00'))
+
+        header, batch = [json.loads(line) for line in self.export('purchases', format='columnar').splitlines()]
+        data = dict(zip(header['columns'], batch['data']))
+        self.assertEqual(batch['rows'], 1)
+        self.assertEqual((data['book_title'], data['unit_price']), (['Book 1'], ['10.00']))
+
+    def test_unknown_export_is_rejected(self):
+        response = self.client.get(reverse('bookstore:export_history', args=['customers']))
+        self.assertEqual(response.status_code, 404)
+
+
+class SeedBookstoreTests(TestCase):
+    def seed(self, username, seed=3):
+        call_command(
+            'seed_bookstore', user=username, seed=seed, end='2024-06-30', days=60, authors=5, publishers=3,
+            categories=4, books=30, customers=20, orders=300, purchases=10, batch_size=50, stdout=io.StringIO(),
+        )
+        return list(OrderItem.objects.filter(order__customer__user__username=username).order_by('pk')
+                    .values_list('order__order_date', 'order__customer__phone', 'book__title', 'amount'))
+
+    def test_seeding_is_deterministic_and_skewed(self):
+        items = self.seed('first')
+        self.assertEqual(items, self.seed('second'))
+        self.assertNotEqual(items, self.seed('third', seed=4))
+
+        orders = Order.objects.filter(customer__user__username='first')
+        self.assertEqual(orders.count(), 300)
+        dates = {date for date, *_ in items}
+        self.assertEqual((min(dates) >= datetime.date(2024, 5, 2), max(dates)), (True, datetime.date(2024, 6, 30)))
+
+        sold = sorted(OrderItem.objects.filter(order__in=orders).values('book_id')
+                      .annotate(total=Sum('amount')).values_list('total', flat=True), reverse=True)
+        self.assertGreater(sold[0], 4 * sold[len(sold) // 2])
+        self.assertEqual(Purchase.objects.count(), 30)
+
+
+class EndpointBenchmarkTests(TestCase):
+    def test_every_scenario_runs_against_a_small_data_set(self):
+        user = User.objects.create_user('benchmark')
+        volumes = {'authors': 5, 'publishers': 3, 'books': 60, 'customers': 10, 'orders': 50, 'purchases': 5}
+        results = run_scale(user, volumes, repeat=2)
+
+        self.assertEqual(set(results), set(benchmarks.scenarios()))
+        self.assertEqual({name for name, summary in results.items() if summary['status'] >= 400}, set())
+        self.assertEqual(compare({'tiny': results}, {'tiny': results}), [])
+
+    def test_compare_flags_extra_queries_and_slower_responses(self):
+        baseline = {'small': {'search_books': {'status': 200, 'p50_ms': 10.0, 'p95_ms': 20.0,
+                                               'queries': 3, 'peak_kb': 100.0}}}
+        current = {'small': {'search_books': {'status': 200, 'p50_ms': 14.0, 'p95_ms': 40.0,
+                                              'queries': 4, 'peak_kb': 120.0}}}
+        regressions = compare(current, baseline)
+        self.assertEqual([line.split(':')[1].split()[0] for line in regressions], ['queries'])
+        regressions = compare(current, baseline, resources=True)
+        self.assertEqual([line.split(':')[1].split()[0] for line in regressions], ['queries', 'p95_ms'])
+
+    def test_benchmarks_leave_the_site_cache_alone(self):
+        cache.set('warm', 1)
+        user = User.objects.create_user('benchmark')
+        run_scale(user, {'books': 5, 'customers': 2, 'orders': 5, 'purchases': 1}, repeat=1, only=['book_picker'])
+
+        self.assertEqual(cache.get('warm'), 1)
+
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.books = make_catalogue(self.user, 3)
+        self.customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678')
+        place_order(self.customer, 'cash', {self.books[0].id: 1})
+
+    async def test_json_endpoints_are_served_by_async_views(self):
+        await self.async_client.aforce_login(self.user)
+        xhr = {'X-Requested-With': 'XMLHttpRequest'}
+
+        response = await self.async_client.get(reverse('bookstore:search_books'), {'q': 'book 1'})
+        self.assertEqual(response.json()['results'][0]['title'], 'Book 1')
+        response = await self.async_client.get(reverse('bookstore:customer_lookup'), {'phone': '0812345678'})
+        self.assertEqual(response.json()['customer']['name'], 'Alice')
+        response = await self.async_client.get(reverse('bookstore:sales'), headers=xhr)
+        self.assertEqual(response.json()['orders'][0]['customer_name'], 'Alice')
+        response = await self.async_client.get(reverse('bookstore:supplier'), {'cursor': '!'}, headers=xhr)
+        self.assertEqual(response.status_code, 400)
+        # The page itself is still rendered by the sync ListView
+        response = await self.async_client.get(reverse('bookstore:sales'))
+        self.assertContains(response, 'Alice')
+
+    async def test_history_keeps_streaming_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('bookstore:sales'), {'format': 'ndjson'})
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual([json.loads(line)['customer_name'] for line in lines], ['Alice'])
+
+    async def test_history_requires_login_under_asgi(self):
+        response = await self.async_client.get(reverse('bookstore:sales'), {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 302)
+
+
+class ConcurrencyBenchmarkTests(TransactionTestCase):
+    def test_wsgi_and_asgi_serve_the_same_requests(self):
+        user = User.objects.create_user('benchmark')
+        make_catalogue(user, 5)
+        Customer.objects.create(user=user, name='Alice', phone='0812345678')
+
+        results = run_concurrency(user, count=8, concurrency=4, threads=2, db_latency_ms=1)
+        self.assertEqual([(summary['mode'], summary['requests'], summary['errors']) for summary in results],
+                         [('wsgi', 8, 0), ('asgi', 8, 0)])
+
+
+class LoadTestTests(TestCase):
+    def test_requests_replay_against_the_users_data(self):
+        user = User.objects.create_user('benchmark')
+        make_catalogue(user, 5)
+        Customer.objects.create(user=user, name='Alice', phone='0812345678')
+
+        requests = loadtest.request_mix(user, count=8)
+        cookie = loadtest.session_cookie(user)
+        self.client.cookies.load(cookie)
+        for path, headers in requests:
+            self.assertEqual(self.client.get(path, headers=headers).status_code, 200, path)
+
+    def test_throughput_must_grow_with_workers(self):
+        results = {1: {'rps': 100.0}, 2: {'rps': 190.0}, 4: {'rps': 300.0}}
+        self.assertEqual(loadtest.scaling_shortfalls(results, 0.6), [])
+        self.assertEqual(loadtest.scaling_shortfalls(results, 0.8),
+                         ['4 workers: 300.0 req/s, expected at least 320.0'])
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.client.force_login(self.user)
+        make_catalogue(self.user, 3)
+
+    def test_requests_are_recorded_per_view(self):
+        before = metrics.QUERY_COUNT.series.get('bookstore:search_books', {}).get('count', 0)
+        self.client.get(reverse('bookstore:search_books'), {'q': 'book'})
+        self.assertEqual(metrics.QUERY_COUNT.series['bookstore:search_books']['count'], before + 1)
+
+        body = self.client.get(reverse('bookstore:metrics')).content.decode()
+        self.assertIn('# TYPE bookstore_request_duration_seconds histogram', body)
+        self.assertIn('bookstore_request_queries_bucket{view="bookstore:search_books",le="+Inf"}', body)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_logged_with_their_view(self):
+        with self.assertLogs('bookstore.sql', 'WARNING') as logs:
+            self.client.get(reverse('bookstore:inventory'))
+        self.assertIn('Slow query in bookstore:inventory', logs.output[0])
+
+    def test_repeated_query_shapes_are_fingerprinted_together(self):
+        recorder = QueryRecorder(slow_threshold=60)
+        for sql in ('SELECT * FROM book WHERE id = %s', 'SELECT * FROM book WHERE id = %s',
+                    'SELECT * FROM book WHERE id IN (%s, %s)', 'SELECT * FROM book WHERE id IN (%s)',
+                    'SELECT * FROM author'):
+            recorder(lambda *args: None, sql, (), False, {})
+        self.assertEqual(recorder.duplicates, {
+            'SELECT * FROM book WHERE id = %s': 2,
+            'SELECT * FROM book WHERE id IN (...)': 2,
+        })
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_metrics_are_internal(self):
+        self.assertEqual(self.client.get(reverse('bookstore:metrics')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('bookstore:metrics')).status_code, 200)
+
+
+class PurchaseReceivingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.books = make_catalogue(self.user, 30, quantity_in_stock=5)
+
+    def post(self, lines):
+        data = {}
+        for i, (book_id, amount) in enumerate(lines, 1):
+            data[f'book-{i}'], data[f'amount-{i}'] = book_id, amount
+        return self.client.post(reverse('bookstore:create_purchase'), data)
+
+    def test_query_count_does_not_grow_with_the_note(self):
+        with CaptureQueriesContext(connection) as small:
+            self.post([(self.books[0].id, 2)])
+        with CaptureQueriesContext(connection) as large:
+            response = self.post([(book.id, 2) for book in self.books])
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).quantity_in_stock, 5 + 2 + 2)
+        self.assertEqual(Purchase.objects.latest('pk').total_cost, Decimal('20.00') * 2 * 30)
+
+    def test_invalid_lines_are_all_reported_and_nothing_is_saved(self):
+        response = self.post([(self.books[0].id, 3), (999999, 1), (self.books[1].id, 'two'), (self.books[2].id, 0)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([(line['line'], line['error']) for line in response.json()['lines']], [
+            ('2', 'Unknown book.'),
+            ('3', 'Book and amount must be whole numbers.'),
+            ('4', 'Amount must be positive.'),
+        ])
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).quantity_in_stock, 5)
+
+    def test_lines_for_the_same_book_are_merged(self):
+        self.post([(self.books[0].id, 2), (self.books[0].id, 3)])
+        self.assertEqual(PurchaseItem.objects.get().amount, 5)
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).quantity_in_stock, 10)
+
+
+class CustomerLookupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.other = User.objects.create_user('other', password='pass')
+        self.client.force_login(self.user)
+        self.customer = Customer.objects.create(user=self.user, name='Alice', phone='081 234 5678',
+                                                loyalty_points=120)
+        Customer.objects.create(user=self.other, name='Bob', phone='0812345678')
+
+    def lookup(self, phone):
+        return self.client.get(reverse('bookstore:customer_lookup'), {'phone': phone})
+
+    def test_normalize_phone(self):
+        self.assertEqual(normalize_phone('081-234-5678'), '+66812345678')
+        self.assertEqual(normalize_phone('+44 20 7946 0958'), '+442079460958')
+        self.assertEqual(normalize_phone('0044 20 7946 0958'), '+442079460958')
+        self.assertIsNone(normalize_phone('12ab'))
+
+    def test_lookup_is_scoped_to_the_store_and_cached(self):
+        response = self.lookup('+66 81 234 5678')
+        self.assertEqual(response.json()['customer'], {
+            'id': self.customer.id, 'name': 'Alice', 'loyalty_points': 120, 'phone': '+66812345678',
+        })
+        with self.assertNumQueries(2):  # Session and user only
+            self.assertEqual(self.lookup('0812345678').json()['customer']['name'], 'Alice')
+
+    def test_saving_a_customer_evicts_the_cached_lookup(self):
+        self.lookup('0812345678')
+        self.client.post(reverse('bookstore:customer_edit', args=[self.customer.pk]), {
+            'name': 'Alice', 'phone': '0899999999', 'loyalty_points': 5,
+        })
+        self.assertEqual(self.lookup('0812345678').status_code, 404)
+        self.assertEqual(self.lookup('0899999999').json()['customer']['loyalty_points'], 5)
+
+    def test_duplicate_phone_is_a_form_error(self):
+        response = self.client.post(reverse('bookstore:customer_create'), {
+            'name': 'Alice Again', 'phone': '+66812345678', 'loyalty_points': 0,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('phone', response.context['form'].errors)
+        self.assertEqual(Customer.objects.filter(user=self.user).count(), 1)
+
+
+class LoyaltyLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678',
+                                                loyalty_points=120)
+        LoyaltyEntry.objects.create(customer=self.customer, kind=LoyaltyEntry.OPENING, points=120)
+        self.books = make_catalogue(self.user, 2, price='100.00')
+
+    def test_checkout_records_redemption_and_accrual(self):
+        order = place_order(self.customer, 'cash', {self.books[0].id: 1})
+        tasks.drain()
+
+        self.assertEqual(order.total_amount, Decimal('90.00'))
+        self.assertEqual(
+            list(order.loyaltyentry_set.order_by('pk').values_list('kind', 'points')),
+            [(LoyaltyEntry.REDEMPTION, -100), (LoyaltyEntry.ACCRUAL, 1)],
+        )
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loyalty_points, 21)
+        self.assertEqual(loyalty.recompute(), [])
+
+    def test_stale_balance_cannot_redeem_twice(self):
+        stale = Customer.objects.get(pk=self.customer.pk)
+        place_order(self.customer, 'cash', {self.books[0].id: 1})
+        tasks.drain()
+
+        # The second till still sees 120 points, but only 21 are left
+        order = place_order(stale, 'cash', {self.books[1].id: 1})
+        tasks.drain()
+
+        self.assertEqual(order.total_amount, Decimal('100.00'))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loyalty_points, 23)
+        self.assertEqual(loyalty.recompute(), [])
+
+    def test_tenure_tier_is_cached_until_the_anniversary(self):
+        today = datetime.date(2026, 6, 1)
+        self.customer.join_date = datetime.date(2023, 7, 15)
+
+        years, changes = loyalty.tenure(self.customer, today)
+        self.assertEqual((years, changes), (2, {'tenure_years': 2, 'tenure_until': datetime.date(2026, 7, 15)}))
+        self.customer.tenure_years, self.customer.tenure_until = 2, changes['tenure_until']
+        self.assertEqual(loyalty.tenure(self.customer, datetime.date(2026, 7, 14)), (2, {}))
+        self.assertEqual(loyalty.tenure(self.customer, datetime.date(2026, 7, 15))[0], 3)
+
+    def edit(self, **data):
+        self.client.login(username='clerk', password='pass')
+        return self.client.post(reverse('bookstore:customer_edit', args=[self.customer.pk]), {
+            'name': 'Alice', 'phone': '0812345678', 'loyalty_points': 120, 'shown_points': 120, **data,
+        })
+
+    def ledger(self):
+        return list(self.customer.loyaltyentry_set.order_by('pk').values_list('kind', 'points'))
+
+    def test_edit_keeps_points_added_since_the_form_was_shown(self):
+        # An accrual task runs after the clerk opened the form showing 120 points
+        Customer.objects.filter(pk=self.customer.pk).update(loyalty_points=F('loyalty_points') + 5)
+        LoyaltyEntry.objects.create(customer=self.customer, kind=LoyaltyEntry.ACCRUAL, points=5)
+
+        self.edit(name='Alice Smith')
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.name, self.customer.loyalty_points), ('Alice Smith', 125))
+        self.assertEqual(self.ledger(), [(LoyaltyEntry.OPENING, 120), (LoyaltyEntry.ACCRUAL, 5)])
+
+    def test_edit_applies_the_clerks_change_as_an_adjustment(self):
+        Customer.objects.filter(pk=self.customer.pk).update(loyalty_points=F('loyalty_points') + 5)
+        LoyaltyEntry.objects.create(customer=self.customer, kind=LoyaltyEntry.ACCRUAL, points=5)
+
+        self.edit(loyalty_points=100)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loyalty_points, 105)
+        self.assertEqual(self.ledger()[-1], (LoyaltyEntry.ADJUSTMENT, -20))
+        self.assertEqual(loyalty.recompute(), [])
+
+    def test_edit_cannot_take_the_balance_below_zero(self):
+        Customer.objects.filter(pk=self.customer.pk).update(loyalty_points=10)
+
+        response = self.edit(name='Alice Smith', loyalty_points=0)
+        self.assertEqual(response.status_code, 200)
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.name, self.customer.loyalty_points), ('Alice', 10))
+
+    def test_recompute_reports_and_fixes_drift(self):
+        Customer.objects.filter(pk=self.customer.pk).update(loyalty_points=500)
+
+        out = io.StringIO()
+        call_command('recompute_loyalty', stdout=out)
+        self.assertIn(f'Customer {self.customer.pk}: balance 500, ledger 120', out.getvalue())
+
+        call_command('recompute_loyalty', '--fix', stdout=io.StringIO())
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loyalty_points, 120)
+
+
+calls = []
+
+
+def record_call(value):
+    calls.append(value)
+    Author.objects.create(name=value)
+
+
+def fail_task():
+    raise RuntimeError('boom')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678')
+        self.books = make_catalogue(self.user, 2, quantity_in_stock=8)
+
+    def test_checkout_queues_follow_ups_once_per_order(self):
+        order = place_order(self.customer, 'cash', {self.books[0].id: 3})
+        tasks.defer(tasks.call(loyalty.accrue_points, key=f'loyalty:{order.pk}', order_id=order.pk))
+
+        self.assertEqual(sorted(Task.objects.values_list('name', flat=True)), [
+            'bookstore.loyalty.accrue_points', 'bookstore.rollups.record_sales', 'bookstore.stock.check_low_stock',
+        ])
+        with self.assertLogs('bookstore.stock', 'WARNING') as logs:
+            tasks.drain()
+        self.assertEqual(logs.output,
+                         [f'WARNING:bookstore.stock:Low stock: Book 0 (book {self.books[0].pk}) has 5 left'])
+        self.assertEqual(set(Task.objects.values_list('status', flat=True)), {Task.DONE})
+
+        # Accrual is safe to run again
+        loyalty.accrue_points(order.pk)
+        self.assertEqual(order.loyaltyentry_set.count(), 1)
+        self.assertEqual(loyalty.recompute(), [])
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        tasks.defer(tasks.call(fail_task, max_attempts=2))
+
+        with self.assertLogs('bookstore.tasks', 'WARNING'):
+            self.assertEqual(tasks.run_pending(), 1)
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.PENDING, 1))
+        self.assertIn('RuntimeError: boom', task.last_error)
+        self.assertEqual(tasks.run_pending(), 0)  # Not due yet
+
+        Task.objects.update(run_after=task.created_at)
+        with self.assertLogs('bookstore.tasks', 'ERROR'):
+            tasks.drain()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+
+    def test_task_taken_over_after_its_lease_is_rolled_back(self):
+        tasks.defer(tasks.call(record_call, value='first'))
+        [task] = tasks.claim(lease=-1)  # The lease has already run out
+
+        [takeover] = tasks.claim()
+        self.assertTrue(tasks.run(takeover))
+        with self.assertLogs('bookstore.tasks', 'WARNING'):
+            self.assertFalse(tasks.run(task))
+
+        self.assertEqual(calls, ['first', 'first'])
+        self.assertEqual(list(Author.objects.filter(name='first').values_list('name', flat=True)), ['first'])
+        self.assertEqual(Task.objects.get().attempts, 2)
+
+    def test_run_workers_once_drains_the_queue(self):
+        place_order(self.customer, 'cash', {self.books[1].id: 1})
+        out = io.StringIO()
+        call_command('run_workers', '--once', stdout=out)
+
+        self.assertIn('0 task(s) waiting to retry, 0 failed', out.getvalue())
+        self.assertEqual(DailySales.objects.get().quantity, 1)
+
+
+class ReorderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', password='pass')
+        self.books = make_catalogue(self.user, 3)
+        self.other = Publisher.objects.create(name='Other', contact_email='other@example.com', phone='1',
+                                              address='Road')
+        Book.objects.filter(pk=self.books[2].pk).update(publisher=self.other)
+        self.today = datetime.date(2026, 3, 1)
+
+    def sell(self, book, days_ago, quantity):
+        book.refresh_from_db()
+        DailySales.objects.create(date=self.today - datetime.timedelta(days=days_ago), book=book,
+                                  category_id=book.category_id, publisher_id=book.publisher_id,
+                                  quantity=quantity, revenue=quantity * book.price)
+
+    def reorder_points(self):
+        return list(Book.objects.order_by('pk').values_list('recent_sales', 'reorder_point'))
+
+    def test_incremental_update_matches_rebuild(self):
+        self.sell(self.books[0], 30, 28)  # Before the window
+        self.sell(self.books[0], 5, 56)
+        self.sell(self.books[1], 1, 10)
+        self.assertEqual(reorder.update_reorder_points(self.today - datetime.timedelta(days=1)), 3)
+        # 21 days of lead time and safety stock at 2 and 10/28 copies a day, rounded up
+        self.assertEqual(self.reorder_points(), [(56, 42), (10, 8), (0, 0)])
+
+        self.sell(self.books[1], 0, 18)
+        self.sell(self.books[2], -10, 4)
+        through = self.today + datetime.timedelta(days=23)  # The sales 5 days ago have left the window
+        with self.assertNumQueries(6):
+            self.assertEqual(reorder.update_reorder_points(through), 3)
+        incremental = self.reorder_points()
+        self.assertEqual(incremental, [(0, 0), (28, 21), (4, 3)])
+        self.assertEqual(reorder.update_reorder_points(through), 0)
+
+        reorder.update_reorder_points(through, rebuild=True)
+        self.assertEqual(self.reorder_points(), incremental)
+
+    def test_waits_for_queued_rollup_updates(self):
+        customer = Customer.objects.create(user=self.user, name='Alice', phone='0812345678')
+        place_order(customer, 'cash', {self.books[0].id: 1})
+        today = timezone.localdate()
+        Task.objects.update(created_at=timezone.now() - datetime.timedelta(days=3))
+
+        self.assertEqual(reorder.last_complete_day(), today - datetime.timedelta(days=4))
+        tasks.drain()
+        self.assertEqual(reorder.last_complete_day(), today - datetime.timedelta(days=1))
+
+    def test_drafts_restock_books_at_their_reorder_point_per_publisher(self):
+        Book.objects.filter(pk=self.books[0].pk).update(quantity_in_stock=8)
+        for book in self.books:
+            self.sell(book, 1, 10)
+        reorder.update_reorder_points(self.today - datetime.timedelta(days=1))  # Reorder at 8 copies
+        Book.objects.filter(pk=self.books[2].pk).update(quantity_in_stock=2)
+
+        drafts = reorder.suggest_purchases(self.user)
+        self.assertEqual(
+            [(draft.publisher.name, draft.total_cost,
+              list(draft.purchasedraftitem_set.values_list('book__title', 'amount'))) for draft in drafts],
+            # Up to 35 days of sales (13 copies), at the list price
+            [('Publisher', Decimal('100.00'), [('Book 0', 5)]), ('Other', Decimal('220.00'), [('Book 2', 11)])],
+        )
+        with self.assertLogs('bookstore.stock', 'WARNING') as logs:
+            check_low_stock([book.pk for book in self.books])
+        self.assertEqual(len(logs.output), 2)
+
+        # Drafts are replaced on every run
+        self.assertEqual(len(reorder.suggest_purchases(self.user)), 2)
+        self.assertEqual(PurchaseDraft.objects.count(), 2)
+
+        purchase = receive_draft(PurchaseDraft.objects.get(publisher=self.other))
+        self.assertEqual(purchase.total_cost, Decimal('220.00'))
+        self.books[2].refresh_from_db()
+        self.assertEqual(self.books[2].quantity_in_stock, 13)
+        self.assertEqual(PurchaseDraft.objects.count(), 1)
+
+    def test_command(self):
+        self.sell(self.books[0], 1, 40)
+        out = io.StringIO()
+        call_command('update_reorder_points', '--through', str(self.today - datetime.timedelta(days=1)),
+                     '--suggest', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), [
+            'Updated the reorder points of 3 book(s).',
+            'Suggested 1 purchase(s) with 1 line(s).',
+        ])
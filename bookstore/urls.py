@@ -8,8 +8,10 @@ urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
     path('signup/', views.SignUpView.as_view(), name='signup'),
     path('search-books/', views.search_books, name='search_books'),
+    path('books/picker/', views.BookPickerView.as_view(), name='book_picker'),
     path('inventory/', views.InventoryView.as_view(), name='inventory'),
     path('inventory/create/', views.BookCreateView.as_view(), name='book_create'),
+    path('inventory/import/', views.CatalogueImportView.as_view(), name='catalogue_import'),
     path('inventory/<int:pk>/edit/', views.BookUpdateView.as_view(), name='book_edit'),
     path('inventory/<int:pk>/delete/', views.BookDeleteView.as_view(), name='book_delete'),
     path('sales/', views.SalesView.as_view(), name='sales'),
@@ -26,5 +28,7 @@ urlpatterns = [
          name='add_purchase'),
     path('supplier/create/', views.create_purchase, name='create_purchase'),
     path('supplier/static/', views.supplier_statistic_page, name='supplier_static_page'),
+    path('export/<str:kind>/', views.export_history, name='export_history'),
+    path('metrics/', views.metrics_view, name='metrics'),
 
 ]
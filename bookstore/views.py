@@ -1,18 +1,67 @@
-from django.db.models import Sum, F
+import asyncio
+import csv
+import io
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum, Prefetch
 from django.utils import timezone
-from decimal import Decimal
-from django.db import models
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.utils.dateparse import parse_date
-from django.views.generic import TemplateView, CreateView, UpdateView, DeleteView, ListView
+from django.views.generic import View, TemplateView, CreateView, UpdateView, DeleteView, ListView, FormView
 from .models import Customer, Book, Author, Publisher, Category, Order, \
-    OrderItem, Purchase, PurchaseItem
-from .forms import BookForm, OrderForm, PurchaseForm
+    OrderItem, Purchase, PurchaseItem, DailySales, LoyaltyEntry
+from .forms import BookForm, OrderForm, PurchaseForm, CatalogueImportForm, CustomerForm
+from .importer import CatalogueImporter, guess_format, iter_records
+from .pagination import InvalidCursor, KeysetPaginationMixin
+from .orders import parse_order_lines, place_order
+from .purchases import InvalidPurchase, parse_purchase_lines, receive_purchase
+from . import catalogue, customers, exports, loyalty, metrics, search
+from .rollups import purchase_spend
+from .stock import InsufficientStock
+
+
+def streaming_response(request, content, batch_size=500, **kwargs):
+    """
+    ``StreamingHttpResponse`` over the sync iterator ``content`` that keeps
+    streaming when served over ASGI. Django would otherwise read the whole
+    iterator into memory first; here it is drained ``batch_size`` parts at a
+    time on the request's database thread.
+    """
+    if isinstance(request, ASGIRequest):
+        content = aiter_batches(iter(content), batch_size)
+    return StreamingHttpResponse(content, **kwargs)
+
+
+async def aiter_batches(iterator, batch_size):
+    next_batch = sync_to_async(lambda: list(islice(iterator, batch_size)))
+    while batch := await next_batch():
+        for part in batch:
+            yield part
+
+
+def ndjson_response(request, serialize, queryset, chunk_size=500):
+    """
+    Stream ``queryset`` as newline-delimited JSON, one serialized row per
+    line. Rows are fetched ``chunk_size`` at a time so memory stays flat
+    however long the history is.
+    """
+    rows = (
+        json.dumps(serialize(row), cls=DjangoJSONEncoder) + '\n'
+        for row in queryset.iterator(chunk_size=chunk_size)
+    )
+    return streaming_response(request, rows, chunk_size, content_type='application/x-ndjson')
 
 
 class SignUpView(CreateView):
@@ -27,33 +76,134 @@ class HomeView(TemplateView):
     template_name = 'bookstore/home.html'
 
 
-class InventoryView(LoginRequiredMixin, TemplateView):
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """
+    LoginRequiredMixin for views whose handlers are async. The user is
+    loaded with ``auser()`` first, so checking it never queries the
+    database from the event loop.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        response = super().dispatch(request, *args, **kwargs)
+        return await response if asyncio.iscoroutine(response) else response
+
+
+class InventoryView(LoginRequiredMixin, KeysetPaginationMixin, TemplateView):
     """
-    Renders the inventory management page.
+    Renders the inventory management page one page of books at a time.
+    ``?sort=<column>`` (prefix ``-`` for descending) orders the table and
+    XHR requests with a ``cursor`` return the following page as JSON for
+    infinite scrolling.
     """
     template_name = "bookstore/inventory.html"
+    page_size = 50
+    sort_fields = ('title', 'author__name', 'publisher__name', 'category__name', 'price', 'quantity_in_stock')
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort', 'title')
+        return sort if sort.lstrip('-') in self.sort_fields else 'title'
+
+    def get_keyset(self):
+        sort = self.get_sort()
+        return sort.lstrip('-'), sort.startswith('-')
+
+    def get_queryset(self):
+        # Filter books by the logged-in user, loading only the columns the table shows
+        return Book.objects.filter(user=self.request.user) \
+            .select_related('author', 'publisher', 'category') \
+            .only('title', 'price', 'quantity_in_stock', 'author__name', 'publisher__name', 'category__name')
+
+    @staticmethod
+    def serialize(book):
+        return {
+            'id': book.id,
+            'title': book.title,
+            'author__name': book.author.name,
+            'publisher__name': book.publisher.name,
+            'category__name': book.category.name,
+            'price': book.price,
+            'quantity_in_stock': book.quantity_in_stock,
+        }
+
+    def get(self, request, *args, **kwargs):
+        try:
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                books, next_cursor = self.paginate_keyset(self.get_queryset())
+                return JsonResponse({
+                    'books': [self.serialize(book) for book in books],
+                    'next': next_cursor,
+                })
+            return super().get(request, *args, **kwargs)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Filter books by the logged-in user
-        context['books'] = Book.objects.filter(user=self.request.user)
+        context['books'], context['next_cursor'] = self.paginate_keyset(self.get_queryset())
+        context['sort'] = self.get_sort()
         return context
 
 
 @login_required
-def search_books(request):
-    query = request.GET.get('q', '').strip()
-
-    if query:
-        books = Book.objects.filter(
-            title__icontains=query,
-            user=request.user  # Filter by the logged-in user
-        ).values('id', 'title', 'author__name', 'publisher__name', 'category__name', 'price', 'quantity_in_stock')[:10]
-    else:
-        # If no query, return all books
-        books = Book.objects.filter(user=request.user).values('id', 'title', 'author__name', 'publisher__name', 'category__name', 'price', 'quantity_in_stock')[:10]
+async def search_books(request):
+    query = search.normalize_query(request.GET.get('q', ''))
+    limit = 10
+
+    # Ranked search over title, author, publisher, category and description,
+    # limited to the logged-in user's books
+    books = await search.cached_search_books(await request.auser(), query, limit)
+
+    return JsonResponse({
+        # Echo the client's request token so it can drop superseded responses
+        'token': request.GET.get('token'),
+        'query': query,
+        'results': books,
+    })
+
+class BookPickerView(LoginRequiredMixin, KeysetPaginationMixin, View):
+    """
+    Typeahead source for the book selects of the order and purchase forms.
+    Returns pages of ``[id, title, price, quantity_in_stock]`` rows of the
+    user's books ordered by title, optionally filtered by ``q``, so the
+    forms never need the full catalogue up front.
+    """
+    keyset_field = 'title'
+    keyset_descending = False
+    page_size = 20
+    max_page_size = 100
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '').strip()
+        try:
+            # Pages are cached until a book is edited or its stock changes
+            page = catalogue.get_or_build(
+                'book-picker', [Book], lambda: self.get_page(query),
+                request.user.pk, query.lower(), request.GET.get('cursor', ''), self.get_page_size(),
+            )
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(page)
+
+    def get_page(self, query):
+        books = Book.objects.filter(user=self.request.user).only('title', 'price', 'quantity_in_stock')
+        if query:
+            books = books.filter(title__icontains=query)
+        books, next_cursor = self.paginate_keyset(books)
+        return {
+            'books': [[book.id, book.title, book.price, book.quantity_in_stock] for book in books],
+            'next': next_cursor,
+        }
+
+
+def named(model, name):
+    """
+    Return the oldest author, publisher or category called ``name``,
+    creating it if there is none. Names are not unique (concurrent imports
+    can add the same one twice), so this never uses ``get``.
+    """
+    return model.objects.filter(name=name).order_by('pk').first() or model.objects.create(name=name)
 
-    return JsonResponse(list(books), safe=False)
 
 class BookCreateView(LoginRequiredMixin, CreateView):
     """
@@ -70,27 +220,46 @@ class BookCreateView(LoginRequiredMixin, CreateView):
 
         # Handle Author
         if form.cleaned_data['new_author']:
-            author, _ = Author.objects.get_or_create(name=form.cleaned_data['new_author'])
+            author = named(Author, form.cleaned_data['new_author'])
         else:
             author = form.cleaned_data['author']
         form.instance.author = author
 
         # Handle Publisher
         if form.cleaned_data['new_publisher']:
-            publisher, _ = Publisher.objects.get_or_create(name=form.cleaned_data['new_publisher'])
+            publisher = named(Publisher, form.cleaned_data['new_publisher'])
         else:
             publisher = form.cleaned_data['publisher']
         form.instance.publisher = publisher
 
         # Handle Category
         if form.cleaned_data['new_category']:
-            category, _ = Category.objects.get_or_create(name=form.cleaned_data['new_category'])
+            category = named(Category, form.cleaned_data['new_category'])
         else:
             category = form.cleaned_data['category']
         form.instance.category = category
 
         return super().form_valid(form)
 
+class CatalogueImportView(LoginRequiredMixin, FormView):
+    """
+    Upload a CSV or JSON Lines catalogue feed into the logged-in user's
+    inventory. The file is parsed as a stream and loaded in batches.
+    """
+    form_class = CatalogueImportForm
+    template_name = "bookstore/catalogue_import.html"
+
+    def form_valid(self, form):
+        upload = form.cleaned_data['file']
+        fmt = form.cleaned_data['format'] or guess_format(upload.name)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        try:
+            report = CatalogueImporter(self.request.user).run(iter_records(stream, fmt))
+        except (ValueError, csv.Error) as e:
+            form.add_error('file', f'Could not read the file: {e}')
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, report=report.as_dict()))
+
 class BookUpdateView(LoginRequiredMixin, UpdateView):
     """
     View to update book details.
@@ -116,17 +285,26 @@ class BookDeleteView(LoginRequiredMixin, DeleteView):
         # Ensure users can only delete their own books
         return Book.objects.filter(user=self.request.user)
 
-class SalesView(ListView):
+class SalesView(AsyncLoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
-    Displays a list of orders and supports filtering by date.
+    Displays a list of orders, newest first, and supports filtering by date.
+    Results are paged with a ``cursor`` token; ``?format=ndjson`` streams
+    the whole history instead.
     """
     model = Order
+    keyset_field = 'order_date'
     template_name = "bookstore/sales.html"
     context_object_name = 'orders'
 
     def get_queryset(self):
-        # Get all orders
-        queryset = super().get_queryset()
+        # Get all orders with their customer and items in a fixed number of queries
+        queryset = super().get_queryset() \
+            .select_related('customer') \
+            .only('id', 'order_date', 'payment_method', 'total_amount', 'customer__name') \
+            .prefetch_related(Prefetch(
+                'orderitem_set',
+                queryset=OrderItem.objects.select_related('book').only('order_id', 'amount', 'book__title'),
+            ))
 
         # Check if a date filter is provided
         date_filter = self.request.GET.get('date')
@@ -137,59 +315,112 @@ class SalesView(ListView):
 
         return queryset
 
-    def get(self, request, *args, **kwargs):
-        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            # Handle AJAX requests
-            date_filter = request.GET.get('date')
-            queryset = self.get_queryset()
-            data = {
-                'orders': [
-                    {
-                        'id': order.id,
-                        'customer_name': order.customer.name,
-                        'order_date': order.order_date.strftime('%Y-%m-%d'),
-                        'payment_method': order.payment_method,
-                        'total_amount': order.total_amount,
-                        'order_items': [
-                            {
-                                'book_title': item.book.title,
-                                'amount': item.amount
-                            }
-                            for item in order.orderitem_set.all()
-                        ]
-                    }
-                    for order in queryset
-                ]
-            }
-            return JsonResponse(data)
-        return super().get(request, *args, **kwargs)
+    @staticmethod
+    def serialize(order):
+        return {
+            'id': order.id,
+            'customer_name': order.customer.name,
+            'order_date': order.order_date.strftime('%Y-%m-%d'),
+            'payment_method': order.payment_method,
+            'total_amount': order.total_amount,
+            'order_items': [
+                {
+                    'book_title': item.book.title,
+                    'amount': item.amount
+                }
+                for item in order.orderitem_set.all()
+            ]
+        }
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            if request.GET.get('format') == 'ndjson':
+                # Stream the full (filtered) history one order per line
+                return ndjson_response(request, self.serialize, self.keyset_queryset(self.get_queryset()))
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                # Handle AJAX requests one page at a time, without tying up a thread
+                orders, next_cursor = await self.apaginate_keyset(self.get_queryset())
+                return JsonResponse({
+                    'orders': [self.serialize(order) for order in orders],
+                    'next': next_cursor,
+                })
+            # The page itself is rendered by the sync ListView
+            return await sync_to_async(super().get)(request, *args, **kwargs)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    def get_context_data(self, **kwargs):
+        orders, next_cursor = self.paginate_keyset(self.object_list)
+        return super().get_context_data(object_list=orders, next_cursor=next_cursor, **kwargs)
+
+
+def request_dates(request, *names):
+    """
+    Return the ``YYYY-MM-DD`` query parameters ``names`` as dates, None for
+    any that is missing or not a date. Raises ValueError for a well-formed
+    but impossible date such as 2024-02-30.
+    """
+    return [parse_date(request.GET.get(name, '') or '') for name in names]
+
+
+def revenue_by_name(rows, id_field, names, name_field):
+    """
+    Label rollup totals grouped by ``id_field`` with cached ``names``,
+    merging entries that share a name, biggest revenue first.
+    """
+    totals = {}
+    for row in rows:
+        name = names.get(row[id_field])
+        totals[name] = totals.get(name, 0) + row['total_revenue']
+    return [
+        {name_field: name, 'total_revenue': total}
+        for name, total in sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    ]
+
 
 def sales_statistic_page(request):
+    """
+    Sales analytics read from the DailySales rollup rather than from the
+    order items themselves. The category and publisher breakdowns cover all
+    time unless ``start``/``end`` dates are given.
+    """
+    today = timezone.localtime(timezone.now()).date()
+    month_start = today.replace(day=1)
+
+    try:
+        start, end = request_dates(request, 'start', 'end')
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date')
+
+    period = DailySales.objects.all()
+    if start:
+        period = period.filter(date__gte=start)
+    if end:
+        period = period.filter(date__lte=end)
+
     # Revenue Breakdown by Category
-    revenue_by_category = OrderItem.objects.values('book__category__name') \
-        .annotate(total_revenue=Sum(F('amount') * F('book__price'), output_field=models.FloatField())) \
-        .order_by('-total_revenue')
+    revenue_by_category = revenue_by_name(
+        period.values('category_id').annotate(total_revenue=Sum('revenue')).order_by(),
+        'category_id', catalogue.names(Category), 'category__name',
+    )
 
     # Revenue Breakdown by Publisher
-    revenue_by_publisher = OrderItem.objects.values('book__publisher__name') \
-        .annotate(total_revenue=Sum(F('amount') * F('book__price'), output_field=models.FloatField())) \
-        .order_by('-total_revenue')
+    revenue_by_publisher = revenue_by_name(
+        period.values('publisher_id').annotate(total_revenue=Sum('revenue')).order_by(),
+        'publisher_id', catalogue.names(Publisher), 'publisher__name',
+    )
 
     # Daily Sales Report (Default: today)
-    today = timezone.localtime(timezone.now()).date()
-    daily_sales = OrderItem.objects.filter(order__order_date=today) \
-        .aggregate(daily_revenue=Sum(F('amount') * F('book__price'), output_field=models.FloatField()))
+    daily_sales = DailySales.objects.filter(date=today) \
+        .aggregate(daily_revenue=Sum('revenue'))
 
     # Monthly Sales Report (Default: current month)
-    current_month = today.month
-    current_year = today.year
-    monthly_sales = OrderItem.objects.filter(order__order_date__year=current_year, order__order_date__month=current_month) \
-        .aggregate(monthly_revenue=Sum(F('amount') * F('book__price'), output_field=models.FloatField()))
+    this_month = DailySales.objects.filter(date__gte=month_start, date__lte=today)
+    monthly_sales = this_month.aggregate(monthly_revenue=Sum('revenue'))
 
     # Top 10 Selling Books of Current Month
-    top_books = OrderItem.objects.filter(order__order_date__year=current_year, order__order_date__month=current_month) \
-        .values('book__title') \
-        .annotate(total_sales=Sum(F('amount') * F('book__price'), output_field=models.FloatField())) \
+    top_books = this_month.values('book__title') \
+        .annotate(total_sales=Sum('revenue')) \
         .order_by('-total_sales')[:10]
 
     context = {
@@ -199,28 +430,22 @@ def sales_statistic_page(request):
         'monthly_sales': monthly_sales,
         'top_books': top_books,
         'today': today,
+        'start': start,
+        'end': end,
     }
 
     return render(request, 'bookstore/sales_statistic_page.html', context)
 
 class AddOrderView(CreateView):
     """
-    Handles the creation of a new order and sends a list of available books
-    to the order_form template.
+    Handles the creation of a new order. The order_form template loads books
+    on demand from BookPickerView.
     """
     model = Order
     form_class = OrderForm
     template_name = "bookstore/order_form.html"
     success_url = reverse_lazy('bookstore:sales')
 
-    def get_context_data(self, **kwargs):
-        """
-        Add the list of books to the context, making them available to the template.
-        """
-        context = super().get_context_data(**kwargs)
-        context['books'] = Book.objects.all()  # Fetch all books
-        return context
-
     def form_valid(self, form):
         """
         Override form_valid to create OrderItems for each selected book
@@ -245,110 +470,54 @@ class AddOrderView(CreateView):
                 # Fetch the Book object
                 book = Book.objects.get(id=book_id)
 
-                # Create the OrderItem
+                # Create the OrderItem at the book's current price
                 OrderItem.objects.create(
                     order=order,  # Associate with the Order
                     book=book,  # Set the Book
-                    amount=amount  # Set the amount
+                    amount=amount,  # Set the amount
+                    unit_price=book.price,
+                    line_total=book.price * int(amount),
                 )
 
-        # Recalculate the total amount for the Order
-        total_amount = sum(item.amount * item.book.price for item in
-                           order.orderitem_set.all())
+        # Recalculate the total amount for the Order from the captured line totals
+        total_amount = order.orderitem_set.aggregate(total=Sum('line_total'))['total'] or 0
         order.total_amount = total_amount
         order.save()
 
         return response
 
 
-def lookup_customer(request):
+@login_required
+async def lookup_customer(request):
     phone = request.GET.get('phone')
     if phone:
-        try:
-            customer = Customer.objects.get(phone=phone)
-            return JsonResponse({'customer': {'name': customer.name}})
-        except Customer.DoesNotExist:
+        # Scoped to the logged-in user's customers; repeat lookups come from memory
+        customer = await customers.lookup_customer(await request.auser(), phone)
+        if customer is None:
             return JsonResponse({'error': 'Customer not found'}, status=404)
+        return JsonResponse({'customer': {
+            'id': customer['id'],
+            'name': customer['name'],
+            'loyalty_points': customer['loyalty_points'],
+            'phone': customer['normalized_phone'],
+        }})
     return JsonResponse({'error': 'No phone number provided'}, status=400)
 
+@login_required
 def create_order(request):
     if request.method == 'POST':
         customer_phone = request.POST.get('customer-phone')
         payment_method = request.POST.get('payment-method')
 
-        # Get customer object
-        customer = Customer.objects.filter(phone=customer_phone).first()
+        # Get the logged-in user's customer; read fresh since points are about to change
+        customer = customers.find_customer(request.user, customer_phone)
         if not customer:
             return JsonResponse({'error': 'Customer not found'}, status=404)
 
-        # Initialize total amount for the order
-        total_amount = 0
-        order_items = []
-
-        # Create the Order first to get an order_id
-        order = Order.objects.create(
-            customer=customer,
-            payment_method=payment_method,
-            total_amount=0  # We'll update total_amount later
-        )
-
-        # Iterate through the items submitted in the form
-        for i in range(1, len(request.POST) // 2):  # Assuming two fields per order item (book, amount)
-            book_id = request.POST.get(f'book-{i}')
-            amount = request.POST.get(f'amount-{i}')
-
-            if book_id and amount:
-                try:
-                    book = Book.objects.get(id=book_id)
-                except Book.DoesNotExist:
-                    continue  # Ignore invalid book IDs
-
-                amount = int(amount)
-
-                # Create OrderItem and associate with the order
-                order_item = OrderItem(book=book, amount=amount, order=order)
-                order_item.save()
-
-                # Add the item price to total amount
-                total_amount += book.price * amount
-
-                # Update Book's quantity in stock
-                book.quantity_in_stock -= amount
-                book.save()
-
-                order_items.append(order_item)
-
-        # Apply loyalty point discount (10% off for every 100 points)
-        if customer.loyalty_points >= 100:
-            discount = total_amount * Decimal('0.10')
-            total_amount -= discount
-
-            # Deduct 100 loyalty points if a discount was applied
-            customer.loyalty_points -= 100
-            customer.save()
-
-        # Calculate extra loyalty points based on join date
-        local_time = timezone.localtime(timezone.now())  # Get local time
-        today = local_time.date()  # Extract date from local time
-
-        # Check if the customer has already had their full anniversary for the current year
-        if (today.month > customer.join_date.month) or (today.month == customer.join_date.month and today.day >= customer.join_date.day):
-            years_joined = today.year - customer.join_date.year
-        else:
-            years_joined = today.year - customer.join_date.year - 1  # They haven't had their anniversary yet this year
-
-        extra_points = round((total_amount // 50) * (Decimal('0.10') * years_joined))
-
-        # Add loyalty points based on order total
-        loyalty_points_earned = (total_amount // 50) + extra_points
-
-        # Update the total amount for the Order after all OrderItems are created
-        order.total_amount = total_amount
-        order.save()
-
-        # Update Customer's loyalty points
-        customer.loyalty_points += loyalty_points_earned
-        customer.save()
+        try:
+            place_order(customer, payment_method, parse_order_lines(request.POST))
+        except InsufficientStock as e:
+            return JsonResponse({'error': str(e), 'shortages': e.shortages}, status=400)
 
         # Redirect to the sales page after order is created
         return redirect('bookstore:sales')
@@ -369,13 +538,20 @@ class CustomerView(LoginRequiredMixin, TemplateView):
 
 class CustomerCreateView(LoginRequiredMixin, CreateView):
     model = Customer
-    fields = ['name', 'phone', 'loyalty_points']
+    form_class = CustomerForm
     template_name = 'bookstore/customer_form.html'
 
+    def get_form_kwargs(self):
+        # Associate the new customer with the currently logged-in user before
+        # validation, so phone numbers are checked against their customers
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+
+    @transaction.atomic
     def form_valid(self, form):
-        # Associate the new customer with the currently logged-in user
-        form.instance.user = self.request.user
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        # Start the customer's loyalty ledger with the points they were given
+        loyalty.record_adjustment(self.object, self.object.loyalty_points, LoyaltyEntry.OPENING)
+        return response
 
     def get_success_url(self):
         # Redirect to the customer management page after successful creation
@@ -383,9 +559,23 @@ class CustomerCreateView(LoginRequiredMixin, CreateView):
 
 class CustomerUpdateView(LoginRequiredMixin, UpdateView):
     model = Customer
-    fields = ['name', 'phone', 'loyalty_points']
+    form_class = CustomerForm
     template_name = 'bookstore/customer_form.html'
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+
+    @transaction.atomic
+    def form_valid(self, form):
+        self.object = form.save(commit=False)
+        # Only the clerk's change to the balance is applied, and kept in the loyalty ledger
+        self.object.loyalty_points = form.initial['loyalty_points']
+        if not loyalty.adjust_points(self.object, form.points_change()):
+            form.add_error('loyalty_points', 'The customer does not have that many points.')
+            return self.form_invalid(form)
+        self.object.save(update_fields=['name', 'phone'])
+        return redirect(self.get_success_url())
+
     def get_object(self, queryset=None):
         # Ensure that the customer being edited belongs to the current user
         customer = get_object_or_404(Customer, pk=self.kwargs['pk'], user=self.request.user)
@@ -408,16 +598,23 @@ class CustomerDeleteView(LoginRequiredMixin, DeleteView):
         # Redirect to the customer management page after successful deletion
         return reverse_lazy('bookstore:customer')
 
-class SupplierView(ListView):
+class SupplierView(AsyncLoginRequiredMixin, KeysetPaginationMixin, ListView):
     """
-    Displays a list of purchases (supplier orders) and supports filtering by date.
+    Displays a list of purchases (supplier orders), newest first, and supports
+    filtering by date. Paged and streamed the same way as SalesView.
     """
     model = Purchase
+    keyset_field = 'purchase_date'
     template_name = "bookstore/supplier.html"
     context_object_name = 'purchases'
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # Get all purchases with their items in a fixed number of queries
+        queryset = super().get_queryset() \
+            .prefetch_related(Prefetch(
+                'purchaseitem_set',
+                queryset=PurchaseItem.objects.select_related('book').only('purchase_id', 'amount', 'unit_price', 'book__title'),
+            ))
         date_filter = self.request.GET.get('date')
         if date_filter:
             date_obj = parse_date(date_filter)
@@ -426,50 +623,53 @@ class SupplierView(ListView):
         return queryset
 
 
-    def get(self, request, *args, **kwargs):
-        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            # Handle AJAX requests
-            date_filter = request.GET.get('date')
-            queryset = self.get_queryset()
-            data = {
-                'purchases': [
-                    {
-                        'id': purchase.id,
-                        'purchase_date': purchase.purchase_date.strftime('%Y-%m-%d'),
-                        'total_cost': purchase.total_cost,
-                        'purchase_items': [
-                            {
-                                'book_title': item.book.title,
-                                'amount': item.amount,
-                                'unit_price': item.unit_price,
-                            }
-                            for item in purchase.purchaseitem_set.all()  # Assuming 'purchaseitem_set' is the reverse relation
-                        ]
-                    }
-                    for purchase in queryset
-                ]
-            }
-            return JsonResponse(data)
-        return super().get(request, *args, **kwargs)
+    @staticmethod
+    def serialize(purchase):
+        return {
+            'id': purchase.id,
+            'purchase_date': purchase.purchase_date.strftime('%Y-%m-%d'),
+            'total_cost': purchase.total_cost,
+            'purchase_items': [
+                {
+                    'book_title': item.book.title,
+                    'amount': item.amount,
+                    'unit_price': item.unit_price,
+                }
+                for item in purchase.purchaseitem_set.all()
+            ]
+        }
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            if request.GET.get('format') == 'ndjson':
+                # Stream the full (filtered) history one purchase per line
+                return ndjson_response(request, self.serialize, self.keyset_queryset(self.get_queryset()))
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                # Handle AJAX requests one page at a time, without tying up a thread
+                purchases, next_cursor = await self.apaginate_keyset(self.get_queryset())
+                return JsonResponse({
+                    'purchases': [self.serialize(purchase) for purchase in purchases],
+                    'next': next_cursor,
+                })
+            # The page itself is rendered by the sync ListView
+            return await sync_to_async(super().get)(request, *args, **kwargs)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+    def get_context_data(self, **kwargs):
+        purchases, next_cursor = self.paginate_keyset(self.object_list)
+        return super().get_context_data(object_list=purchases, next_cursor=next_cursor, **kwargs)
 
 class AddPurchaseView(CreateView):
     """
-    Handles the creation of a new purchase and sends a list of available books
-    to the purchase_form template.
+    Handles the creation of a new purchase. The purchase_form template loads
+    books on demand from BookPickerView.
     """
     model = Purchase
     form_class = PurchaseForm
     template_name = "bookstore/purchase_form.html"
     success_url = reverse_lazy('bookstore:supplier')
 
-    def get_context_data(self, **kwargs):
-        """
-        Add the list of books to the context, making them available to the template.
-        """
-        context = super().get_context_data(**kwargs)
-        context['books'] = Book.objects.all()  # Fetch all books
-        return context
-
     def form_valid(self, form):
         # First, save the Purchase (this creates the Purchase object)
         response = super().form_valid(form)
@@ -506,49 +706,11 @@ class AddPurchaseView(CreateView):
 
 def create_purchase(request):
     if request.method == 'POST':
-        # Initialize total cost for the purchase
-        total_cost = 0
-
-        # Create the Purchase first
-        purchase = Purchase.objects.create(
-            purchase_date=timezone.now(),
-            total_cost=0  # Placeholder, updated later
-        )
-
-        # Iterate over submitted data to find all items
-        for key in request.POST.keys():
-            if key.startswith('book-'):
-                # Extract index from the key (e.g., "book-1" -> 1)
-                index = key.split('-')[1]
-                book_id = request.POST.get(f'book-{index}')
-                amount = request.POST.get(f'amount-{index}')
-
-                if book_id and amount:
-                    try:
-                        book = Book.objects.get(id=book_id)
-                        amount = int(amount)
-
-                        # Create PurchaseItem and set unit_price
-                        purchase_item = PurchaseItem(
-                            book=book,
-                            amount=amount,
-                            purchase=purchase,
-                            unit_price=book.price  # Set the unit price
-                        )
-                        purchase_item.save()
-
-                        # Update total cost
-                        total_cost += book.price * amount
-
-                        # Update book stock
-                        book.quantity_in_stock += amount
-                        book.save()
-                    except (Book.DoesNotExist, ValueError):
-                        continue  # Skip invalid items
-
-        # Update total cost in Purchase
-        purchase.total_cost = total_cost
-        purchase.save()
+        # Validate the whole delivery note, then receive it in one transaction
+        try:
+            receive_purchase(parse_purchase_lines(request.POST))
+        except InvalidPurchase as e:
+            return JsonResponse({'error': str(e), 'lines': e.errors}, status=400)
 
         # Redirect or respond
         return redirect('bookstore:supplier')  # Update to your desired redirect
@@ -558,33 +720,28 @@ def create_purchase(request):
 
 def supplier_statistic_page(request):
     """
-    Displays static analytics for supplier purchases.
+    Displays static analytics for supplier purchases, read from the
+    MonthlyPurchases rollup. The publisher and book breakdowns cover all
+    time unless ``start``/``end`` dates are given.
     """
+    today = timezone.localtime(timezone.now()).date()
+    try:
+        start, end = request_dates(request, 'start', 'end')
+    except ValueError:
+        return HttpResponseBadRequest('Invalid date')
 
     # Total Purchases by Publisher
-    purchases_by_publisher = PurchaseItem.objects.values(
-        'book__publisher__name') \
-        .annotate(total_spent=Sum(F('amount') * F('unit_price'))) \
-        .order_by('-total_spent')
+    purchases_by_publisher = purchase_spend('publisher', start, end)
 
     # Total Purchases by Book Title
-    purchases_by_book = PurchaseItem.objects.values('book__title') \
-        .annotate(total_purchased=Sum(F('amount') * F('unit_price'))) \
-        .order_by('-total_purchased')
-
-    today = timezone.localtime(timezone.now()).date()
+    purchases_by_book = purchase_spend('book', start, end)
 
     # Monthly Purchase Report (Default: current month)
-    current_month = today.month
-    current_year = today.year
-    monthly_purchases = Purchase.objects.filter(purchase_date__year=current_year, purchase_date__month=current_month) \
-        .aggregate(monthly_spent=Sum('total_cost'))
+    purchases_this_month = purchase_spend('book', today.replace(day=1), today)
+    monthly_purchases = {'monthly_spent': sum(row['total_spent'] for row in purchases_this_month) or None}
 
     # Top 10 Purchased Books of Current Month
-    top_purchased_books = PurchaseItem.objects.filter(purchase__purchase_date__year=current_year, purchase__purchase_date__month=current_month) \
-        .values('book__title') \
-        .annotate(total_spent=Sum(F('amount') * F('unit_price'))) \
-        .order_by('-total_spent')[:10]
+    top_purchased_books = purchases_this_month[:10]
 
     context = {
         'purchases_by_publisher': purchases_by_publisher,
@@ -592,6 +749,47 @@ def supplier_statistic_page(request):
         'monthly_purchases': monthly_purchases,
         'top_purchased_books': top_purchased_books,
         'today': today,
+        'start': start,
+        'end': end,
     }
 
-    return render(request, 'bookstore/supplier_statistic_page.html', context)
\ No newline at end of file
+    return render(request, 'bookstore/supplier_statistic_page.html', context)
+
+
+@login_required
+def export_history(request, kind):
+    """
+    Streams every sales or purchase line between the optional ``start`` and
+    ``end`` dates for accounting, as CSV or as columnar JSON Lines batches
+    (``?format=columnar``).
+    """
+    if kind not in exports.EXPORTS:
+        return JsonResponse({'error': f'Unknown export: {kind}'}, status=404)
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return JsonResponse({'error': f'Unknown format: {fmt}'}, status=400)
+    try:
+        start, end = request_dates(request, 'start', 'end')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date'}, status=400)
+
+    if fmt == 'columnar':
+        content_type, filename = 'application/x-ndjson', f'{kind}.jsonl'
+    else:
+        content_type, filename = 'text/csv', f'{kind}.csv'
+    # Each part is already a chunk of rows
+    response = streaming_response(request, exports.render_export(kind, fmt, start, end), batch_size=1,
+                                  content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def metrics_view(request):
+    """
+    Request and SQL metrics of this process in the Prometheus text format.
+    Internal: only staff users and ``METRICS_ALLOWED_IPS`` may read it.
+    """
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in allowed_ips):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,34 @@
+"""
+Gunicorn settings for serving the bookstore in production:
+
+    gunicorn -c config/gunicorn.conf.py
+
+The master forks ``WEB_CONCURRENCY`` worker processes. By default each one
+runs the ASGI application on a uvicorn event loop, so the async JSON views
+do not tie up a thread while they wait on the database. Set
+``GUNICORN_WORKER_CLASS=gthread`` to serve the WSGI application from
+``GUNICORN_THREADS`` threads per worker instead.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+wsgi_app = 'config.wsgi:application' if worker_class in ('sync', 'gthread') else 'config.asgi:application'
+
+# Recycle workers now and then so a slow leak cannot grow without bound;
+# the jitter keeps them from restarting all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Not preloaded: every worker opens its own database pool after the fork
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
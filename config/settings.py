@@ -27,12 +27,12 @@ config = Config(os.path.join(BASE_DIR, '.env'))
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-#ffs24g5lbb$j5)gd_z2#1g0v*7(t0fx#w5szlnq37#(@b_66-'
+SECRET_KEY = config('SECRET_KEY', default='django-insecure-#ffs24g5lbb$j5)gd_z2#1g0v*7(t0fx#w5szlnq37#(@b_66-')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = config('DEBUG', default=True, cast=bool)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='', cast=Csv())
 
 
 # Application definition
@@ -47,18 +47,26 @@ INSTALLED_APPS = [
     'bookstore',
 ]
 
+# Serve compressed, fingerprinted static files from the app server itself
+# (needs whitenoise); off while developing, where runserver serves them.
+SERVE_STATIC = config('SERVE_STATIC', default=not DEBUG, cast=bool)
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    *(['whitenoise.middleware.WhiteNoiseMiddleware'] if SERVE_STATIC else []),
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bookstore.middleware.InstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
+# With no 'loaders' option Django wraps the loaders below in the cached
+# loader, so each template is compiled once per worker process.
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -76,6 +84,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+# Served by gunicorn with uvicorn workers (see config/gunicorn.conf.py); the
+# JSON endpoints are async views
+ASGI_APPLICATION = 'config.asgi.application'
 
 
 # Database
@@ -89,9 +100,98 @@ DATABASES = {
         'PASSWORD': config("DB_PASSWORD"),
         'HOST': config("DB_HOST"),
         'PORT': config("DB_PORT"),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Each worker process keeps a psycopg pool of DB_POOL_MIN_SIZE to
+# DB_POOL_MAX_SIZE connections (needs psycopg[pool]), so the total is at
+# most workers x DB_POOL_MAX_SIZE. Async views run their queries on a
+# thread per request, which cannot reuse persistent connections, so the
+# pool is the default; without it connections live for CONN_MAX_AGE.
+if config('DB_POOL', default=True, cast=bool):
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = config('CONN_MAX_AGE', default=60, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Local memory by default, for tests and runserver. Several worker
+# processes need a shared backend so that catalogue and search
+# invalidations reach all of them; docker-compose uses the database cache
+# (the table is made by `manage.py createcachetable`).
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='bookstore'),
+    }
+}
+
+CATALOGUE_CACHE_TIMEOUT = config('CATALOGUE_CACHE_TIMEOUT', default=300, cast=int)
+
+
+# Customers
+# National phone numbers are stored as typed and matched in E.164 form
+# with this country code; checkout lookups are cached in memory per worker.
+
+PHONE_COUNTRY_CODE = config('PHONE_COUNTRY_CODE', default='66')
+CUSTOMER_LOOKUP_CACHE_TIMEOUT = config('CUSTOMER_LOOKUP_CACHE_TIMEOUT', default=30, cast=int)
+
+
+# Background tasks
+# Checkout queues loyalty accrual, the sales rollup and low-stock checks in
+# the Task table; `manage.py run_workers` runs them. Failed tasks are retried
+# with exponential backoff from TASK_RETRY_DELAY seconds.
+
+TASK_MAX_ATTEMPTS = config('TASK_MAX_ATTEMPTS', default=5, cast=int)
+TASK_RETRY_DELAY = config('TASK_RETRY_DELAY', default=5, cast=int)
+TASK_RETENTION_DAYS = config('TASK_RETENTION_DAYS', default=7, cast=int)
+# Books sold down to their reorder point, or to this many copies when they have
+# no recent sales, are logged to the bookstore.stock logger
+LOW_STOCK_THRESHOLD = config('LOW_STOCK_THRESHOLD', default=5, cast=int)
+
+
+# Reorder points
+# `manage.py update_reorder_points` sets each book's reorder point to cover
+# the supplier lead time plus safety stock at its average daily sales over
+# the last REORDER_WINDOW_DAYS; --suggest drafts purchases topping stock up
+# for REORDER_CYCLE_DAYS more.
+
+REORDER_WINDOW_DAYS = config('REORDER_WINDOW_DAYS', default=28, cast=int)
+REORDER_LEAD_TIME_DAYS = config('REORDER_LEAD_TIME_DAYS', default=14, cast=int)
+REORDER_SAFETY_DAYS = config('REORDER_SAFETY_DAYS', default=7, cast=int)
+REORDER_CYCLE_DAYS = config('REORDER_CYCLE_DAYS', default=14, cast=int)
+
+
+# Instrumentation
+# Per-view request/SQL metrics are served at /metrics/ to staff users and
+# the listed addresses; single queries slower than the threshold are logged
+# to the bookstore.sql logger.
+
+INSTRUMENTATION_ENABLED = config('INSTRUMENTATION_ENABLED', default=True, cast=bool)
+SLOW_QUERY_THRESHOLD_MS = config('SLOW_QUERY_THRESHOLD_MS', default=200, cast=int)
+DUPLICATE_QUERY_THRESHOLD = config('DUPLICATE_QUERY_THRESHOLD', default=10, cast=int)
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'bookstore': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -128,6 +228,13 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+if SERVE_STATIC:
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+    }
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field